@@ -0,0 +1,345 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from logging_setup import setup_logging
+from metrics import MetricsRecorder, ReceiptMetrics, format_summary
+from duplicates import DuplicateReceiptError
+from pdf_stream import pdf_page_count
+from receipt_processing import (
+    DEDUP, OCR_QUALITY, RECORD_STORE, SPLIT_MULTI_PAGE_PDFS, extract_receipt_text_to_json, extract_receipts_from_pdf,
+    record_receipt
+)
+from route_sheet import OUTPUT_DIR, BatchWorkbookWriter, update_route_sheet_from_json
+
+# File types accepted as receipts
+RECEIPT_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tiff", ".tif", ".bmp", ".pdf")
+
+
+def default_worker_count():
+    """
+    Default number of worker processes: one per core, leaving one for the GUI.
+    """
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def is_receipt_file(path):
+    """
+    Return True if the path has a supported receipt file extension.
+    """
+    return path.lower().endswith(RECEIPT_EXTENSIONS)
+
+
+def result_name(result):
+    """
+    Return the file name of a result, with the pages for a receipt split
+    out of a multi-receipt PDF.
+    """
+    name = os.path.basename(result["file_path"])
+    pages = result.get("pages")
+    if pages:
+        name += f" {pages_suffix(pages)}"
+    return name
+
+
+def pages_suffix(pages):
+    """
+    Return the route sheet file name suffix of a receipt split out of a
+    multi-receipt PDF, e.g. "p3-4". Route sheets are named by unit and date,
+    so two receipts for one unit in the same PDF would otherwise share a file.
+    """
+    return f"p{pages[0]}" if len(pages) == 1 else f"p{pages[0]}-{pages[-1]}"
+
+
+def needs_review(result):
+    """
+    Return True if a receipt was processed but its data failed the
+    consistency checks, so it should be checked by hand.
+    """
+    return result["status"] == "ok" and bool((result.get("data") or {}).get("review"))
+
+
+def result_status(result):
+    """
+    Return the status of a result for display: ``"review"`` for a receipt
+    flagged by ``needs_review``, otherwise its ``status``.
+    """
+    return "review" if needs_review(result) else result["status"]
+
+
+def process_receipt(file_path, use_cache=True, write_route_sheet=True, output_dir=OUTPUT_DIR, dedup=DEDUP,
+                    quality=OCR_QUALITY, profile=None):
+    """
+    Run OCR and route sheet generation for a single receipt.
+
+    Runs inside a worker process. Errors are captured in the returned result
+    instead of being raised so that one bad receipt never aborts a batch.
+    With ``write_route_sheet=False`` only the receipt data is extracted.
+    The timings of the stages that ran are returned in ``stages``.
+
+    With ``dedup`` a receipt already processed from another file is skipped
+    with status ``"duplicate"`` and the earlier file in ``duplicate_of``.
+    ``quality`` is the OCR quality ("tiered" or "full", see
+    ``receipt_processing.ocr_receipt``) and ``profile`` the name of the OCR
+    profile (by default the one for the receipt's source).
+    """
+    metrics = ReceiptMetrics()
+    result = {
+        "file_path": file_path,
+        "status": "ok",
+        "data": None,
+        "output_path": None,
+        "error": None,
+        "duplicate_of": None,
+        "stages": metrics.stages,
+    }
+    start = time.perf_counter()
+    try:
+        receipt_data = extract_receipt_text_to_json(
+            file_path, use_cache=use_cache, metrics=metrics, dedup=dedup, quality=quality, profile=profile,
+            debug_output=False
+        )
+        result["data"] = receipt_data
+        if write_route_sheet:
+            result["output_path"] = update_route_sheet_from_json(
+                receipt_data, output_dir=output_dir, metrics=metrics
+            )
+    except DuplicateReceiptError as e:
+        logging.info(f"Skipping {file_path}: {e}")
+        result["status"] = "duplicate"
+        result["error"] = str(e)
+        result["duplicate_of"] = e.duplicate_of
+    except Exception as e:
+        logging.error(f"Error processing {file_path}: {e}")
+        result["status"] = "error"
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def process_multi_receipt_pdf(file_path, use_cache=True, write_route_sheet=True, output_dir=OUTPUT_DIR,
+                              dedup=DEDUP, profile=None):
+    """
+    Process every receipt of a multi-receipt scanner PDF.
+
+    Returns one result per detected receipt, in the format of
+    ``process_receipt`` plus the receipt's ``pages``. Each receipt is saved
+    and gets its route sheet as soon as its last page has been read, while
+    the following pages are still being rendered. If the PDF itself cannot
+    be read, the receipts found so far are followed by an error result.
+    """
+    results = []
+    start = time.perf_counter()
+    try:
+        for receipt in extract_receipts_from_pdf(file_path, use_cache=use_cache, profile=profile):
+            metrics = receipt["metrics"]
+            result = {
+                "file_path": file_path,
+                "pages": receipt["pages"],
+                "status": "ok",
+                "data": receipt["data"],
+                "output_path": None,
+                "error": None,
+                "duplicate_of": None,
+                "stages": metrics.stages,
+            }
+            try:
+                if RECORD_STORE:
+                    record_receipt(receipt["record_key"], receipt["data"], receipt["text"], file_path, metrics,
+                                   dedup=dedup)
+                if write_route_sheet:
+                    result["output_path"] = update_route_sheet_from_json(
+                        receipt["data"], output_dir=output_dir, metrics=metrics,
+                        name_suffix=pages_suffix(receipt["pages"])
+                    )
+            except DuplicateReceiptError as e:
+                logging.info(f"Skipping pages {receipt['pages']} of {file_path}: {e}")
+                result["status"] = "duplicate"
+                result["error"] = str(e)
+                result["duplicate_of"] = e.duplicate_of
+            except Exception as e:
+                logging.error(f"Error processing pages {receipt['pages']} of {file_path}: {e}")
+                result["status"] = "error"
+                result["error"] = str(e)
+            now = time.perf_counter()
+            result["seconds"] = now - start
+            start = now
+            results.append(result)
+    except Exception as e:
+        logging.error(f"Error reading {file_path}: {e}")
+        results.append({
+            "file_path": file_path,
+            "pages": None,
+            "status": "error",
+            "data": None,
+            "output_path": None,
+            "error": str(e),
+            "duplicate_of": None,
+            "stages": [],
+            "seconds": time.perf_counter() - start,
+        })
+    return results
+
+
+def process_file(file_path, use_cache=True, write_route_sheet=True, output_dir=OUTPUT_DIR, dedup=DEDUP,
+                 quality=OCR_QUALITY, profile=None):
+    """
+    Process one receipt file and return a list of results: one per receipt
+    for a PDF with more than one page (see ``process_multi_receipt_pdf``),
+    otherwise the single result of ``process_receipt``.
+    """
+    if SPLIT_MULTI_PAGE_PDFS and file_path.lower().endswith(".pdf"):
+        try:
+            page_count = pdf_page_count(file_path)
+        except Exception as e:
+            # process_receipt reports the error if the PDF cannot be read at all
+            logging.warning(f"Unable to count the pages of {file_path}: {e}")
+            page_count = 1
+        if page_count > 1:
+            return process_multi_receipt_pdf(file_path, use_cache, write_route_sheet, output_dir, dedup, profile)
+    return [process_receipt(file_path, use_cache, write_route_sheet, output_dir, dedup, quality, profile)]
+
+
+class BatchProcessor:
+    """
+    Process a batch of receipts on a pool of worker processes.
+
+    Per-file results are streamed into ``self.results`` as they complete so a
+    caller (e.g. the GUI, via ``after()``) can poll it without blocking. Each
+    queue item is a dict with a ``type`` of ``"result"`` or ``"done"``. A
+    multi-receipt PDF gives one ``"result"`` per receipt; ``completed`` in
+    each result message is the number of files finished so far.
+
+    With ``workbook_path`` set, the workers only extract receipt data and every
+    route sheet is added as a tab of one batch workbook, which is saved when
+    the batch finishes.
+
+    Stage timings of every receipt are recorded with ``metrics`` (a
+    ``MetricsRecorder``); the ``"done"`` message carries the run summary.
+    With ``dedup`` receipts already processed from another file are reported
+    as ``"duplicate"`` instead of being processed again. ``quality`` is the
+    OCR quality and ``profile`` the OCR profile of every receipt (by default
+    the profile depends on the receipt's source).
+    """
+
+    def __init__(self, max_workers=None, use_cache=True, workbook_path=None, output_dir=OUTPUT_DIR,
+                 metrics=None, dedup=DEDUP, quality=OCR_QUALITY, profile=None):
+        self.max_workers = max_workers or default_worker_count()
+        self.use_cache = use_cache
+        self.workbook_path = workbook_path
+        self.output_dir = output_dir
+        self.dedup = dedup
+        self.quality = quality
+        self.profile = profile
+        self.metrics = metrics if metrics is not None else MetricsRecorder()
+        self._workbook = None
+        self.results = queue.Queue()
+        self.total = 0
+        self.completed = 0
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+    def start(self, file_paths):
+        """
+        Submit every file to the worker pool and return immediately.
+        """
+        file_paths = list(file_paths)
+        self.total = len(file_paths)
+        self.completed = 0
+        self._pending = self.total
+        self._cancelled = False
+
+        if not file_paths:
+            self.results.put({"type": "done", "cancelled": False, "error": None, "summary": None})
+            return
+
+        if self.workbook_path:
+            self._workbook = BatchWorkbookWriter(self.workbook_path)
+
+        workers = min(self.max_workers, self.total)
+        logging.info(f"Starting batch of {self.total} receipt(s) on {workers} worker(s).")
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=setup_logging)
+        for file_path in file_paths:
+            future = self._executor.submit(
+                process_file, file_path, self.use_cache, self._workbook is None, self.output_dir, self.dedup,
+                self.quality, self.profile
+            )
+            future.add_done_callback(
+                lambda f, path=file_path: self._on_future_done(path, f)
+            )
+
+    def cancel(self):
+        """
+        Cancel every receipt that has not started yet.
+
+        Receipts already running in a worker are allowed to finish; their
+        results are still reported.
+        """
+        if self._executor is None or self._cancelled:
+            return
+        logging.info("Cancelling batch.")
+        self._cancelled = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_future_done(self, file_path, future):
+        if future.cancelled():
+            results = [{
+                "file_path": file_path,
+                "status": "cancelled",
+                "data": None,
+                "output_path": None,
+                "error": None,
+                "stages": [],
+            }]
+        else:
+            try:
+                results = future.result()
+            except Exception as e:
+                # The worker process itself died (e.g. out of memory)
+                results = [{
+                    "file_path": file_path,
+                    "status": "error",
+                    "data": None,
+                    "output_path": None,
+                    "error": str(e),
+                    "stages": [],
+                }]
+
+        with self._lock:
+            self.completed += 1
+            for result in results:
+                if self._workbook is not None and result["status"] == "ok":
+                    try:
+                        result["output_path"] = update_route_sheet_from_json(
+                            result["data"], workbook=self._workbook, metrics=ReceiptMetrics(result["stages"])
+                        )
+                    except Exception as e:
+                        logging.error(f"Error adding {file_path} to batch workbook: {e}")
+                        result["status"] = "error"
+                        result["error"] = str(e)
+                if result["status"] != "cancelled":
+                    self.metrics.record(result)
+                self.results.put({"type": "result", "result": result, "completed": self.completed})
+            self._pending -= 1
+            finished = self._pending == 0
+
+        if finished:
+            self._executor.shutdown(wait=False)
+            done = {"type": "done", "cancelled": self._cancelled, "error": None, "summary": None}
+            if self._workbook is not None:
+                try:
+                    self._workbook.close()
+                except Exception as e:
+                    logging.error(f"Error saving batch workbook: {e}")
+                    done["error"] = str(e)
+            try:
+                done["summary"] = self.metrics.write_summary()
+                logging.info(f"Batch timings: {format_summary(done['summary'])}")
+            except Exception as e:
+                logging.error(f"Error writing metrics summary: {e}")
+            self.results.put(done)
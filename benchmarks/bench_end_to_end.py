@@ -0,0 +1,310 @@
+"""
+End-to-end throughput and accuracy benchmark on a synthetic receipt corpus.
+
+Every receipt in the corpus is run through extract_receipt_text_to_json and
+update_route_sheet_from_json (OCR cache and duplicate checks disabled). The report covers:
+receipts per second, p50/p95 latency per pipeline stage, peak RSS, and
+field-level accuracy against the corpus ground truth. Route sheet accuracy
+compares the written cells with the cells the ground truth should produce.
+
+By default the receipts run one after another in this process, which gives
+per-core numbers. With --workers N they run on the batch worker pool
+instead, which gives whole-machine throughput. --quality full OCRs every
+receipt at full quality, for comparison with the default tiered OCR; the
+report counts the receipts the fast pass settled and those flagged for
+review. --ocr-profile runs every receipt with one OCR profile; see
+bench_ocr_profiles.py for a per-profile comparison.
+
+Every run is saved to benchmarks/results/ and appended as a single line to
+benchmarks/results/history.jsonl, and the report shows the change from the
+previous run so regressions between commits stand out.
+
+Run from the repository root:
+
+    python benchmarks/synthetic_receipts.py benchmarks/corpus --count 50 --seed 1
+    python benchmarks/bench_end_to_end.py benchmarks/corpus
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+HISTORY_FILE = os.path.join(RESULTS_DIR, "history.jsonl")
+
+sys.path.insert(0, REPO_DIR)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb(children=False):
+    """
+    Peak resident set size of this process (or of its finished child
+    processes) in MB, or None where the platform does not report it.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss / divisor
+
+
+def git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def run_in_process(paths, output_dir, quality, profile):
+    """
+    Process receipts one after another in this process. Returns a list of
+    results in the format of ``batch_processing.process_receipt``.
+    """
+    from batch_processing import process_receipt
+
+    return [
+        process_receipt(path, use_cache=False, output_dir=output_dir, dedup=False, quality=quality, profile=profile)
+        for path in paths
+    ]
+
+
+def run_on_pool(paths, output_dir, workers, metrics_dir, quality, profile):
+    """
+    Process receipts on the batch worker pool.
+    """
+    from batch_processing import BatchProcessor
+    from metrics import MetricsRecorder
+
+    recorder = MetricsRecorder(
+        log_path=os.path.join(metrics_dir, "metrics.jsonl"), summary_path=None
+    )
+    processor = BatchProcessor(
+        max_workers=workers, use_cache=False, output_dir=output_dir, metrics=recorder, dedup=False,
+        quality=quality, profile=profile
+    )
+    processor.start(paths)
+    results = []
+    while True:
+        message = processor.results.get()
+        if message["type"] == "done":
+            return results
+        results.append(message["result"])
+
+
+def route_sheet_accuracy(result, truth):
+    """
+    Return (correct, total) over the route sheet cells that depend on the
+    ground truth.
+    """
+    from openpyxl import load_workbook
+    from route_sheet import route_sheet_values
+
+    if result["output_path"] is None:
+        return 0, None
+    expected = route_sheet_values({**result["data"], **truth})
+    sheet = load_workbook(result["output_path"]).active
+    # Dates come from the run date, not from the receipt
+    cells = [cell for cell in expected if cell not in ("H4", "J4")]
+    correct = sum(str(sheet[cell].value) == str(expected[cell]) for cell in cells)
+    return correct, len(cells)
+
+
+def compare_with_previous(run):
+    """
+    Print the change of the headline numbers since the last saved run.
+    """
+    if not os.path.exists(HISTORY_FILE):
+        return
+    with open(HISTORY_FILE) as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        return
+    previous = json.loads(lines[-1])
+    print(f"\nChange since {previous['revision']} ({previous['timestamp']}):")
+    for key, label in (
+        ("receipts_per_second", "receipts/s"),
+        ("field_accuracy", "field accuracy"),
+        ("receipt_accuracy", "receipt accuracy"),
+        ("peak_rss_mb", "peak RSS MB"),
+    ):
+        old, new = previous.get(key), run.get(key)
+        if old is None or new is None:
+            continue
+        change = f" ({(new - old) / old * 100:+.1f}%)" if old else ""
+        print(f"  {label:<18} {old:10.3f} -> {new:10.3f}{change}")
+
+
+def save_run(run, report):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{stamp}_{run['revision']}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+    with open(HISTORY_FILE, "a") as f:
+        f.write(json.dumps(run) + "\n")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="corpus directory written by synthetic_receipts.py")
+    parser.add_argument("--generate", type=int, metavar="N",
+                        help="generate an N-receipt corpus into the directory first")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --generate")
+    parser.add_argument("--limit", type=int, help="only use the first N receipts")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="run on a pool of N worker processes (default: in this process)")
+    parser.add_argument("--quality", choices=("tiered", "full"), default="tiered",
+                        help="OCR quality: tiered (fast pass first) or full (default tiered)")
+    parser.add_argument("--ocr-profile", help="OCR profile for every receipt (default by source)")
+    parser.add_argument("--label", default="", help="free-form note stored with the results")
+    parser.add_argument("--no-save", action="store_true", help="do not save the results")
+    args = parser.parse_args()
+
+    corpus = os.path.abspath(args.corpus)
+
+    # The pipeline writes its debug files, logs and record store under ./data;
+    # run in a scratch directory so the repository's data/ and its receipt
+    # history are left alone. Duplicate checks are off: synthetic receipts
+    # share a template and must all be processed, and a real record store
+    # would skew the timings.
+    scratch = tempfile.TemporaryDirectory()
+    os.chdir(scratch.name)
+
+    from batch_processing import needs_review
+    from metrics import format_seconds, summarize
+    from receipt_processing import get_ocr_engine
+    from synthetic_receipts import generate_corpus, load_ground_truth, score_fields
+
+    if args.generate:
+        generate_corpus(corpus, args.generate, args.seed)
+    ground_truth = load_ground_truth(corpus)
+    file_names = sorted(ground_truth)[:args.limit]
+    paths = [os.path.join(corpus, name) for name in file_names]
+
+    output_dir = os.path.join(scratch.name, "route_sheets")
+    os.makedirs(output_dir)
+    start = time.perf_counter()
+    if args.workers:
+        results = run_on_pool(paths, output_dir, args.workers, scratch.name, args.quality, args.ocr_profile)
+    else:
+        results = run_in_process(paths, output_dir, args.quality, args.ocr_profile)
+    elapsed = time.perf_counter() - start
+
+    # Accuracy
+    field_totals = {}
+    exact = 0
+    # Receipts settled by the fast OCR pass, flagged for review, and flagged
+    # or not while every field was in fact correct
+    fast_pass = flagged = flagged_correct = unflagged_wrong = 0
+    cells_correct = cells_total = 0
+    receipts = []
+    for result in results:
+        truth = ground_truth[os.path.basename(result["file_path"])]
+        scores = score_fields(result["data"] or {}, truth)
+        for field, correct in scores.items():
+            field_totals.setdefault(field, [0, 0])
+            field_totals[field][0] += correct
+            field_totals[field][1] += 1
+        exact += all(scores.values())
+        if result["status"] == "ok":
+            fast_pass += result["data"].get("ocr_pass") == "fast"
+            flagged += needs_review(result)
+            flagged_correct += needs_review(result) and all(scores.values())
+            unflagged_wrong += not needs_review(result) and not all(scores.values())
+        correct, total = route_sheet_accuracy(result, truth) if result["status"] == "ok" else (0, None)
+        cells_correct += correct
+        cells_total += total or 0
+        receipts.append({
+            "file": os.path.basename(result["file_path"]),
+            "status": result["status"],
+            "error": result["error"],
+            "wrong_fields": [field for field, correct in scores.items() if not correct],
+            "ocr_pass": (result["data"] or {}).get("ocr_pass"),
+            "review": (result["data"] or {}).get("review"),
+            "stages": result.get("stages", []),
+        })
+
+    field_accuracy = {field: correct / total for field, (correct, total) in field_totals.items()}
+    records = [
+        {"total_seconds": sum(entry["seconds"] for entry in receipt["stages"]), "stages": receipt["stages"]}
+        for receipt in receipts
+    ]
+    summary = summarize(records)
+    count = len(results)
+    failed = sum(result["status"] != "ok" for result in results)
+    rss = peak_rss_mb(children=bool(args.workers))
+
+    print(f"{count} receipts in {elapsed:.1f} s: {count / elapsed:.2f} receipts/s "
+          f"({'in-process' if not args.workers else f'{args.workers} workers'}, "
+          f"OCR backend {get_ocr_engine().name}, {args.quality} OCR), {failed} failed")
+    if args.quality == "tiered":
+        print(f"{fast_pass} settled by the fast OCR pass, {count - failed - fast_pass} re-OCR'd at full quality")
+    print(f"{flagged} flagged for review ({flagged_correct} of them correct), "
+          f"{unflagged_wrong} wrong but not flagged")
+    if rss is not None:
+        print(f"peak RSS {rss:.0f} MB{' (largest worker)' if args.workers else ''}")
+    print("\nstage                 p50         p95        mean")
+    for name, stats in summary["stages"].items():
+        print(f"  {name:<16} {format_seconds(stats['p50']):>10}  {format_seconds(stats['p95']):>10}  "
+              f"{format_seconds(stats['mean']):>10}")
+    print("\nfield accuracy")
+    for field, accuracy in field_accuracy.items():
+        print(f"  {field:<38} {accuracy * 100:6.1f}%")
+    all_fields_correct = sum(correct for correct, _ in field_totals.values())
+    all_fields_total = sum(total for _, total in field_totals.values())
+    overall = all_fields_correct / all_fields_total if all_fields_total else 0.0
+    print(f"  {'all fields':<38} {overall * 100:6.1f}%")
+    print(f"  {'receipts with every field correct':<38} {exact / count * 100 if count else 0:6.1f}%")
+    if cells_total:
+        print(f"  {'route sheet cells':<38} {cells_correct / cells_total * 100:6.1f}%")
+
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "label": args.label,
+        "corpus": corpus,
+        "receipts": count,
+        "workers": args.workers,
+        "ocr_backend": get_ocr_engine().name,
+        "ocr_quality": args.quality,
+        "ocr_profile": args.ocr_profile,
+        "failed": failed,
+        "fast_pass": fast_pass,
+        "flagged_for_review": flagged,
+        "unflagged_wrong": unflagged_wrong,
+        "seconds": elapsed,
+        "receipts_per_second": count / elapsed if elapsed else None,
+        "peak_rss_mb": rss,
+        "field_accuracy": overall,
+        "receipt_accuracy": exact / count if count else None,
+        "route_sheet_accuracy": cells_correct / cells_total if cells_total else None,
+        "stage_p50": {name: stats["p50"] for name, stats in summary["stages"].items()},
+        "stage_p95": {name: stats["p95"] for name, stats in summary["stages"].items()},
+    }
+    compare_with_previous(run)
+
+    if not args.no_save:
+        report = dict(run, fields=field_accuracy, summary=summary, receipts_detail=receipts)
+        print(f"\nSaved results to {save_run(run, report)}")
+
+    os.chdir(REPO_DIR)
+    scratch.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare the OCR backends: tesseract run per image (pytesseract) and the
+in-process engine (tesserocr).
+
+Each receipt is loaded and preprocessed once, then OCR'd --repeat times with
+every available backend. The first call of the in-process engine includes
+loading the language model; it is reported separately from the steady-state
+time per receipt. The OCR text of the backends is compared as a sanity check.
+
+Run from the repository root:
+
+    python benchmarks/bench_ocr_engine.py receipt1.png receipt2.pdf --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_processing import (
+    OCR_CONFIG,
+    OCR_LANG,
+    PytesseractEngine,
+    TesserocrEngine,
+    load_receipt_image,
+    preprocess_image,
+    tesserocr,
+)
+
+
+def available_engines():
+    engines = [PytesseractEngine()]
+    if tesserocr is not None:
+        engines.append(TesserocrEngine())
+    else:
+        print("tesserocr is not installed; only pytesseract is measured.")
+    return engines
+
+
+def time_engine(engine, images, repeat):
+    start = time.perf_counter()
+    first_text = engine.image_to_string(images[0], lang=OCR_LANG, config=OCR_CONFIG)
+    first_seconds = time.perf_counter() - start
+
+    times = []
+    texts = [first_text]
+    for image in images:
+        for i in range(repeat):
+            start = time.perf_counter()
+            text = engine.image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG)
+            times.append(time.perf_counter() - start)
+        texts.append(text)
+    return first_seconds, statistics.median(times), texts[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("receipts", nargs="+", help="receipt images or PDFs")
+    parser.add_argument("--repeat", type=int, default=5, help="OCR calls per receipt and backend")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    images = [preprocess_image(load_receipt_image(path)) for path in args.receipts]
+
+    results = {"receipts": args.receipts, "repeat": args.repeat, "backends": {}}
+    texts = {}
+    for engine in available_engines():
+        first_seconds, median_seconds, texts[engine.name] = time_engine(engine, images, args.repeat)
+        results["backends"][engine.name] = {
+            "first_call_seconds": first_seconds,
+            "median_seconds": median_seconds,
+            "receipts_per_second": 1 / median_seconds,
+        }
+        print(
+            f"{engine.name:<12} first call {first_seconds * 1000:8.1f} ms, "
+            f"median {median_seconds * 1000:8.1f} ms/receipt ({1 / median_seconds:6.2f} receipts/s per core)"
+        )
+
+    if len(texts) > 1:
+        baseline = results["backends"]["pytesseract"]["median_seconds"]
+        print(f"speedup {baseline / results['backends']['tesserocr']['median_seconds']:.2f}x")
+        mismatches = [
+            path for path, a, b in zip(args.receipts, texts["pytesseract"], texts["tesserocr"])
+            if a.strip() != b.strip()
+        ]
+        results["text_mismatches"] = mismatches
+        if mismatches:
+            print(f"WARNING: OCR text differs between backends for: {', '.join(mismatches)}")
+        else:
+            print("OCR text matches between backends")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
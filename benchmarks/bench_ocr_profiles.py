@@ -0,0 +1,123 @@
+"""
+Compare the OCR profiles (see ocr_profiles.py) on a synthetic receipt corpus.
+
+Every receipt is loaded and preprocessed once for each OCR pass (the fast
+pass of tiered OCR and the full-quality pass), then OCR'd with every profile
+--repeat times. The report gives, per profile and pass, the median OCR time
+per receipt and its speedup over the default profile, the share of receipts
+that pass the consistency checks, and field accuracy against the corpus
+ground truth.
+
+Run from the repository root:
+
+    python benchmarks/synthetic_receipts.py benchmarks/corpus --count 50 --seed 1
+    python benchmarks/bench_ocr_profiles.py benchmarks/corpus --limit 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+sys.path.insert(0, REPO_DIR)
+
+from receipt_processing import (
+    FAST_OCR_CONFIG,
+    FAST_PDF_DPI,
+    FAST_PREPROCESSING_PIPELINE,
+    OCR_CONFIG,
+    OCR_LANG,
+    OCR_PROFILES,
+    PDF_DPI,
+    check_receipt_data,
+    get_ocr_engine,
+    load_receipt_image,
+    parse_receipt_text,
+    preprocess_image,
+)
+from synthetic_receipts import load_ground_truth, score_fields
+
+# (name, PDF resolution, preprocessing, Tesseract config) of each OCR pass
+PASSES = (
+    ("fast", FAST_PDF_DPI, lambda image: preprocess_image(image, "numpy", FAST_PREPROCESSING_PIPELINE), FAST_OCR_CONFIG),
+    ("full", PDF_DPI, preprocess_image, OCR_CONFIG),
+)
+
+
+def run_profile(engine, profile, images, truths, config, repeat):
+    """
+    OCR every image with ``profile`` and return the median seconds per
+    receipt, the receipts passing the consistency checks, the receipts with
+    every field correct and the share of correct fields.
+    """
+    config = profile.apply(config)
+    # The first call loads the profile's Tesseract model variant
+    engine.image_to_string(images[0], lang=OCR_LANG, config=config)
+    times = []
+    checked = exact = correct = total = 0
+    for image, truth in zip(images, truths):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = engine.image_to_string(image, lang=OCR_LANG, config=config)
+            times.append(time.perf_counter() - start)
+        data = parse_receipt_text(text)
+        checked += not check_receipt_data(text, data)
+        scores = score_fields(data, truth)
+        exact += all(scores.values())
+        correct += sum(scores.values())
+        total += len(scores)
+    return {
+        "median_seconds": statistics.median(times),
+        "passed_checks": checked,
+        "receipt_accuracy": exact / len(images),
+        "field_accuracy": correct / total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="corpus directory written by synthetic_receipts.py")
+    parser.add_argument("--limit", type=int, help="only use the first N receipts")
+    parser.add_argument("--repeat", type=int, default=1, help="OCR calls per receipt, profile and pass")
+    parser.add_argument("--profiles", nargs="+", choices=list(OCR_PROFILES), default=list(OCR_PROFILES),
+                        help="profiles to compare (default all); the first is the baseline")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    ground_truth = load_ground_truth(args.corpus)
+    file_names = sorted(ground_truth)[:args.limit]
+    paths = [os.path.join(args.corpus, name) for name in file_names]
+    truths = [ground_truth[name] for name in file_names]
+    engine = get_ocr_engine()
+
+    results = {"corpus": os.path.abspath(args.corpus), "receipts": len(paths), "ocr_backend": engine.name,
+               "passes": {}}
+    print(f"{len(paths)} receipts, OCR backend {engine.name}")
+    for pass_name, dpi, preprocess, config in PASSES:
+        images = [preprocess(load_receipt_image(path, dpi)) for path in paths]
+        results["passes"][pass_name] = {}
+        print(f"\n{pass_name} pass ({config})")
+        print(f"  {'profile':<10} {'ms/receipt':>10} {'speedup':>8} {'checks':>8} {'receipts':>9} {'fields':>7}")
+        baseline = None
+        for name in args.profiles:
+            result = run_profile(engine, OCR_PROFILES[name], images, truths, config, args.repeat)
+            baseline = baseline or result["median_seconds"]
+            result["speedup"] = baseline / result["median_seconds"]
+            results["passes"][pass_name][name] = result
+            print(
+                f"  {name:<10} {result['median_seconds'] * 1000:10.0f} {result['speedup']:7.2f}x "
+                f"{result['passed_checks']:>4}/{len(paths):<3} {result['receipt_accuracy'] * 100:8.1f}% "
+                f"{result['field_accuracy'] * 100:6.1f}%"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Compare the NumPy preprocessing pipeline with the original Pillow chain.
+
+Reports, per receipt, the time and output size of every pipeline step and of
+the Pillow chain. With --ocr the preprocessed images are also OCR'd and
+parsed; with --expected the parsed fields are scored against a ground-truth
+JSON file in the format of data/receipt_data.json.
+
+Run from the repository root:
+
+    python benchmarks/bench_preprocessing.py receipt1.png receipt2.pdf --repeat 3 --ocr
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from pdf2image import convert_from_path
+
+from image_preprocessing import PreprocessingPipeline
+from receipt_processing import OCR_CONFIG, OCR_LANG, PDF_DPI, get_ocr_engine, parse_receipt_text, preprocess_image_pillow
+
+# Fields compared against the ground truth; the dates depend on the run date
+SCORED_FIELDS = ("district_name", "district_number", "local_unit_number", "program")
+
+
+def load_image(path):
+    if path.lower().endswith(".pdf"):
+        return convert_from_path(path, dpi=PDF_DPI, first_page=1, last_page=1, grayscale=True)[0]
+    image = Image.open(path)
+    image.load()
+    return image
+
+
+def score_fields(data, expected):
+    """
+    Return (correct, total) over the scored fields and the price counts.
+    """
+    correct = total = 0
+    for field in SCORED_FIELDS:
+        total += 1
+        correct += str(data.get(field)) == str(expected.get(field))
+    for field, count in expected.get("prices", {}).items():
+        total += 1
+        correct += data.get("prices", {}).get(field) == count
+    return correct, total
+
+
+def run_pillow(image, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = preprocess_image_pillow(image)
+        times.append(time.perf_counter() - start)
+    return output, statistics.median(times)
+
+
+def run_numpy(pipeline, image, repeat):
+    reports = []
+    for _ in range(repeat):
+        output, report = pipeline.run(image)
+        reports.append(report)
+    step_times = {}
+    for report in reports:
+        for entry in report["steps"]:
+            step_times.setdefault(entry["step"], []).append(entry["seconds"])
+    steps = [
+        dict(entry, seconds=statistics.median(step_times[entry["step"]]))
+        for entry in reports[-1]["steps"]
+    ]
+    total = statistics.median(report["seconds"] for report in reports)
+    return output, steps, total, reports[-1]
+
+
+def ocr(image):
+    start = time.perf_counter()
+    text = get_ocr_engine().image_to_string(image, lang=OCR_LANG, config=OCR_CONFIG)
+    return text, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("receipts", nargs="+", help="receipt images or PDFs")
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions per receipt")
+    parser.add_argument("--ocr", action="store_true", help="also OCR and parse both outputs")
+    parser.add_argument("--expected", help="ground-truth receipt JSON to score parsed fields against")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    expected = None
+    if args.expected:
+        with open(args.expected) as f:
+            expected = json.load(f)
+
+    pipeline = PreprocessingPipeline()
+    results = []
+    for path in args.receipts:
+        image = load_image(path)
+        print(f"\n=== {os.path.basename(path)} ({image.width}x{image.height}) ===")
+
+        numpy_image, steps, numpy_total, report = run_numpy(pipeline, image, args.repeat)
+        for entry in steps:
+            print(
+                f"  {entry['step']:<24} {entry['seconds'] * 1000:8.1f} ms  "
+                f"{entry['width']}x{entry['height']} ({entry['bytes'] / 1e6:.1f} MB)"
+            )
+        print(
+            f"  {'numpy total':<24} {numpy_total * 1000:8.1f} ms  "
+            f"estimated {report.get('estimated_dpi')} DPI, skew {report.get('skew_angle', 0):.2f} deg"
+        )
+
+        pillow_image, pillow_total = run_pillow(image, args.repeat)
+        print(
+            f"  {'pillow total':<24} {pillow_total * 1000:8.1f} ms  "
+            f"{pillow_image.width}x{pillow_image.height} "
+            f"({pillow_image.width * pillow_image.height / 1e6:.1f} MB)"
+        )
+
+        result = {
+            "receipt": path,
+            "numpy": {"seconds": numpy_total, "steps": steps, "size": numpy_image.size},
+            "pillow": {"seconds": pillow_total, "size": pillow_image.size},
+        }
+
+        if args.ocr:
+            for name, processed in (("numpy", numpy_image), ("pillow", pillow_image)):
+                text, seconds = ocr(processed)
+                data = parse_receipt_text(text)
+                result[name]["ocr_seconds"] = seconds
+                line = f"  {name + ' OCR':<24} {seconds * 1000:8.1f} ms"
+                if expected is not None:
+                    correct, total = score_fields(data, expected)
+                    result[name]["accuracy"] = correct / total
+                    line += f"  fields {correct}/{total}"
+                print(line)
+
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare the XML-patching route sheet writer with the openpyxl writer.
+
+Generates N route sheets with each writer into a temporary directory and
+reports the total time and sheets per second. Both writers receive the same
+receipt data (data/receipt_data.json by default, with the unit number varied
+so every output has its own file name). The first XML output is checked
+against the openpyxl output cell by cell.
+
+Run from the repository root:
+
+    python benchmarks/bench_route_sheet.py --count 1000
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import load_workbook
+
+from route_sheet import TEMPLATE_PATH, get_route_sheet_template, update_route_sheet_from_json
+
+
+def make_receipts(base, count):
+    receipts = []
+    for i in range(count):
+        data = copy.deepcopy(base)
+        data["local_unit_number"] = str(i)
+        receipts.append(data)
+    return receipts
+
+
+def run_writer(writer, receipts, output_dir):
+    start = time.perf_counter()
+    paths = [update_route_sheet_from_json(data, output_dir=output_dir, writer=writer) for data in receipts]
+    return paths, time.perf_counter() - start
+
+
+def compare_outputs(path_a, path_b):
+    """
+    Return the cells whose values differ between two route sheets.
+    """
+    sheet_a = load_workbook(path_a).active
+    sheet_b = load_workbook(path_b).active
+    differences = []
+    for row in sheet_a.iter_rows():
+        for cell in row:
+            other = sheet_b[cell.coordinate]
+            if cell.value != other.value or cell.number_format != other.number_format:
+                differences.append((cell.coordinate, cell.value, other.value))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200, help="number of route sheets per writer")
+    parser.add_argument("--data", default=os.path.join("data", "receipt_data.json"), help="receipt data JSON")
+    parser.add_argument("--template", default=TEMPLATE_PATH, help="route sheet template")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    with open(args.data) as f:
+        receipts = make_receipts(json.load(f), args.count)
+
+    # Template loading is a one-off per process; time it separately
+    start = time.perf_counter()
+    get_route_sheet_template(args.template)
+    template_seconds = time.perf_counter() - start
+
+    results = {"count": args.count, "template_load_seconds": template_seconds}
+    with tempfile.TemporaryDirectory() as xml_dir, tempfile.TemporaryDirectory() as openpyxl_dir:
+        xml_paths, xml_seconds = run_writer("xml", receipts, xml_dir)
+        openpyxl_paths, openpyxl_seconds = run_writer("openpyxl", receipts, openpyxl_dir)
+        differences = compare_outputs(xml_paths[0], openpyxl_paths[0])
+
+    for name, seconds in (("xml", xml_seconds), ("openpyxl", openpyxl_seconds)):
+        results[name] = {"seconds": seconds, "sheets_per_second": args.count / seconds}
+        print(
+            f"{name:<10} {args.count} sheets in {seconds:7.2f} s "
+            f"({args.count / seconds:8.1f} sheets/s, {seconds / args.count * 1000:6.2f} ms/sheet)"
+        )
+    print(f"template load {template_seconds * 1000:.1f} ms (once per process)")
+    print(f"speedup {openpyxl_seconds / xml_seconds:.1f}x")
+    if differences:
+        print(f"WARNING: outputs differ in {len(differences)} cell(s): {differences[:5]}")
+    else:
+        print("outputs match cell for cell")
+    results["differences"] = [list(map(str, difference)) for difference in differences]
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Generate synthetic receipts with known ground truth.
+
+Receipts follow the layout of the council shop receipt the parser was written
+against (see data/raw_ocr_output.txt): shop header, a registration line, line
+items with count, price and amount, totals, the chartered organization and
+customer lines, the TX# and the cashier footer. Districts, unit types, line
+items and counts are drawn at random, and each receipt is rendered at a
+random scan resolution with some skew, noise and blur, to PNG or to an
+image-only (scanned) PDF.
+
+Every corpus directory holds a ground_truth.json mapping file name to the
+expected receipt data and the rendering parameters.
+
+Run from the repository root:
+
+    python benchmarks/synthetic_receipts.py benchmarks/corpus --count 50 --seed 1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from receipt_processing import DISTRICT_MAP, PRICE_FIELDS
+from route_sheet import PROGRAM_TO_UNIT_TYPE
+
+GROUND_TRUTH_FILE = "ground_truth.json"
+
+# Fields scored against the ground truth besides the price counts; the dates
+# depend on the run date and the council number is a constant
+SCORED_FIELDS = ("district_name", "district_number", "local_unit_number", "program")
+
+UNIT_TYPE_TO_PROGRAM = {
+    unit_type: program for program, unit_type in PROGRAM_TO_UNIT_TYPE.items() if unit_type != "Non-Unit"
+}
+
+# How each unit type appears in the chartered organization line
+UNIT_DESCRIPTIONS = {
+    "Troop": "Boy Scout Troop",
+    "Pack": "Cub Scout Pack",
+    "Crew": "Venturing Crew",
+    "Ship": "Sea Scout Ship",
+    "Post": "Exploring Post",
+}
+
+# Line item label -> (unit price, route sheet price field)
+LINE_ITEMS = {
+    "Youth BL": (15.00, "Youth SL Subscription"),
+    "Youth Renewal": (85.00, "Youth Registration"),
+    "Youth New": (85.00, "Youth Registration"),
+    "Youth Program Fee": (12.00, "Program Fee"),
+    "Adult Renewal": (65.00, "Adult Registration"),
+    "Adult New": (65.00, "Adult Registration"),
+    "Adult Program Fee": (12.00, "Program Fee"),
+}
+
+CHARTERED_ORGANIZATIONS = (
+    "Catholic Bishop of Chicago St Juliana",
+    "First United Methodist Church",
+    "Lions Club of Park Ridge",
+    "Holy Family Parish",
+    "Parent Teacher Organization Lincoln School",
+    "Rotary Club of Elmhurst",
+    "Community Presbyterian Church",
+)
+
+CASHIERS = ("Kathy Daloia", "Mark Ellison", "Denise Ortiz", "Raj Patel")
+
+MONTHS = (
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+)
+
+# Rendering
+SCAN_DPIS = (150, 200, 300, 400)
+PAGE_WIDTH_INCHES = 8.5
+MARGIN_INCHES = 0.6
+AMOUNT_COLUMN_INCHES = 6.2
+FONT_POINTS = 11
+LINE_SPACING = 1.45
+FONT_CANDIDATES = ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf")
+
+
+def random_ground_truth(rng):
+    """
+    Draw the receipt data a perfect parser would extract from a receipt.
+    """
+    district = rng.choice(sorted(DISTRICT_MAP))
+    unit_type = rng.choice(sorted(UNIT_TYPE_TO_PROGRAM))
+    unit_number = str(rng.randint(1, 9999))
+
+    youth = rng.randint(0, 40)
+    adults = rng.randint(1, 25)
+    items = []
+    if youth:
+        renewal = rng.choice(("Youth Renewal", "Youth Renewal", "Youth New"))
+        items.append(("Youth BL", youth + rng.randint(0, 3)))
+        items.append((renewal, youth))
+        if rng.random() < 0.8:
+            items.append(("Youth Program Fee", youth))
+    items.append((rng.choice(("Adult Renewal", "Adult Renewal", "Adult New")), adults))
+    if rng.random() < 0.8:
+        items.append(("Adult Program Fee", adults))
+    rng.shuffle(items)
+
+    prices = {field: 0 for field in PRICE_FIELDS}
+    for label, count in items:
+        prices[LINE_ITEMS[label][1]] += count
+
+    return {
+        "district_name": district,
+        "district_number": DISTRICT_MAP[district],
+        "local_unit_number": unit_number,
+        "program": UNIT_TYPE_TO_PROGRAM[unit_type],
+        "prices": prices,
+        # Not part of the receipt data, but needed to render the receipt
+        "unit_type": unit_type,
+        "line_items": items,
+    }
+
+
+def receipt_lines(truth, rng):
+    """
+    Return the text lines of a receipt as (text, amount) pairs; ``amount`` is
+    printed right-aligned in the amount column, or None.
+    """
+    district = truth["district_name"]
+    abbreviation = district.replace("-", "").replace(" ", "")[:3].upper()
+    unit_type = truth["unit_type"]
+    unit = f"{unit_type} {truth['local_unit_number']}"
+    youth = sum(count for label, count in truth["line_items"] if label in ("Youth Renewal", "Youth New"))
+    adults = sum(count for label, count in truth["line_items"] if label in ("Adult Renewal", "Adult New"))
+    total = sum(LINE_ITEMS[label][0] * count for label, count in truth["line_items"])
+    month = rng.choice(MONTHS)
+    year = rng.choice((2024, 2025))
+
+    lines = [
+        ("Scouting America", None),
+        ("", None),
+        ("Pathway to Adventure Council", None),
+        ("", None),
+        ("Arlington Heights Center for Scouting", None),
+        ("617 E Golf Rd", None),
+        ("Heights, IL 60005", None),
+        ("312-421-8800", None),
+        (f"1 {unit_type[0]}{int(truth['local_unit_number']):04d} B BSA Registration for {month} {year}", f"{total:.2f}"),
+    ]
+    for label, count in truth["line_items"]:
+        price = LINE_ITEMS[label][0]
+        lines.append((f"{count} {label} x ${price:.2f}", f"({price * count:.2f})"))
+    lines += [
+        ("", None),
+        ("Subtotal", f"{total:.2f}"),
+        ("Tax 6.25%", "0.00"),
+        ("Total", f"{total:.2f}"),
+        (f"Check #{rng.randint(1000, 9999)}", f"{total:.2f}"),
+        ("", None),
+        (f"{rng.choice(CHARTERED_ORGANIZATIONS)} {UNIT_DESCRIPTIONS[unit_type]} {truth['local_unit_number']}", None),
+        (f"{district} {unit} B Balance: $0.00", None),
+        (f"Customer: {abbreviation} {unit} - member renewal - {youth} youth and {adults} adult", None),
+        ("", None),
+        ("Customer Signature", None),
+        ("", None),
+        (f"TX# {rng.randint(10000, 99999)}", None),
+        ("", None),
+        ("Thank You For Shopping With Us!!", None),
+        ("", None),
+        (
+            f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{year} "
+            f"{rng.randint(8, 17):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} {rng.choice(CASHIERS)}",
+            None,
+        ),
+    ]
+    return lines
+
+
+def load_font(pixels):
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, pixels)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=pixels)
+
+
+def render_receipt(lines, dpi, skew=0.0, noise=0.0, blur=0.0, np_rng=None):
+    """
+    Render receipt lines as a grayscale scan at ``dpi``.
+
+    ``skew`` rotates the page (degrees), ``noise`` adds Gaussian noise with
+    that standard deviation (0-255 scale) plus a sprinkle of specks, and
+    ``blur`` is a Gaussian blur radius in pixels.
+    """
+    np_rng = np_rng if np_rng is not None else np.random.default_rng()
+    font = load_font(round(FONT_POINTS / 72 * dpi))
+    line_height = round(FONT_POINTS / 72 * dpi * LINE_SPACING)
+    margin = round(MARGIN_INCHES * dpi)
+    amount_right = round(AMOUNT_COLUMN_INCHES * dpi)
+
+    width = round(PAGE_WIDTH_INCHES * dpi)
+    height = 2 * margin + line_height * len(lines)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, (text, amount) in enumerate(lines):
+        y = margin + i * line_height
+        if text:
+            draw.text((margin, y), text, font=font, fill=20)
+        if amount:
+            draw.text((amount_right, y), amount, font=font, fill=20, anchor="ra")
+
+    if skew:
+        image = image.rotate(skew, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        pixels = np.asarray(image, dtype=np.float32)
+        pixels += np_rng.normal(0, noise, pixels.shape)
+        specks = np_rng.random(pixels.shape) < 0.0005
+        pixels[specks] = 0
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return image
+
+
+def random_render_params(rng):
+    return {
+        "dpi": rng.choice(SCAN_DPIS),
+        "skew": round(rng.uniform(-3.0, 3.0), 2),
+        "noise": round(rng.choice((0.0, rng.uniform(4.0, 20.0))), 1),
+        "blur": round(rng.choice((0.0, 0.0, rng.uniform(0.3, 1.0))), 2),
+    }
+
+
+def save_receipt(image, path, dpi):
+    if path.lower().endswith(".pdf"):
+        # An image-only PDF, like the output of a scanner
+        image.save(path, "PDF", resolution=dpi)
+    else:
+        image.save(path, dpi=(dpi, dpi))
+
+
+def generate_corpus(output_dir, count, seed=0, formats=("png", "pdf")):
+    """
+    Render ``count`` random receipts into ``output_dir`` and write their
+    ground truth. Returns the ground truth dict keyed by file name.
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    ground_truth = {}
+    for i in range(count):
+        truth = random_ground_truth(rng)
+        params = random_render_params(rng)
+        extension = formats[i % len(formats)]
+        file_name = f"receipt_{i:04d}.{extension}"
+
+        image = render_receipt(receipt_lines(truth, rng), np_rng=np_rng, **params)
+        save_receipt(image, os.path.join(output_dir, file_name), params["dpi"])
+
+        truth["render"] = params
+        ground_truth[file_name] = truth
+
+    with open(os.path.join(output_dir, GROUND_TRUTH_FILE), "w") as f:
+        json.dump(ground_truth, f, indent=4)
+    return ground_truth
+
+
+def load_ground_truth(corpus_dir):
+    with open(os.path.join(corpus_dir, GROUND_TRUTH_FILE)) as f:
+        return json.load(f)
+
+
+def score_fields(data, truth):
+    """
+    Compare extracted receipt data with the ground truth.
+
+    Returns a dict mapping each scored field (and "prices.<field>" for every
+    price count) to whether it was extracted correctly.
+    """
+    scores = {field: str(data.get(field)) == str(truth[field]) for field in SCORED_FIELDS}
+    extracted_prices = data.get("prices", {})
+    for field, count in truth["prices"].items():
+        scores[f"prices.{field}"] = extracted_prices.get(field, 0) == count
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir", help="directory to write the receipts and ground_truth.json to")
+    parser.add_argument("--count", type=int, default=50, help="number of receipts")
+    parser.add_argument("--seed", type=int, default=0, help="random seed; the same seed gives the same corpus")
+    parser.add_argument("--formats", nargs="+", default=["png", "pdf"], choices=["png", "pdf"],
+                        help="file formats, used in rotation")
+    args = parser.parse_args()
+
+    generate_corpus(args.output_dir, args.count, args.seed, tuple(args.formats))
+    print(f"Wrote {args.count} receipts to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
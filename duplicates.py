@@ -0,0 +1,248 @@
+"""
+Duplicate receipt detection.
+
+Receipts are often scanned twice, or arrive as both a photo and a PDF. After
+parsing, the TX#, check number and customer line are compared with the record
+store. Receipts printed from the same template differ mostly in their digits,
+so their images can be as close as two scans of one receipt; the perceptual
+hash of the page, taken before OCR, therefore only picks the earlier receipts
+that look alike as candidates. A candidate is confirmed as the same receipt by
+a single matching identifier, where an unrelated record needs two.
+
+A duplicate is therefore still OCR'd before it is skipped: no hash distance
+separates re-scans from new receipts (two receipts for one unit that differ
+only in their counts, TX# and check number hash 0.0004 apart, closer than two
+scans of one receipt), so skipping on the image alone would drop receipts.
+"""
+import logging
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from image_preprocessing import estimate_skew_angle, otsu_threshold
+from record_store import customer_key
+
+# Page width the image is scaled to before deskewing and cropping, so scans at
+# any resolution hash alike
+HASH_PAGE_WIDTH = 800
+HASH_MAX_SKEW = 5.0
+HASH_SKEW_STEP = 0.25
+# Rows/columns with less ink than this fraction are margin (or scanner noise)
+HASH_INK_FRACTION = 0.01
+# The cropped page is scaled to this grid (width, height) and its lowest DCT
+# frequencies (width, height) make up the hash
+HASH_GRID = (64, 128)
+HASH_BLOCK = (16, 32)
+HASH_SIZE = HASH_BLOCK[0] * HASH_BLOCK[1]
+HASH_DTYPE = np.float16
+
+# Largest distance (1 - cosine similarity of the hashes) at which an earlier
+# receipt is a candidate duplicate. Two scans of one receipt at different
+# resolution, skew, noise and blur are up to 0.007 apart on the synthetic
+# benchmark corpus, but different receipts for the same unit can be closer
+# than that, so a candidate is only skipped once its record matches too.
+CANDIDATE_HASH_DISTANCE = 0.01
+# Closest candidates checked against the parsed receipt
+MAX_CANDIDATES = 5
+# (label, field) of the identifiers compared between receipts
+IDENTIFIERS = (("TX#", "tx_number"), ("check number", "check_number"), ("customer", "customer_key"))
+
+
+class DuplicateReceiptError(Exception):
+    """
+    Raised when a receipt was already processed from another file.
+    """
+
+    def __init__(self, file_path, duplicate_of, reason):
+        self.file_path = file_path
+        self.duplicate_of = duplicate_of
+        self.reason = reason
+        earlier = os.path.basename(duplicate_of) if duplicate_of else "an earlier receipt"
+        super().__init__(f"Duplicate of {earlier} ({reason})")
+
+
+def compare_identifiers(data, record):
+    """
+    Compare the identifiers of parsed receipt ``data`` with a stored
+    ``record``. Returns the labels of those that match and of the TX# and
+    check number if both have one and they differ.
+    """
+    values = dict(data, customer_key=customer_key(data.get("customer")))
+    matched = []
+    conflicting = []
+    for label, field in IDENTIFIERS:
+        if not values.get(field) or not record.get(field):
+            continue
+        if str(values[field]) == record[field]:
+            matched.append(label)
+        elif field != "customer_key":
+            conflicting.append(label)
+    return matched, conflicting
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(size):
+    k = np.arange(size)[:, None]
+    x = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * size)).astype(np.float32)
+
+
+def normalize_page(image):
+    """
+    Return the darkness of a page as a float array of ``HASH_GRID`` (width,
+    height): scaled to a fixed width, deskewed and cropped to the printed
+    area.
+    """
+    gray = image.convert("L")
+    height = max(1, round(gray.height * HASH_PAGE_WIDTH / gray.width))
+    gray = gray.resize((HASH_PAGE_WIDTH, height), Image.Resampling.BOX)
+    pixels = np.asarray(gray)
+
+    angle = estimate_skew_angle(pixels < otsu_threshold(pixels), HASH_MAX_SKEW, HASH_SKEW_STEP)
+    if abs(angle) >= HASH_SKEW_STEP:
+        pixels = np.asarray(gray.rotate(angle, resample=Image.Resampling.BILINEAR, fillcolor=255))
+
+    ink = pixels < otsu_threshold(pixels)
+    rows = np.flatnonzero(ink.sum(axis=1) > max(2, ink.shape[1] * HASH_INK_FRACTION))
+    columns = np.flatnonzero(ink.sum(axis=0) > max(2, ink.shape[0] * HASH_INK_FRACTION))
+    if rows.size and columns.size:
+        pixels = pixels[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+
+    page = Image.fromarray(255 - pixels)
+    return np.asarray(page.resize(HASH_GRID, Image.Resampling.BOX), dtype=np.float32)
+
+
+def perceptual_hash(image):
+    """
+    Return the perceptual hash of a receipt page as bytes.
+
+    The hash is the unit vector of the page's lowest-frequency DCT
+    coefficients (``HASH_SIZE`` values, ``HASH_DTYPE``), so it survives a
+    change of resolution, small skew, noise, blur and JPEG compression, and
+    two hashes are compared by their cosine similarity. Unlike a one-bit-per-
+    coefficient hash it keeps apart receipts that share a template.
+    """
+    page = normalize_page(image)
+    width, height = HASH_BLOCK
+    coefficients = (_dct_matrix(page.shape[0]) @ page @ _dct_matrix(page.shape[1]).T)[:height, :width].ravel()
+    # The DC term only reflects the amount of ink
+    coefficients[0] = 0.0
+    norm = np.linalg.norm(coefficients)
+    if norm:
+        coefficients /= norm
+    return coefficients.astype(HASH_DTYPE).tobytes()
+
+
+def hash_distances(image_hash, hashes):
+    """
+    Return the distances (1 - cosine similarity) between ``image_hash`` and
+    each row of ``hashes`` (an array with one hash per row).
+    """
+    if len(hashes) == 0:
+        return np.zeros(0, dtype=np.float32)
+    query = np.frombuffer(image_hash, dtype=HASH_DTYPE).astype(np.float32)
+    return 1.0 - hashes.astype(np.float32) @ query
+
+
+class DuplicateDetector:
+    """
+    Finds receipts that were already processed from another file.
+
+    Image hashes are kept in the record store's ``image_hashes`` table and
+    mirrored in memory (1 KB per receipt), so a lookup is one matrix-vector
+    product over every hash; rows added by other processes are picked up
+    incrementally. An image match only makes an earlier receipt a candidate
+    (see ``check_record``); no receipt is skipped by its image alone.
+    """
+
+    def __init__(self, store, max_distance=CANDIDATE_HASH_DISTANCE):
+        self.store = store
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._hashes = np.zeros((0, HASH_SIZE), dtype=HASH_DTYPE)
+        self._entries = []
+
+    def _refresh(self):
+        rows = self.store.image_hashes(after_id=self._last_id)
+        if not rows:
+            return
+        # Hashes of another size come from different hash settings
+        new = [row for row in rows if len(row["phash"]) == HASH_SIZE * np.dtype(HASH_DTYPE).itemsize]
+        if new:
+            hashes = np.frombuffer(b"".join(row["phash"] for row in new), dtype=HASH_DTYPE)
+            self._hashes = np.vstack([self._hashes, hashes.reshape(len(new), -1)])
+            self._entries.extend((row["content_hash"], row["file_path"]) for row in new)
+        self._last_id = rows[-1]["id"]
+
+    def find_images(self, image_hash, content_hash=None, limit=MAX_CANDIDATES):
+        """
+        Return (content hash, file path, distance) of up to ``limit`` earlier
+        receipts within ``max_distance`` of ``image_hash``, closest first,
+        ignoring the file with ``content_hash`` itself.
+        """
+        matches = []
+        with self._lock:
+            self._refresh()
+            distances = hash_distances(image_hash, self._hashes)
+            for index in np.argsort(distances, kind="stable"):
+                if distances[index] > self.max_distance or len(matches) == limit:
+                    break
+                if self._entries[index][0] != content_hash:
+                    matches.append(self._entries[index] + (float(distances[index]),))
+        return matches
+
+    def hash_image(self, image, file_path, content_hash=None):
+        """
+        Hash a receipt page before OCR. Returns the hash (for ``add_image``)
+        and the earlier receipts that look alike (for ``check_record``).
+        """
+        image_hash = perceptual_hash(image)
+        candidates = self.find_images(image_hash, content_hash)
+        for _, duplicate_of, distance in candidates:
+            logging.info(f"{file_path} looks like {duplicate_of} (hash distance {distance:.4f}).")
+        return image_hash, candidates
+
+    def check_record(self, data, file_path, content_hash=None, candidates=()):
+        """
+        Raise ``DuplicateReceiptError`` if an earlier receipt is the same
+        transaction as the parsed ``data``: it has the same TX# and check
+        number, or the same customer line and one of them (see
+        ``RecordStore.find_duplicate``), or it is one of the ``candidates``
+        from ``hash_image`` and has any of them in common and none that
+        differ.
+        """
+        record = self.store.find_duplicate(
+            data.get("tx_number"), data.get("check_number"), data.get("customer"), exclude_hash=content_hash
+        )
+        if record is not None:
+            matched = ", ".join(compare_identifiers(data, record)[0])
+            logging.info(f"{file_path} has the same {matched} as {record['file_path']}.")
+            raise DuplicateReceiptError(file_path, record["file_path"], f"same {matched}")
+
+        if not candidates:
+            return
+        records = self.store.find_records([candidate[0] for candidate in candidates])
+        for candidate_hash, _, distance in candidates:
+            record = records.get(candidate_hash)
+            if record is None:
+                continue
+            matched, conflicting = compare_identifiers(data, record)
+            if matched and not conflicting:
+                matched = ", ".join(matched)
+                logging.info(
+                    f"{file_path} looks like {record['file_path']} (hash distance {distance:.4f}) "
+                    f"and has the same {matched}."
+                )
+                raise DuplicateReceiptError(
+                    file_path, record["file_path"], f"same image and {matched}, hash distance {distance:.4f}"
+                )
+
+    def add_image(self, content_hash, image_hash, file_path):
+        """
+        Index the image hash of a processed receipt.
+        """
+        self.store.add_image_hash(content_hash, image_hash, file_path)
@@ -0,0 +1,271 @@
+"""
+Declarative field-extraction rules for receipt text.
+
+What the parser recognizes is described by the tables below: the districts,
+the unit and program keywords, the line-item labels and the patterns of the
+other receipt fields. ``build_rules`` turns them into rules, each a regular
+expression with the field it sets, how the value is taken from a match and
+how much a match is trusted. ``FieldMatcher`` compiles the rules once into a
+single regular expression that finds every rule's matches in one scan of the
+text, and records for each field the lines it came from and a confidence.
+Recognizing a new district, label or field means editing a table here, not
+the parsing code.
+"""
+import re
+from datetime import datetime
+
+# Districts and their numbers
+DISTRICT_MAP = {
+    "Calumet": 1, "Prairie Dunes": 3, "Thunderbird": 4, "Checaugau": 5,
+    "Iron Horse": 6, "Tri-Star": 7, "Five Creeks": 9, "Tall Grass": 11, "Trailblazer": 12
+}
+
+# Words that identify a unit on the receipt
+UNIT_KEYWORDS = ("Troop", "Pack", "Crew", "Ship", "Post")
+
+# Programs and the words that identify them: the program's name and its unit
+# keyword. When a line names several programs the first one here wins.
+PROGRAM_KEYWORDS = {
+    "Scouts BSA": ("Scouts BSA", "Troop"),
+    "Cub Scouts": ("Cub Scouts", "Pack"),
+    "Venturing": ("Venturing", "Crew"),
+    "Sea Scouts": ("Sea Scouts", "Ship"),
+    "Exploring": ("Exploring", "Post"),
+}
+PROGRAMS = tuple(PROGRAM_KEYWORDS)
+
+# Line-item labels and the route sheet price field their counts go to
+LINE_ITEM_FIELDS = {
+    "Youth BL": "Youth SL Subscription",
+    "Youth Renewal": "Youth Registration",
+    "Youth New": "Youth Registration",
+    "Youth Program Fee": "Program Fee",
+    "Adult Renewal": "Adult Registration",
+    "Adult New": "Adult Registration",
+    "Adult Program Fee": "Program Fee",
+}
+LINE_ITEM_LABELS = tuple(LINE_ITEM_FIELDS)
+
+# Other fields: (field, pattern with a "value" group, confidence). A pattern
+# starting with ^ only matches at the start of a line.
+TEXT_FIELDS = (
+    # "TX# 10178"
+    ("tx_number", r"TX#[ \t]*(?P<value>\d+)", 0.95),
+    # The cashier line, "12/26/2024 09:42:40 Kathy Daloia"
+    ("receipt_date", r"^[ \t]*(?P<value>\d{1,2}/\d{1,2}/\d{4})[ \t]+\d{1,2}:\d{2}", 0.9),
+    # "Check #6031 3467.00"
+    ("check_number", r"(?i:Check[ \t]*#[ \t]*(?P<value>\d+))", 0.9),
+    # "Customer: TRI Troop 965 - member renewal - 19 youth and 17 adult"
+    ("customer", r"^[ \t]*Customer:[ \t]*(?P<value>\S.*)", 0.95),
+)
+
+# Confidence of a district, unit number, program and line item match
+DISTRICT_CONFIDENCE = 0.9
+# The unit number is the first number on a line with a unit keyword
+UNIT_CONFIDENCE = 0.8
+PROGRAM_NAME_CONFIDENCE = 0.95
+PROGRAM_UNIT_CONFIDENCE = 0.8
+LINE_ITEM_CONFIDENCE = 0.9
+
+# Spaces, dots and hyphens in labels are ignored, as OCR often drops or adds
+# them. Patterns only match within a line, so they use [ \t] rather than \s.
+LABEL_SEPARATOR = r"[ \t.-]*"
+
+
+def compact_label(label):
+    return re.sub(r"[\s.-]", "", label.lower())
+
+
+_COMPACT_LINE_ITEM_FIELDS = {compact_label(label): field for label, field in LINE_ITEM_FIELDS.items()}
+
+
+def price_field_for_label(label):
+    """
+    Map a line-item label (e.g. "youth renewal") to its price field, or None
+    if it is not a known item. Case, spaces, dots and hyphens are ignored.
+    """
+    label = compact_label(label)
+    for known, field in _COMPACT_LINE_ITEM_FIELDS.items():
+        if known in label:
+            return field
+    return None
+
+
+def parse_us_date(value):
+    """
+    Convert a "M/D/YYYY" date to ISO format, or None if it is not a valid date.
+    """
+    month, day, year = (int(part) for part in value.split("/"))
+    try:
+        return datetime(year, month, day).strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+# Converters applied to captured values: a None result discards the match
+CONVERTERS = {
+    "receipt_date": parse_us_date,
+    "customer": lambda value: " ".join(value.split()),
+}
+
+
+def build_rules():
+    """
+    Return the rules described by the tables above, in priority order.
+
+    A rule is a dict with the ``field`` it sets, its ``pattern``, its
+    ``confidence`` and how the value is taken from a match (``kind``):
+
+    * "constant": the rule's ``value``
+    * "line_number": the first number on the matching line
+    * "capture": the pattern's "value" group, passed through the field's
+      converter if it has one
+    * "count": the pattern's "count" group, added to the price field of the
+      matched label (the field is "prices")
+    """
+    rules = []
+    for district in DISTRICT_MAP:
+        rules.append({
+            "field": "district_name", "kind": "constant", "value": district,
+            "pattern": f"(?i:{re.escape(district)})", "confidence": DISTRICT_CONFIDENCE,
+        })
+    for keyword in UNIT_KEYWORDS:
+        rules.append({
+            "field": "local_unit_number", "kind": "line_number",
+            "pattern": re.escape(keyword), "confidence": UNIT_CONFIDENCE,
+        })
+    for program, (name, unit_keyword) in PROGRAM_KEYWORDS.items():
+        rules.append({
+            "field": "program", "kind": "constant", "value": program,
+            "pattern": re.escape(name), "confidence": PROGRAM_NAME_CONFIDENCE,
+        })
+        rules.append({
+            "field": "program", "kind": "constant", "value": program,
+            "pattern": re.escape(unit_keyword), "confidence": PROGRAM_UNIT_CONFIDENCE,
+        })
+    # Longest labels first, so "Youth Program Fee" is not cut short by a shorter label
+    labels = sorted(LINE_ITEM_FIELDS, key=len, reverse=True)
+    label_pattern = "|".join(LABEL_SEPARATOR.join(map(re.escape, label.split())) for label in labels)
+    rules.append({
+        "field": "prices", "kind": "count",
+        "pattern": rf"(?<!\d)(?P<count>\d+)[ \t]*(?i:(?P<label>{label_pattern}))", "confidence": LINE_ITEM_CONFIDENCE,
+    })
+    for field, pattern, confidence in TEXT_FIELDS:
+        rules.append({"field": field, "kind": "capture", "pattern": pattern, "confidence": confidence})
+    return rules
+
+
+NAMED_GROUP = re.compile(r"\(\?P<\w+>")
+
+
+class FieldMatcher:
+    """
+    Single-pass matcher of receipt fields, compiled from rules (see
+    ``build_rules``).
+
+    Rules with the same pattern share one alternative of a combined regular
+    expression, wrapped in a lookahead so the matches of different rules may
+    overlap (the customer line also names the unit). One scan of the text
+    finds every match. For each field, the first rule in priority order wins
+    on a line and the last line wins across lines.
+
+    ``match`` returns the values and, per field, the ``confidence`` (the
+    winning rule's confidence, scaled by the share of lines that agree with
+    the value) and the 1-based ``lines`` and their ``text`` it came from.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = build_rules() if rules is None else list(rules)
+        self._groups = []
+        alternatives = {}
+        for priority, rule in enumerate(self.rules):
+            pattern = rule["pattern"]
+            if pattern not in alternatives:
+                alternatives[pattern] = len(self._groups)
+                self._groups.append((re.compile(pattern, re.MULTILINE), []))
+            self._groups[alternatives[pattern]][1].append((priority, rule))
+        # The groups in the rule patterns are only read by each rule's own
+        # compiled pattern. Each alternative is marked by an empty group at its
+        # end rather than a group around it, which would keep the regex engine
+        # from skipping positions where no alternative can start.
+        combined = "|".join(
+            f"(?:{NAMED_GROUP.sub('(?:', pattern)})(?P<g{index}>)" for pattern, index in alternatives.items()
+        )
+        self._scanner = re.compile(f"(?={combined})", re.MULTILINE)
+
+    def match(self, text):
+        """
+        Match ``text`` against every rule in one scan. Returns ``(values,
+        sources)``: the field values, with line-item counts summed per price
+        field under "prices", and per field (price fields as
+        "prices.<field>") its confidence, lines and line text.
+        """
+        lines = text.splitlines(keepends=True)
+        starts = []
+        position = 0
+        for line in lines:
+            starts.append(position)
+            position += len(line)
+
+        # (line index, field) -> (priority, value, confidence) of the winning rule on that line
+        hits = {}
+        counts = {}
+        line_index = -1
+        for match in self._scanner.finditer(text):
+            position = match.start()
+            while line_index + 1 < len(starts) and starts[line_index + 1] <= position:
+                line_index += 1
+            regex, rules = self._groups[int(match.lastgroup[1:])]
+            rule_match = regex.match(text, position)
+            for priority, rule in rules:
+                kind = rule["kind"]
+                if kind == "count":
+                    field = price_field_for_label(rule_match.group("label"))
+                    if field is not None:
+                        counts.setdefault(field, []).append(
+                            (line_index, int(rule_match.group("count")), rule["confidence"])
+                        )
+                    continue
+                if kind == "constant":
+                    value = rule["value"]
+                elif kind == "line_number":
+                    number = re.search(r"\d+", lines[line_index])
+                    if not number:
+                        continue
+                    value = number.group()
+                else:
+                    value = rule_match.group("value")
+                    converter = CONVERTERS.get(rule["field"])
+                    if converter is not None:
+                        value = converter(value)
+                    if value is None:
+                        continue
+                key = (line_index, rule["field"])
+                if key not in hits or priority < hits[key][0]:
+                    hits[key] = (priority, value, rule["confidence"])
+
+        values = {}
+        sources = {}
+        by_field = {}
+        for (line_index, field), (_, value, confidence) in sorted(hits.items()):
+            by_field.setdefault(field, []).append((line_index, value, confidence))
+        for field, field_hits in by_field.items():
+            line_index, value, confidence = field_hits[-1]
+            agreeing = sum(1 for _, other, _ in field_hits if other == value)
+            values[field] = value
+            sources[field] = self._source(lines, [line_index], confidence * agreeing / len(field_hits))
+
+        values["prices"] = {}
+        for field, items in counts.items():
+            values["prices"][field] = sum(count for _, count, _ in items)
+            line_indexes = sorted({line_index for line_index, _, _ in items})
+            sources[f"prices.{field}"] = self._source(lines, line_indexes, min(item[2] for item in items))
+        return values, sources
+
+    @staticmethod
+    def _source(lines, line_indexes, confidence):
+        return {
+            "confidence": round(confidence, 3),
+            "lines": [line_index + 1 for line_index in line_indexes],
+            "text": [lines[line_index].strip() for line_index in line_indexes],
+        }
@@ -1,10 +1,30 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import os
+import queue
+import time
 import webbrowser
-from receipt_processing import extract_receipt_text_to_json
-from route_sheet import update_route_sheet_from_json
-import win32com.client
+from datetime import datetime
+from batch_processing import BatchProcessor, default_worker_count, needs_review
+from receipt_processing import DEDUP
+from metrics import MetricsRecorder, format_seconds, format_summary
+from ocr_cache import OCRCache
+from report_window import ReportWindow
+from results_table import ResultsTable
+from route_sheet import OUTPUT_DIR, SUMMARY_SHEET_NAME
+from route_sheet_pdf import PRINT_AREA, print_pdf, write_route_sheet_pdf
+
+# Results handled per GUI poll, so a burst (e.g. OCR cache hits) cannot stall redraws
+MAX_RESULTS_PER_POLL = 200
+# Minimum seconds between recomputing the timing summary in the status bar
+TIMINGS_REFRESH_SECONDS = 1.0
+# "pdf" renders every route sheet into one PDF sent as a single print job;
+# "excel" prints each generated workbook through Excel (Windows only)
+PRINT_BACKEND = "pdf"
+try:
+    import win32com.client
+except ImportError:
+    win32com = None
 
 class RouteSheetApp:
     def __init__(self):
@@ -18,6 +38,15 @@ class RouteSheetApp:
         
         self.selected_files = []
         self.generated_files = []
+        self.printable_receipts = []
+        self.batch = None
+        self.batch_completed = 0
+        self.batch_files_completed = 0
+        self.batch_failed = 0
+        self.batch_duplicates = 0
+        self.batch_review = 0
+        self.timings_text = ""
+        self.timings_refreshed = 0.0
         
         # Configure grid layout
         self.root.grid_columnconfigure(0, weight=1)
@@ -53,7 +82,7 @@ class RouteSheetApp:
         # Action buttons container
         self.button_container = ctk.CTkFrame(self.main_container, fg_color="transparent")
         self.button_container.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
-        self.button_container.grid_columnconfigure((0, 1, 2), weight=1)
+        self.button_container.grid_columnconfigure((0, 1, 2, 3), weight=1)
         
         # Modern styled buttons with icons (using Unicode characters as simple icons)
         self.select_button = ctk.CTkButton(
@@ -90,6 +119,89 @@ class RouteSheetApp:
         )
         self.print_button.grid(row=0, column=2, padx=10, sticky="ew")
         
+        self.cancel_button = ctk.CTkButton(
+            self.button_container,
+            text="⏹️ Cancel",
+            command=self.cancel_processing,
+            height=45,
+            font=ctk.CTkFont(size=15),
+            state="disabled",
+            fg_color="#DC2626",
+            hover_color="#B91C1C"
+        )
+        self.cancel_button.grid(row=0, column=3, padx=10, sticky="ew")
+        
+        # Number of worker processes used for a batch
+        workers_frame = ctk.CTkFrame(self.button_container, fg_color="transparent")
+        workers_frame.grid(row=1, column=0, columnspan=4, padx=10, pady=(10, 0), sticky="w")
+        
+        workers_label = ctk.CTkLabel(
+            workers_frame,
+            text="Worker processes:",
+            font=ctk.CTkFont(size=14)
+        )
+        workers_label.pack(side="left", padx=(0, 10))
+        
+        max_workers = os.cpu_count() or 1
+        self.workers_var = ctk.StringVar(value=str(default_worker_count()))
+        self.workers_menu = ctk.CTkOptionMenu(
+            workers_frame,
+            values=[str(n) for n in range(1, max_workers + 1)],
+            variable=self.workers_var,
+            width=80
+        )
+        self.workers_menu.pack(side="left")
+        
+        # OCR cache controls
+        self.use_cache_var = ctk.BooleanVar(value=True)
+        self.use_cache_checkbox = ctk.CTkCheckBox(
+            workers_frame,
+            text="Use OCR cache",
+            variable=self.use_cache_var,
+            font=ctk.CTkFont(size=14)
+        )
+        self.use_cache_checkbox.pack(side="left", padx=(20, 10))
+        
+        # Receipts already processed from another file (re-scans) are skipped
+        self.skip_duplicates_var = ctk.BooleanVar(value=DEDUP)
+        self.skip_duplicates_checkbox = ctk.CTkCheckBox(
+            workers_frame,
+            text="Skip duplicates",
+            variable=self.skip_duplicates_var,
+            font=ctk.CTkFont(size=14)
+        )
+        self.skip_duplicates_checkbox.pack(side="left", padx=(0, 10))
+        
+        self.clear_cache_button = ctk.CTkButton(
+            workers_frame,
+            text="🗑️ Clear OCR Cache",
+            command=self.clear_ocr_cache,
+            width=150,
+            fg_color="#64748B",
+            hover_color="#475569"
+        )
+        self.clear_cache_button.pack(side="left")
+        
+        self.reports_button = ctk.CTkButton(
+            workers_frame,
+            text="📊 Reports",
+            command=self.open_reports,
+            width=120,
+            fg_color="#64748B",
+            hover_color="#475569"
+        )
+        self.reports_button.pack(side="left", padx=(10, 0))
+        
+        # Output mode: one workbook per receipt or one workbook per batch
+        self.output_mode_var = ctk.StringVar(value="One file per receipt")
+        self.output_mode_menu = ctk.CTkOptionMenu(
+            workers_frame,
+            values=["One file per receipt", "Single batch workbook"],
+            variable=self.output_mode_var,
+            width=200
+        )
+        self.output_mode_menu.pack(side="left", padx=(20, 0))
+        
         # Status section with modern styling
         self.status_frame = ctk.CTkFrame(self.main_container, height=40, fg_color="#F8FAFC")
         self.status_frame.grid(row=2, column=0, padx=20, pady=10, sticky="ew")
@@ -102,28 +214,44 @@ class RouteSheetApp:
         )
         self.status_label.pack(pady=10)
         
-        # Create tabview for data display and generated files
-        self.tabview = ctk.CTkTabview(self.main_container)
-        self.tabview.grid(row=3, column=0, padx=20, pady=10, sticky="nsew")
+        # Results: one table row per receipt, details of the selected row below
+        results_frame = ctk.CTkFrame(self.main_container, fg_color="transparent")
+        results_frame.grid(row=3, column=0, padx=20, pady=10, sticky="nsew")
+        results_frame.grid_columnconfigure(0, weight=1)
+        results_frame.grid_rowconfigure(0, weight=3)
+        results_frame.grid_rowconfigure(1, weight=1)
         self.main_container.grid_rowconfigure(3, weight=1)
         
-        # Add tabs
-        self.tabview.add("Processed Data")
-        self.tabview.add("Generated Files")
+        self.results_table = ResultsTable(
+            results_frame,
+            on_select=self.show_result_detail,
+            on_open=self.open_result_file
+        )
+        self.results_table.grid(row=0, column=0, sticky="nsew")
+        
+        detail_frame = ctk.CTkFrame(results_frame, fg_color="transparent")
+        detail_frame.grid(row=1, column=0, pady=(10, 0), sticky="nsew")
+        detail_frame.grid_columnconfigure(0, weight=1)
+        detail_frame.grid_rowconfigure(0, weight=1)
         
-        # Processed data display
+        # Processed data of the selected receipt
         self.data_display = ctk.CTkTextbox(
-            self.tabview.tab("Processed Data"),
+            detail_frame,
+            height=140,
             font=ctk.CTkFont(family="Courier", size=12)
         )
-        self.data_display.pack(fill="both", expand=True, padx=10, pady=10)
+        self.data_display.grid(row=0, column=0, sticky="nsew")
         
-        # Generated files list
-        self.files_frame = ctk.CTkScrollableFrame(
-            self.tabview.tab("Generated Files"),
-            label_text="Generated Route Sheets"
+        self.open_button = ctk.CTkButton(
+            detail_frame,
+            text="📄 Open Route Sheet",
+            command=lambda: self.open_result_file(self.results_table.selected_result()),
+            state="disabled",
+            fg_color="#3B82F6",
+            hover_color="#2563EB",
+            height=35
         )
-        self.files_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        self.open_button.grid(row=0, column=1, padx=(10, 0), sticky="n")
         
     def select_receipts(self):
         file_paths = filedialog.askopenfilenames(
@@ -142,62 +270,224 @@ class RouteSheetApp:
         self.process_button.configure(state="normal")
         
     def process_receipts(self):
+        if self.batch is not None:
+            return
+        
         self.generated_files = []
-        self.data_display.delete("1.0", "end")
+        self.printable_receipts = []
+        self.batch_completed = 0
+        self.batch_files_completed = 0
+        self.batch_failed = 0
+        self.batch_duplicates = 0
+        self.batch_review = 0
+        self.timings_text = ""
+        self.results_table.clear()
+        self.show_result_detail(None)
         
+        workbook_path = None
+        if self.output_mode_var.get() == "Single batch workbook":
+            workbook_path = filedialog.asksaveasfilename(
+                title="Save Batch Workbook",
+                initialdir=OUTPUT_DIR,
+                initialfile=f"Route_Sheets_Batch_{datetime.now().strftime('%m-%d-%Y')}.xlsx",
+                defaultextension=".xlsx",
+                filetypes=[("Excel Workbook", "*.xlsx")]
+            )
+            if not workbook_path:
+                return
+        
+        self.batch = BatchProcessor(
+            max_workers=int(self.workers_var.get()),
+            use_cache=self.use_cache_var.get(),
+            workbook_path=workbook_path,
+            dedup=self.skip_duplicates_var.get()
+        )
         try:
+            self.batch.start(self.selected_files)
+        except Exception as e:
+            self.batch = None
             self.status_label.configure(
-                text="⏳ Processing receipts...",
-                text_color="#2563EB"
+                text="❌ Error processing receipts",
+                text_color="#DC2626"
             )
-            self.root.update()
-            
-            for file_path in self.selected_files:
-                receipt_data = extract_receipt_text_to_json(file_path)
-                output_path = update_route_sheet_from_json(receipt_data)
-                self.generated_files.append(output_path)
-                
-                # Display receipt data
-                self.data_display.insert("end", f"\n=== {os.path.basename(file_path)} ===\n")
-                formatted_data = self.format_receipt_data(receipt_data)
-                self.data_display.insert("end", formatted_data + "\n")
-                
-                # Add file button to generated files tab
-                self.add_file_button(output_path)
+            messagebox.showerror("Error", f"Failed to process receipts: {str(e)}")
+            return
+        
+        self.process_button.configure(state="disabled")
+        self.select_button.configure(state="disabled")
+        self.print_button.configure(state="disabled")
+        self.clear_cache_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self.update_progress()
+        self.root.after(100, self.poll_batch_results)
+        
+    def poll_batch_results(self):
+        """Drain results streamed back from the worker processes"""
+        if self.batch is None:
+            return
+        
+        for _ in range(MAX_RESULTS_PER_POLL):
+            try:
+                message = self.batch.results.get_nowait()
+            except queue.Empty:
+                break
             
+            if message["type"] == "result":
+                self.show_result(message["result"])
+                self.batch_files_completed = message["completed"]
+            elif message["type"] == "done":
+                self.finish_processing(message["cancelled"], message["error"], message["summary"])
+                return
+        
+        self.update_progress()
+        self.root.after(100, self.poll_batch_results)
+        
+    def show_result(self, result):
+        """Add a single receipt result to the results table as it arrives"""
+        if result["status"] == "cancelled":
+            return
+        
+        self.batch_completed += 1
+        if result["status"] == "error":
+            self.batch_failed += 1
+        elif result["status"] == "duplicate":
+            self.batch_duplicates += 1
+        elif needs_review(result):
+            self.batch_review += 1
+        
+        self.results_table.add_result(result)
+        
+        # Remember each generated file once (a batch workbook is shared)
+        if result["output_path"] and result["output_path"] not in self.generated_files:
+            self.generated_files.append(result["output_path"])
+        if result["status"] == "ok" and result["output_path"]:
+            self.printable_receipts.append(result["data"])
+        
+    def update_progress(self):
+        text = f"⏳ Processing receipts... {self.batch_files_completed}/{self.batch.total} files"
+        if self.batch_failed:
+            text += f" ({self.batch_failed} failed)"
+        if self.batch_duplicates:
+            text += f" ({self.batch_duplicates} duplicates skipped)"
+        if self.batch_review:
+            text += f" ({self.batch_review} to review)"
+        now = time.monotonic()
+        if self.batch_completed and now - self.timings_refreshed >= TIMINGS_REFRESH_SECONDS:
+            self.timings_text = format_summary(self.batch.metrics.summary())
+            self.timings_refreshed = now
+        if self.timings_text:
+            text += f"\n{self.timings_text}"
+        self.status_label.configure(text=text, text_color="#2563EB")
+        
+    def finish_processing(self, cancelled, error=None, summary=None):
+        total = self.batch.total
+        self.batch = None
+        self.process_button.configure(state="normal")
+        self.select_button.configure(state="normal")
+        self.clear_cache_button.configure(state="normal")
+        self.cancel_button.configure(state="disabled")
+        if self.generated_files:
+            self.print_button.configure(state="normal")
+        
+        succeeded = self.batch_completed - self.batch_failed - self.batch_duplicates
+        skipped = f", {self.batch_duplicates} duplicates skipped" if self.batch_duplicates else ""
+        if self.batch_review:
+            skipped += f", {self.batch_review} flagged for review"
+        if error:
+            self.status_label.configure(
+                text="❌ Error saving batch workbook",
+                text_color="#DC2626"
+            )
+            messagebox.showerror("Error", f"Failed to save batch workbook: {error}")
+        elif cancelled:
+            self.status_label.configure(
+                text=f"⏹️ Batch cancelled: {succeeded} receipts processed from {self.batch_files_completed}/{total} files{skipped}",
+                text_color="#D97706"
+            )
+        elif self.batch_failed:
+            self.status_label.configure(
+                text=f"⚠️ {succeeded}/{self.batch_completed} receipts processed, {self.batch_failed} failed{skipped}",
+                text_color="#DC2626"
+            )
+        elif self.batch_duplicates or self.batch_review:
+            self.status_label.configure(
+                text=f"✅ {succeeded}/{self.batch_completed} receipts processed{skipped}",
+                text_color="#059669"
+            )
+        else:
             self.status_label.configure(
                 text="✅ All receipts processed successfully",
                 text_color="#059669"
             )
-            self.print_button.configure(state="normal")
+        
+        # Per-stage timings of the run under the status message
+        timings = format_summary(summary) if summary and summary["receipts"] else ""
+        if timings and not error:
+            self.status_label.configure(text=f"{self.status_label.cget('text')}\n{timings}")
+        
+    def cancel_processing(self):
+        if self.batch is None:
+            return
+        self.batch.cancel()
+        self.cancel_button.configure(state="disabled")
+        self.status_label.configure(
+            text="⏹️ Cancelling... waiting for running receipts to finish",
+            text_color="#D97706"
+        )
             
-        except Exception as e:
+    def clear_ocr_cache(self):
+        try:
+            OCRCache().clear()
             self.status_label.configure(
-                text="❌ Error processing receipts",
-                text_color="#DC2626"
+                text="✅ OCR cache cleared",
+                text_color="#059669"
             )
-            messagebox.showerror("Error", f"Failed to process receipts: {str(e)}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to clear OCR cache: {str(e)}")
             
-    def add_file_button(self, file_path):
-        """Add a styled button for each generated file"""
-        button_frame = ctk.CTkFrame(self.files_frame, fg_color="transparent")
-        button_frame.pack(fill="x", pady=5)
-        
-        file_button = ctk.CTkButton(
-            button_frame,
-            text=f"📄 {os.path.basename(file_path)}",
-            command=lambda: webbrowser.open(file_path),
-            fg_color="#3B82F6",
-            hover_color="#2563EB",
-            height=35
-        )
-        file_button.pack(side="left", fill="x", expand=True, padx=(0, 5))
+    def open_reports(self):
+        try:
+            ReportWindow(self.root)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open reports: {str(e)}")
+            
+    def show_result_detail(self, result):
+        """Show the data (or error) of the selected receipt"""
+        self.data_display.delete("1.0", "end")
+        self.open_button.configure(state="disabled")
+        if result is None:
+            return
+        
+        self.data_display.insert("end", f"=== {os.path.basename(result['file_path'])} ===\n")
+        if result["status"] == "error":
+            self.data_display.insert("end", f"❌ Error: {result['error']}\n")
+        elif result["status"] == "duplicate":
+            self.data_display.insert("end", f"⏭️ Skipped: {result['error']}\n")
+            self.data_display.insert("end", f"{'earlier file'.ljust(20)}: {result['duplicate_of']}\n")
+        else:
+            if needs_review(result):
+                self.data_display.insert("end", f"⚠️ Check by hand: {'; '.join(result['data']['review'])}\n")
+            self.data_display.insert("end", self.format_receipt_data(result["data"]) + "\n")
+        if result["output_path"]:
+            self.data_display.insert("end", f"{'route sheet'.ljust(20)}: {result['output_path']}\n")
+            self.open_button.configure(state="normal")
+        
+    def open_result_file(self, result):
+        """Open the route sheet of a receipt"""
+        if result is not None and result["output_path"]:
+            webbrowser.open(result["output_path"])
         
     def format_receipt_data(self, data):
-        """Format receipt data for display"""
+        """Format receipt data for display, with the confidence and source line of each matched field"""
+        sources = data.get("field_sources", {})
         formatted_lines = []
         for key, value in data.items():
-            formatted_lines.append(f"{key.ljust(20)}: {value}")
+            if key == "field_sources":
+                continue
+            line = f"{key.ljust(20)}: {value}"
+            if key in sources:
+                line += f"  ({sources[key]['confidence']:.0%}, line {sources[key]['lines'][0]})"
+            formatted_lines.append(line)
         return "\n".join(formatted_lines)
         
     def print_route_sheets(self):
@@ -208,25 +498,16 @@ class RouteSheetApp:
             )
             self.root.update()
             
-            excel = win32com.client.Dispatch("Excel.Application")
-            excel.Visible = False
-            
-            for file in self.generated_files:
-                workbook = excel.Workbooks.Open(file)
-                sheet = workbook.Sheets(1)
-                
-                sheet.PageSetup.PrintArea = "A1:K44"
-                sheet.PageSetup.Zoom = False
-                sheet.PageSetup.FitToPagesWide = 1
-                sheet.PageSetup.FitToPagesTall = 1
-                
-                workbook.PrintOut()
-                workbook.Close(SaveChanges=False)
-                
-            excel.Quit()
+            metrics = MetricsRecorder(summary_path=None)
+            print_start = time.perf_counter()
+            if PRINT_BACKEND == "excel":
+                self.print_with_excel(metrics)
+                detail = ""
+            else:
+                detail = f"{self.print_pdf(metrics)} pages in one print job, "
             
             self.status_label.configure(
-                text="✅ All route sheets printed successfully",
+                text=f"✅ All route sheets printed successfully ({detail}{format_seconds(time.perf_counter() - print_start)})",
                 text_color="#059669"
             )
             
@@ -237,6 +518,54 @@ class RouteSheetApp:
             )
             messagebox.showerror("Error", f"Failed to print route sheets: {str(e)}")
             
+    def print_pdf(self, metrics):
+        """Render every route sheet into one PDF and print it as a single job"""
+        path = os.path.join(OUTPUT_DIR, f"Route_Sheets_{datetime.now().strftime('%m-%d-%Y_%H%M%S')}.pdf")
+        start = time.perf_counter()
+        write_route_sheet_pdf(self.printable_receipts, path)
+        render_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        print_pdf(path)
+        metrics.record({
+            "file_path": path,
+            "status": "printed",
+            "stages": [
+                {"stage": "render", "seconds": render_seconds},
+                {"stage": "print", "seconds": time.perf_counter() - start},
+            ],
+        })
+        return len(self.printable_receipts)
+        
+    def print_with_excel(self, metrics):
+        """Print each generated workbook through Excel, one job per route sheet"""
+        if win32com is None:
+            raise RuntimeError("Printing through Excel needs pywin32 and Microsoft Excel (Windows only).")
+        excel = win32com.client.Dispatch("Excel.Application")
+        excel.Visible = False
+        
+        for file in self.generated_files:
+            start = time.perf_counter()
+            workbook = excel.Workbooks.Open(file)
+            
+            # A batch workbook holds one route sheet per tab plus a summary
+            for sheet in workbook.Worksheets:
+                if sheet.Name == SUMMARY_SHEET_NAME:
+                    continue
+                sheet.PageSetup.PrintArea = PRINT_AREA
+                sheet.PageSetup.Zoom = False
+                sheet.PageSetup.FitToPagesWide = 1
+                sheet.PageSetup.FitToPagesTall = 1
+                sheet.PrintOut()
+                
+            workbook.Close(SaveChanges=False)
+            metrics.record({
+                "file_path": file,
+                "status": "printed",
+                "stages": [{"stage": "print", "seconds": time.perf_counter() - start}],
+            })
+            
+        excel.Quit()
+            
     def run(self):
         self.root.mainloop()
 
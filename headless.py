@@ -0,0 +1,558 @@
+"""
+Headless receipt processing: a one-shot batch over a directory, or a daemon
+that watches a scanner drop folder.
+
+Only the processing modules are imported here (no Tk, no Excel COM), so this
+runs on a Linux scan server:
+
+    python main.py batch SCANS_DIR --workers 8
+    python main.py batch SCANS_DIR --pdf route_sheets.pdf --print
+    python main.py watch INBOX_DIR --done-dir INBOX_DIR/done --failed-dir INBOX_DIR/failed
+    python main.py report --district Tri-Star --quarter 2025-Q1 --group-by unit
+    python main.py reparse --apply
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from batch_processing import (
+    BatchProcessor, default_worker_count, is_receipt_file, needs_review, process_file, result_name, result_status
+)
+from logging_setup import DEBUG_ENV_VAR, setup_logging
+from metrics import MetricsRecorder, format_summary
+from ocr_cache import OCRCache, file_content_hash
+from receipt_processing import DEDUP, OCR_PROFILES, OCR_QUALITY, SOURCE_PROFILES, reparse_record_store
+from record_store import (
+    COUNT_COLUMNS, DATE_FIELDS, GROUP_BY_EXPRESSIONS, RECORD_STORE_PATH, RecordStore, quarter_range
+)
+from route_sheet import OUTPUT_DIR
+from route_sheet_pdf import print_pdf, write_route_sheet_pdf
+
+# JSON-lines log with one entry per processed receipt
+RESULTS_LOG = os.path.join("data", "results.jsonl")
+
+# A dropped file must keep the same size and modification time for this long
+# before it is treated as completely written
+SETTLE_SECONDS = 2.0
+POLL_INTERVAL = 1.0
+
+_log_lock = threading.Lock()
+
+
+def append_result(log_path, result):
+    """
+    Append one receipt result to the JSON-lines results log.
+    """
+    entry = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "file": result["file_path"],
+        "pages": result.get("pages"),
+        "status": result["status"],
+        "output_path": result.get("output_path"),
+        "error": result.get("error"),
+        "duplicate_of": result.get("duplicate_of"),
+        "seconds": result.get("seconds"),
+        "data": result.get("data"),
+    }
+    with _log_lock:
+        directory = os.path.dirname(log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def move_to_folder(path, folder):
+    """
+    Move a file into ``folder`` and return its new path.
+
+    Safe to repeat: if the file is already gone nothing happens, and if an
+    identical file is already in ``folder`` the source is simply removed.
+    A different file with the same name is kept by adding a numeric suffix.
+    """
+    if not os.path.exists(path):
+        return None
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.basename(path)
+    target = os.path.join(folder, name)
+    if os.path.exists(target):
+        if file_content_hash(target) == file_content_hash(path):
+            os.remove(path)
+            return target
+        stem, extension = os.path.splitext(name)
+        counter = 2
+        while os.path.exists(target):
+            target = os.path.join(folder, f"{stem} ({counter}){extension}")
+            counter += 1
+    shutil.move(path, target)
+    return target
+
+
+def list_receipts(directory):
+    """
+    Return the receipt files directly inside ``directory``, sorted by name.
+    """
+    return sorted(
+        entry.path for entry in os.scandir(directory)
+        if entry.is_file() and is_receipt_file(entry.name)
+    )
+
+
+def result_message(result):
+    """
+    One line describing a receipt result: status, file and any error or
+    problems found by the consistency checks.
+    """
+    detail = "; ".join(result["data"]["review"]) if needs_review(result) else result["error"]
+    return f"{result_status(result):<9} {result_name(result)}" + (f": {detail}" if detail else "")
+
+
+def run_batch(directory, max_workers=None, use_cache=True, output_dir=OUTPUT_DIR,
+              workbook_path=None, results_log=RESULTS_LOG, dedup=DEDUP, quality=OCR_QUALITY, profile=None,
+              pdf_path=None, print_pdf_job=False, printer=None):
+    """
+    Process every receipt in ``directory`` once and return the number of
+    receipts that failed. Skipped duplicates and receipts flagged for review
+    do not count as failures.
+
+    With ``pdf_path`` the route sheets of all processed receipts are also
+    rendered into that one PDF, and with ``print_pdf_job`` it is sent to
+    ``printer`` (default printer if None) as a single print job.
+    """
+    file_paths = list_receipts(directory)
+    processor = BatchProcessor(
+        max_workers=max_workers, use_cache=use_cache, workbook_path=workbook_path, output_dir=output_dir,
+        dedup=dedup, quality=quality, profile=profile
+    )
+    start = time.perf_counter()
+    processor.start(file_paths)
+
+    completed = failed = duplicates = review = 0
+    summary = None
+    printable = []
+    while True:
+        message = processor.results.get()
+        if message["type"] == "done":
+            if message["error"]:
+                logging.error(f"Batch workbook could not be saved: {message['error']}")
+                print(f"Batch workbook could not be saved: {message['error']}")
+            summary = message["summary"]
+            break
+        result = message["result"]
+        append_result(results_log, result)
+        completed += 1
+        if result["status"] == "duplicate":
+            duplicates += 1
+        elif result["status"] != "ok":
+            failed += 1
+        elif needs_review(result):
+            review += 1
+        if result["status"] == "ok" and result["output_path"]:
+            printable.append(result["data"])
+        print(f"[{message['completed']}/{processor.total}] {result_message(result)}")
+
+    elapsed = time.perf_counter() - start
+    rate = completed / elapsed if elapsed else 0.0
+    print(
+        f"Processed {completed} receipt(s) from {processor.total} file(s) in {elapsed:.1f} s ({rate:.2f}/s), "
+        f"{failed} failed, {duplicates} skipped as duplicates, {review} flagged for review."
+    )
+    if summary and summary["receipts"]:
+        print(format_summary(summary))
+
+    if pdf_path and printable:
+        start = time.perf_counter()
+        write_route_sheet_pdf(printable, pdf_path)
+        print(f"Wrote {len(printable)} route sheet(s) to {pdf_path} in {time.perf_counter() - start:.1f} s.")
+        if print_pdf_job:
+            try:
+                print_pdf(pdf_path, printer)
+                print(f"Sent {pdf_path} to {printer or 'the default printer'} as one print job.")
+            except (OSError, RuntimeError) as e:
+                logging.error(f"Route sheets could not be printed: {e}")
+                print(f"Route sheets could not be printed: {e}")
+    return failed
+
+
+def init_daemon_worker():
+    """
+    Set up a daemon worker process. Ctrl+C reaches every process attached to
+    the console, so workers ignore it and finish the receipt in progress; the
+    daemon decides when to stop.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging()
+
+
+class HotFolderDaemon:
+    """
+    Watch a drop folder and process receipts as they arrive.
+
+    Files are picked up once their size and modification time have been
+    stable for ``settle_seconds`` (scanners write files incrementally), run on
+    a pool of worker processes, logged to the results log and then moved to
+    ``done_dir``, ``failed_dir`` or (skipped duplicates) ``duplicates_dir``. Stage timings are recorded with a
+    ``MetricsRecorder`` and summarized when the daemon stops.
+    """
+
+    def __init__(self, inbox, done_dir=None, failed_dir=None, duplicates_dir=None, max_workers=None,
+                 use_cache=True, output_dir=OUTPUT_DIR, results_log=RESULTS_LOG, settle_seconds=SETTLE_SECONDS,
+                 poll_interval=POLL_INTERVAL, dedup=DEDUP, quality=OCR_QUALITY, profile=None):
+        self.inbox = inbox
+        self.done_dir = done_dir or os.path.join(inbox, "done")
+        self.failed_dir = failed_dir or os.path.join(inbox, "failed")
+        self.duplicates_dir = duplicates_dir or os.path.join(inbox, "duplicates")
+        self.max_workers = max_workers or default_worker_count()
+        self.use_cache = use_cache
+        self.output_dir = output_dir
+        self.results_log = results_log
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.dedup = dedup
+        self.quality = quality
+        self.profile = profile
+        self.metrics = MetricsRecorder()
+
+        # path -> (size, mtime, time first seen with that size and mtime)
+        self._candidates = {}
+        self._in_flight = set()
+        self._completed = queue.Queue()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """
+        Ask the daemon to stop after the receipts in progress finish.
+        """
+        self._stop.set()
+
+    def find_ready_files(self, now=None):
+        """
+        Return inbox files that have finished being written and are not yet
+        being processed.
+        """
+        now = time.monotonic() if now is None else now
+        ready = []
+        present = set()
+        for path in list_receipts(self.inbox):
+            present.add(path)
+            if path in self._in_flight:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            previous = self._candidates.get(path)
+            if previous is None or previous[:2] != signature:
+                self._candidates[path] = signature + (now,)
+                continue
+            if stat.st_size > 0 and now - previous[2] >= self.settle_seconds and self._can_open(path):
+                ready.append(path)
+
+        # Forget files that disappeared before they settled
+        for path in list(self._candidates):
+            if path not in present:
+                del self._candidates[path]
+        return ready
+
+    @staticmethod
+    def _can_open(path):
+        # On Windows a file still held open by the scanner cannot be opened
+        try:
+            with open(path, "rb"):
+                return True
+        except OSError:
+            return False
+
+    def _finish(self, file_path, results):
+        for result in results:
+            append_result(self.results_log, result)
+            self.metrics.record(result)
+            print(result_message(result))
+
+        # A multi-receipt PDF counts as done if any of its receipts was processed
+        statuses = {result["status"] for result in results}
+        if "ok" in statuses:
+            folder = self.done_dir
+        elif statuses == {"duplicate"}:
+            folder = self.duplicates_dir
+        else:
+            folder = self.failed_dir
+        try:
+            moved_to = move_to_folder(file_path, folder)
+            logging.info(f"Moved {file_path} to {moved_to}.")
+        except OSError as e:
+            logging.error(f"Unable to move {file_path} to {folder}: {e}")
+
+    def _drain_completed(self):
+        while True:
+            try:
+                file_path, future = self._completed.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results = future.result()
+            except Exception as e:
+                # The worker process itself died
+                results = [{"file_path": file_path, "status": "error", "data": None,
+                            "output_path": None, "error": str(e), "stages": []}]
+            self._finish(file_path, results)
+            self._in_flight.discard(file_path)
+            self._candidates.pop(file_path, None)
+
+    def run(self):
+        """
+        Watch the inbox until ``stop()`` is called or Ctrl+C is pressed. The
+        receipts in progress are then finished, logged and moved before the
+        metrics summary is written.
+        """
+        os.makedirs(self.inbox, exist_ok=True)
+        logging.info(f"Watching {self.inbox} with {self.max_workers} worker(s).")
+        print(f"Watching {self.inbox} with {self.max_workers} worker(s). Press Ctrl+C to stop.")
+        # Ctrl+C only asks the loop to stop, so it cannot interrupt moving a
+        # finished receipt or skip the final drain
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_daemon_worker) as executor:
+                while not self._stop.is_set():
+                    self._drain_completed()
+                    for path in self.find_ready_files():
+                        self._in_flight.add(path)
+                        future = executor.submit(
+                            process_file, path, self.use_cache, True, self.output_dir, self.dedup, self.quality,
+                            self.profile
+                        )
+                        future.add_done_callback(lambda f, path=path: self._completed.put((path, f)))
+                    self._stop.wait(self.poll_interval)
+
+                print("Stopping: waiting for receipts in progress...")
+            self._drain_completed()
+        finally:
+            if previous_handler is not None:
+                signal.signal(signal.SIGINT, previous_handler)
+
+        summary = self.metrics.write_summary()
+        if summary["receipts"]:
+            print(format_summary(summary))
+
+
+def format_table(rows, columns):
+    """
+    Format rows (dicts) as a plain-text table with the given columns.
+    """
+    cells = [[("" if row.get(column) is None else str(row.get(column))) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    for row in cells:
+        lines.append("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+    return "\n".join(lines)
+
+
+def run_report(args):
+    """
+    Print an aggregate report (or the matching records) from the record store.
+    """
+    start, end = args.start, args.end
+    if args.quarter:
+        match = re.fullmatch(r"(\d{4})-?Q([1-4])", args.quarter.upper())
+        if not match:
+            print(f"Invalid quarter '{args.quarter}'; expected e.g. 2025-Q1.")
+            return 2
+        start, end = quarter_range(int(match.group(1)), int(match.group(2)))
+
+    with RecordStore(args.database) as store:
+        if args.import_cache:
+            print(f"Imported {store.import_ocr_cache(OCRCache())} record(s) from the OCR cache.")
+
+        filters = dict(
+            district=args.district, unit=args.unit, program=args.program, start=start, end=end,
+            date_field=args.date_field,
+        )
+        if args.records:
+            rows = store.query(tx_number=args.tx, limit=args.limit, **filters)
+            columns = [
+                "receipt_date", "effective_date", "district_name", "local_unit_number", "program", "tx_number"
+            ]
+        else:
+            rows = store.aggregate(group_by=args.group_by, **filters)
+            columns = list(args.group_by) + ["receipts"]
+
+    # Only the count columns that are used anywhere in the report
+    columns += [column for column in COUNT_COLUMNS.values() if any(row.get(column) for row in rows)]
+    if args.records:
+        columns.append("file_path")
+
+    if args.format == "json":
+        print(json.dumps([{column: row.get(column) for column in columns} for row in rows], indent=4))
+    elif args.format == "csv":
+        writer = csv.DictWriter(sys.stdout, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    elif rows:
+        print(format_table(rows, columns))
+    else:
+        print("No matching receipts.")
+    return 0
+
+
+def run_reparse(args):
+    """
+    Re-parse the stored OCR text of every receipt in the record store with
+    the current field rules and print what changes (and, with --apply,
+    update the records).
+    """
+    with RecordStore(args.database) as store:
+        summary = reparse_record_store(store, apply=args.apply, examples=args.examples)
+
+    if args.format == "json":
+        print(json.dumps(summary, indent=4))
+        return 0
+    receipts = summary["receipts"]
+    per_receipt = summary["seconds"] / receipts * 1000 if receipts else 0
+    print(
+        f"Re-parsed {receipts} receipt(s) in {summary['seconds']:.2f} s ({per_receipt:.2f} ms each); "
+        f"{summary['changed']} {'updated' if args.apply else 'would change'}."
+    )
+    if summary["fields"]:
+        rows = [{"field": field, "receipts": count} for field, count in sorted(summary["fields"].items())]
+        print()
+        print(format_table(rows, ["field", "receipts"]))
+        for field, examples in sorted(summary["examples"].items()):
+            print(f"\n{field}:")
+            for example in examples:
+                print(f"  {example['file_path']}: {example['old']!r} -> {example['new']!r}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Process receipts into route sheets without the GUI.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_logging(subparser):
+        subparser.add_argument("-v", "--verbose", action="store_true", help="log progress to the console")
+        subparser.add_argument("--debug", action="store_true", help="debug logging, including every OCR line")
+
+    def add_common(subparser):
+        subparser.add_argument("--workers", type=int, default=None,
+                               help=f"worker processes (default {default_worker_count()})")
+        subparser.add_argument("--output-dir", default=OUTPUT_DIR, help="folder for generated route sheets")
+        subparser.add_argument("--results-log", default=RESULTS_LOG, help="JSON-lines results log")
+        subparser.add_argument("--no-cache", action="store_true", help="bypass the OCR cache")
+        subparser.add_argument("--allow-duplicates", action="store_true",
+                               help="process receipts even if they were already processed from another file")
+        subparser.add_argument("--ocr-quality", choices=("tiered", "full"), default=OCR_QUALITY,
+                               help="tiered: a fast OCR pass first, full quality only for receipts that fail the "
+                                    f"consistency checks; full: always full quality (default {OCR_QUALITY})")
+        subparser.add_argument("--ocr-profile", choices=list(OCR_PROFILES),
+                               help="Tesseract profile for every receipt, e.g. for a drop folder fed by one "
+                                    "scanner (default by source: "
+                                    + ", ".join(f"{source} {name}" for source, name in SOURCE_PROFILES.items()) + ")")
+        add_logging(subparser)
+
+    batch = subparsers.add_parser("batch", help="process every receipt in a directory once")
+    batch.add_argument("directory", help="directory containing receipt images or PDFs")
+    batch.add_argument("--workbook", help="write all route sheets into this single workbook")
+    batch.add_argument("--pdf", help="also render all route sheets into this single PDF, one page per receipt")
+    batch.add_argument("--print", dest="print_pdf", action="store_true",
+                       help="send the --pdf file to the printer as one print job (lp/lpr, or Windows shell print)")
+    batch.add_argument("--printer", help="printer for --print (default printer if omitted)")
+    add_common(batch)
+
+    watch = subparsers.add_parser("watch", help="watch a drop folder and process receipts as they arrive")
+    watch.add_argument("inbox", help="folder the scanner drops receipts into")
+    watch.add_argument("--done-dir", help="where processed receipts are moved (default INBOX/done)")
+    watch.add_argument("--failed-dir", help="where failed receipts are moved (default INBOX/failed)")
+    watch.add_argument("--duplicates-dir",
+                       help="where skipped duplicate receipts are moved (default INBOX/duplicates)")
+    watch.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                       help="seconds a file must be unchanged before it is processed")
+    watch.add_argument("--poll", type=float, default=POLL_INTERVAL, help="seconds between folder scans")
+    add_common(watch)
+
+    report = subparsers.add_parser("report", help="report line-item totals from the record store")
+    report.add_argument("--district", help="only this district, e.g. Tri-Star")
+    report.add_argument("--unit", help="only this unit number")
+    report.add_argument("--program", help="only this program, e.g. 'Cub Scouts'")
+    report.add_argument("--from", dest="start", help="first date (YYYY-MM-DD, inclusive)")
+    report.add_argument("--to", dest="end", help="last date (YYYY-MM-DD, inclusive)")
+    report.add_argument("--quarter", help="a calendar quarter instead of --from/--to, e.g. 2025-Q1")
+    report.add_argument("--date-field", choices=DATE_FIELDS, default="effective_date",
+                        help="date the range applies to (default effective_date)")
+    report.add_argument("--group-by", nargs="+", choices=list(GROUP_BY_EXPRESSIONS), default=["district"],
+                        help="dimensions to total by (default district)")
+    report.add_argument("--records", action="store_true", help="list the matching receipts instead of totals")
+    report.add_argument("--tx", help="with --records, only the receipt with this TX#")
+    report.add_argument("--limit", type=int, help="with --records, at most this many receipts")
+    report.add_argument("--format", choices=("table", "csv", "json"), default="table")
+    report.add_argument("--import-cache", action="store_true",
+                        help="first add every receipt in the OCR cache to the record store")
+    report.add_argument("--database", default=RECORD_STORE_PATH, help="record store path")
+    add_logging(report)
+
+    reparse = subparsers.add_parser(
+        "reparse", help="re-parse the stored OCR text of every receipt with the current field rules"
+    )
+    reparse.add_argument("--apply", action="store_true",
+                         help="update the changed records (default: only report what would change)")
+    reparse.add_argument("--examples", type=int, default=3, help="changes to show per field")
+    reparse.add_argument("--format", choices=("table", "json"), default="table")
+    reparse.add_argument("--database", default=RECORD_STORE_PATH, help="record store path")
+    add_logging(reparse)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.debug:
+        # Inherited by the worker processes, which configure their own logging
+        os.environ[DEBUG_ENV_VAR] = "1"
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    if args.verbose:
+        console = logging.StreamHandler()
+        console.setLevel(logging.INFO)
+        console.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        logging.getLogger().addHandler(console)
+
+    if args.command == "report":
+        return run_report(args)
+
+    if args.command == "reparse":
+        return run_reparse(args)
+
+    if args.command == "batch":
+        failed = run_batch(
+            args.directory, max_workers=args.workers, use_cache=not args.no_cache,
+            output_dir=args.output_dir, workbook_path=args.workbook, results_log=args.results_log,
+            dedup=DEDUP and not args.allow_duplicates, quality=args.ocr_quality, profile=args.ocr_profile,
+            pdf_path=args.pdf, print_pdf_job=args.print_pdf, printer=args.printer
+        )
+        return 1 if failed else 0
+
+    daemon = HotFolderDaemon(
+        args.inbox, done_dir=args.done_dir, failed_dir=args.failed_dir, duplicates_dir=args.duplicates_dir,
+        max_workers=args.workers, use_cache=not args.no_cache, output_dir=args.output_dir,
+        results_log=args.results_log, settle_seconds=args.settle, poll_interval=args.poll,
+        dedup=DEDUP and not args.allow_duplicates, quality=args.ocr_quality, profile=args.ocr_profile
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        daemon.stop()
+    return 0
@@ -0,0 +1,310 @@
+import logging
+import math
+import time
+
+import numpy as np
+from PIL import Image
+
+# Default parameters of the preprocessing steps
+DEFAULT_PARAMS = {
+    # Height in pixels of a text line's ink band that Tesseract reads best
+    # (capital height of roughly 30 px plus descenders)
+    "target_line_height": 40,
+    # Never scale by more or less than this, whatever the estimate says
+    "min_scale": 0.5,
+    "max_scale": 3.0,
+    # Percentiles mapped to black and white by contrast normalization
+    "contrast_low_percentile": 2,
+    "contrast_high_percentile": 98,
+    # Adaptive binarization: window size and how much darker than the local
+    # mean a pixel must be to count as ink
+    "binarize_window": 31,
+    "binarize_offset": 0.15,
+    # Deskew search range and resolution in degrees
+    "deskew_max_angle": 5.0,
+    "deskew_step": 0.25,
+    # Rows/columns with more ink than this are treated as scanner border
+    "border_ink_fraction": 0.8,
+    "crop_margin": 10,
+}
+
+# Typical height of a receipt text line's ink band in inches (~10 pt font)
+TYPICAL_LINE_HEIGHT_INCHES = 0.14
+
+
+def otsu_threshold(gray):
+    """
+    Return the Otsu threshold of a uint8 grayscale array.
+    """
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    cum_mean = np.cumsum(hist * levels)
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def ink_mask(gray):
+    """
+    Return a boolean mask of dark (ink) pixels using a global Otsu threshold.
+    """
+    return gray < otsu_threshold(gray)
+
+
+def estimate_line_height(gray):
+    """
+    Estimate the median height in pixels of the text lines in an image.
+
+    Rows containing ink are grouped into runs; each run is one text line.
+    Returns None when no text lines are found.
+    """
+    ink = ink_mask(gray)
+    # Ignore rows with only a few specks of noise
+    rows = ink.sum(axis=1) > max(2, ink.shape[1] // 500)
+    # Start and end indices of runs of inked rows
+    edges = np.diff(np.concatenate(([0], rows.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    heights = ends - starts
+    heights = heights[heights >= 3]
+    if heights.size == 0:
+        return None
+    return float(np.median(heights))
+
+
+def to_grayscale(image, context):
+    """
+    Convert the input PIL image to a uint8 grayscale array.
+    """
+    return np.asarray(image.convert("L"), dtype=np.uint8)
+
+
+def normalize_contrast(gray, context):
+    """
+    Stretch intensities so the low/high percentiles map to black/white.
+    """
+    params = context["params"]
+    low, high = np.percentile(
+        gray, (params["contrast_low_percentile"], params["contrast_high_percentile"])
+    )
+    if high - low < 1:
+        return gray
+    stretched = (gray.astype(np.float32) - low) * (255.0 / (high - low))
+    return np.clip(stretched, 0, 255).astype(np.uint8)
+
+
+def estimate_skew_angle(ink, max_angle, step):
+    """
+    Return the skew angle in degrees that makes text lines horizontal.
+
+    Ink pixels are projected onto the vertical axis along each candidate angle;
+    the angle giving the sharpest projection profile wins.
+    """
+    ys, xs = np.nonzero(ink)
+    if ys.size == 0:
+        return 0.0
+    # Subsample large images; the profile shape is what matters
+    stride = max(1, ys.size // 200000)
+    ys = ys[::stride].astype(np.float64)
+    xs = xs[::stride].astype(np.float64)
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    best_angle, best_score = 0.0, -1.0
+    for angle in angles:
+        projected = ys - xs * math.tan(math.radians(angle))
+        projected = np.round(projected - projected.min()).astype(np.int64)
+        profile = np.bincount(projected).astype(np.float64)
+        score = float(np.dot(profile, profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(gray, context):
+    """
+    Rotate the image so text lines are horizontal.
+    """
+    params = context["params"]
+    # Estimate on a half-resolution mask to keep it cheap
+    angle = estimate_skew_angle(
+        ink_mask(gray[::2, ::2]), params["deskew_max_angle"], params["deskew_step"]
+    )
+    context["skew_angle"] = angle
+    if abs(angle) < 0.1:
+        return gray
+    rotated = Image.fromarray(gray).rotate(
+        angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255
+    )
+    return np.asarray(rotated, dtype=np.uint8)
+
+
+def _strip_border(fractions, max_fraction):
+    """
+    Return the (start, end) range left after removing leading and trailing
+    runs of near-solid ink (scanner border) along one axis.
+    """
+    border = fractions >= max_fraction
+    if border.all():
+        return 0, fractions.size
+    start = int(np.argmin(border))
+    end = fractions.size - int(np.argmin(border[::-1]))
+    return start, end
+
+
+def crop_borders(gray, context):
+    """
+    Crop dark scanner borders and empty margins around the receipt.
+    """
+    params = context["params"]
+    max_fraction = params["border_ink_fraction"]
+    margin = params["crop_margin"]
+    ink = ink_mask(gray)
+
+    top, bottom = _strip_border(ink.mean(axis=1), max_fraction)
+    left, right = _strip_border(ink.mean(axis=0), max_fraction)
+
+    # Tighten to the ink inside the border, keeping a small margin
+    inner = ink[top:bottom, left:right]
+    rows = np.flatnonzero(inner.any(axis=1))
+    cols = np.flatnonzero(inner.any(axis=0))
+    if rows.size and cols.size:
+        top, bottom = (
+            max(top + int(rows[0]) - margin, top),
+            min(top + int(rows[-1]) + margin + 1, bottom),
+        )
+        left, right = (
+            max(left + int(cols[0]) - margin, left),
+            min(left + int(cols[-1]) + margin + 1, right),
+        )
+    return gray[top:bottom, left:right]
+
+
+def rescale_to_line_height(gray, context):
+    """
+    Resize so text lines are close to the target line height.
+
+    Also records the estimated effective DPI of the input in the context.
+    """
+    params = context["params"]
+    line_height = estimate_line_height(gray)
+    context["line_height"] = line_height
+    if line_height is None:
+        return gray
+
+    context["estimated_dpi"] = round(line_height / TYPICAL_LINE_HEIGHT_INCHES)
+    scale = params["target_line_height"] / line_height
+    scale = min(max(scale, params["min_scale"]), params["max_scale"])
+    context["scale"] = scale
+    if abs(scale - 1.0) < 0.1:
+        return gray
+
+    height, width = gray.shape
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    resample = Image.Resampling.LANCZOS if scale > 1 else Image.Resampling.BOX
+    resized = Image.fromarray(gray).resize(size, resample)
+    return np.asarray(resized, dtype=np.uint8)
+
+
+def adaptive_binarize(gray, context):
+    """
+    Binarize with a local mean threshold (Bradley's method) using an integral
+    image, which copes with uneven lighting on photographed receipts.
+    """
+    params = context["params"]
+    window = params["binarize_window"]
+    half = window // 2
+    height, width = gray.shape
+
+    integral = np.zeros((height + 1, width + 1), dtype=np.int64)
+    np.cumsum(gray, axis=0, dtype=np.int64, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    # Edge padding clamps window corners to the image, so every window sum
+    # is four shifted slices of the padded integral image
+    padded = np.pad(integral, ((half, half + 1), (half, half + 1)), mode="edge")
+    window_sum = padded[window:window + height, window:window + width] - padded[:height, window:window + width]
+    window_sum -= padded[window:window + height, :width]
+    window_sum += padded[:height, :width]
+
+    rows = np.arange(height)
+    cols = np.arange(width)
+    row_extent = np.minimum(rows + half + 1, height) - np.maximum(rows - half, 0)
+    col_extent = np.minimum(cols + half + 1, width) - np.maximum(cols - half, 0)
+    area = (row_extent[:, None] * col_extent[None, :]).astype(np.float32)
+
+    # Ink where the pixel is darker than the local mean by the offset,
+    # compared without dividing by the window area
+    is_ink = gray * area < window_sum * np.float32(1.0 - params["binarize_offset"])
+    return np.where(is_ink, 0, 255).astype(np.uint8)
+
+
+DEFAULT_STEPS = (
+    to_grayscale,
+    normalize_contrast,
+    crop_borders,
+    deskew,
+    rescale_to_line_height,
+    adaptive_binarize,
+)
+
+
+class PreprocessingPipeline:
+    """
+    A chain of preprocessing steps run on NumPy arrays.
+
+    Each step is a callable ``step(array, context) -> array``; the first step
+    receives the PIL image instead of an array. ``context`` holds the
+    parameters under ``"params"`` and anything the steps want to record
+    (estimated DPI, skew angle, ...). Steps can be replaced, removed or
+    added by passing a different ``steps`` sequence.
+    """
+
+    def __init__(self, steps=DEFAULT_STEPS, params=None):
+        self.steps = list(steps)
+        self.params = dict(DEFAULT_PARAMS)
+        if params:
+            self.params.update(params)
+
+    def describe(self):
+        """
+        Return a JSON-serializable description of the pipeline (for cache keys).
+        """
+        return {"steps": [step.__name__ for step in self.steps], "params": self.params}
+
+    def run(self, image):
+        """
+        Run every step on a PIL image.
+
+        Returns the processed PIL image and a report with, for each step, the
+        time taken and the size of its output, plus the context values the
+        steps recorded.
+        """
+        context = {"params": self.params, "dpi": image.info.get("dpi")}
+        report = {"steps": []}
+        data = image
+        for step in self.steps:
+            start = time.perf_counter()
+            data = step(data, context)
+            elapsed = time.perf_counter() - start
+            height, width = data.shape[:2]
+            report["steps"].append({
+                "step": step.__name__,
+                "seconds": elapsed,
+                "width": int(width),
+                "height": int(height),
+                "bytes": int(data.nbytes),
+            })
+            logging.debug(
+                f"Preprocessing step {step.__name__}: {elapsed * 1000:.1f} ms, {width}x{height}"
+            )
+
+        for key in ("estimated_dpi", "line_height", "scale", "skew_angle"):
+            if key in context:
+                report[key] = context[key]
+        report["seconds"] = sum(entry["seconds"] for entry in report["steps"])
+        return Image.fromarray(data), report
@@ -0,0 +1,135 @@
+import logging
+import re
+
+import pytesseract
+from pytesseract import Output
+from PIL import Image
+
+# The locating pass runs on a downscaled copy of the page; it only has to find
+# the regions, not read them accurately
+LOCATE_SCALE = 0.5
+LOCATE_CONFIG = "--psm 4"
+# Regions are re-recognized at full resolution as uniform blocks of lines
+REGION_CONFIG = "--psm 6"
+# Padding added around each region, in multiples of the median line height
+REGION_PADDING = 0.75
+
+# "21 Youth BL x $15.00 (315.00)"
+LINE_ITEM_PATTERN = re.compile(r"^\s*\d+\s+(youth|adult)\b|\bx\s*\$\s*\d", re.IGNORECASE)
+
+
+def image_to_lines(image, lang, config, engine=None):
+    """
+    OCR an image with word boxes and group the words into text lines.
+
+    ``engine`` is an OCR engine from ``receipt_processing.get_ocr_engine``;
+    without one the image is passed to pytesseract directly.
+
+    Each line is a dict with its ``text``, its ``words`` (each with text,
+    box and confidence) sorted left to right, and its bounding ``box`` as
+    (left, top, right, bottom). Lines are returned top to bottom.
+    """
+    if engine is None:
+        data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=Output.DICT)
+    else:
+        data = engine.image_to_data(image, lang=lang, config=config)
+
+    grouped = {}
+    for i, text in enumerate(data["text"]):
+        text = text.strip()
+        if not text or float(data["conf"][i]) < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        grouped.setdefault(key, []).append({
+            "text": text,
+            "left": data["left"][i],
+            "top": data["top"][i],
+            "right": data["left"][i] + data["width"][i],
+            "bottom": data["top"][i] + data["height"][i],
+            "conf": float(data["conf"][i]),
+        })
+
+    lines = []
+    for words in grouped.values():
+        words.sort(key=lambda word: word["left"])
+        box = (
+            min(word["left"] for word in words),
+            min(word["top"] for word in words),
+            max(word["right"] for word in words),
+            max(word["bottom"] for word in words),
+        )
+        lines.append({"text": " ".join(word["text"] for word in words), "words": words, "box": box})
+    lines.sort(key=lambda line: (line["box"][1], line["box"][0]))
+    return lines
+
+
+def _union_box(lines, padding, width, height):
+    left = min(line["box"][0] for line in lines)
+    top = min(line["box"][1] for line in lines)
+    right = max(line["box"][2] for line in lines)
+    bottom = max(line["box"][3] for line in lines)
+    return (
+        max(int(left - padding), 0),
+        max(int(top - padding), 0),
+        min(int(right + padding), width),
+        min(int(bottom + padding), height),
+    )
+
+
+def find_regions(lines, customer_keywords, width, height):
+    """
+    Locate the line-item block and the customer/TX footer block.
+
+    Returns a dict mapping region name to its (left, top, right, bottom) box,
+    or None when either block cannot be found.
+    """
+    item_lines = [line for line in lines if LINE_ITEM_PATTERN.search(line["text"])]
+    if not item_lines:
+        return None
+
+    # The customer block sits below the line items
+    items_bottom = max(line["box"][3] for line in item_lines)
+    keywords = [keyword.lower() for keyword in customer_keywords]
+    customer_lines = [
+        line for line in lines
+        if line["box"][1] > items_bottom and any(keyword in line["text"].lower() for keyword in keywords)
+    ]
+    if not customer_lines:
+        return None
+
+    line_heights = sorted(line["box"][3] - line["box"][1] for line in lines)
+    padding = line_heights[len(line_heights) // 2] * REGION_PADDING
+    return {
+        "line_items": _union_box(item_lines, padding, width, height),
+        "customer": _union_box(customer_lines, padding, width, height),
+    }
+
+
+def ocr_layout_regions(image, lang, customer_keywords, engine=None, region_config=REGION_CONFIG):
+    """
+    OCR only the line-item and customer regions of a preprocessed receipt.
+
+    A cheap pass over a downscaled copy locates the regions; each region is
+    then cropped from the full-resolution image and re-recognized with
+    ``region_config`` (a line-oriented page segmentation mode, plus e.g. the
+    OCR profile's options). Returns a dict mapping region name
+    to its lines (see ``image_to_lines``), or None when the regions cannot be
+    located, in which case the caller should fall back to full-page OCR.
+    """
+    small = image.resize(
+        (max(1, int(image.width * LOCATE_SCALE)), max(1, int(image.height * LOCATE_SCALE))),
+        Image.Resampling.BOX,
+    )
+    located = image_to_lines(small, lang, LOCATE_CONFIG, engine)
+    regions = find_regions(located, customer_keywords, small.width, small.height)
+    if regions is None:
+        logging.info("Layout OCR: line-item or customer region not found.")
+        return None
+
+    result = {}
+    for name, box in regions.items():
+        full_box = tuple(int(coord / LOCATE_SCALE) for coord in box)
+        crop = image.crop(full_box)
+        logging.info(f"Layout OCR: {name} region {full_box} ({crop.width}x{crop.height})")
+        result[name] = image_to_lines(crop, lang, region_config, engine)
+    return result
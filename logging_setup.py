@@ -0,0 +1,65 @@
+"""
+Process-wide logging configuration.
+
+Log records are put on an in-memory queue and written to the log file by a
+background listener thread, so file I/O never happens on the thread doing
+the OCR. Each process (the GUI and every batch worker) has its own listener.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_PATH = os.path.join("data", "extract_receipt_debug.log")
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Set to "1" to log at DEBUG level, including every OCR line. An environment
+# variable rather than a constant so worker processes inherit it.
+DEBUG_ENV_VAR = "RECEIPT_DEBUG"
+
+_listener = None
+_queue_handler = None
+_listener_pid = None
+
+
+def debug_enabled():
+    """
+    Return True if verbose (per OCR line) debug logging was requested.
+    """
+    return os.environ.get(DEBUG_ENV_VAR) == "1"
+
+
+def setup_logging(log_path=LOG_PATH, level=None):
+    """
+    Send the root logger's records through a queue to ``log_path``.
+
+    Safe to call more than once. A forked worker process inherits the
+    parent's queue handler but not its listener thread, so the handler is
+    replaced there; pass this function as a process pool ``initializer``.
+    """
+    global _listener, _queue_handler, _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+
+    if level is None:
+        level = logging.DEBUG if debug_enabled() else logging.INFO
+
+    directory = os.path.dirname(log_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    file_handler = logging.FileHandler(log_path, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+    log_queue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_listener.stop)
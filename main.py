@@ -1,5 +1,13 @@
-from gui import RouteSheetApp
+import sys
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Command-line mode; imports nothing from the GUI or Excel COM
+        from headless import main
+
+        sys.exit(main())
+
+    from gui import RouteSheetApp
+
     app = RouteSheetApp()
     app.run()
@@ -0,0 +1,188 @@
+"""
+Per-receipt stage timings.
+
+``ReceiptMetrics`` collects the stages of one receipt (load/rasterize,
+preprocess, OCR, parse, template load, save, print) with their duration and,
+for image stages, the image dimensions and size. ``MetricsRecorder`` appends
+each receipt's stages to a JSON-lines file and summarizes a run as p50/p95
+per stage.
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_LOG = os.path.join("data", "metrics.jsonl")
+METRICS_SUMMARY = os.path.join("data", "metrics_summary.json")
+
+# Stages shown in the GUI status bar, in pipeline order
+STATUS_STAGES = ("load", "preprocess", "ocr", "parse", "save")
+
+
+def image_info(image):
+    """
+    Return the dimensions and uncompressed size of a PIL image.
+    """
+    return {
+        "width": image.width,
+        "height": image.height,
+        "bytes": image.width * image.height * len(image.getbands()),
+    }
+
+
+class ReceiptMetrics:
+    """
+    Timings of the processing stages of a single receipt.
+
+    Each stage is a dict with its ``stage`` name, ``seconds`` and any extra
+    information (e.g. ``width``, ``height`` and ``bytes`` of an image).
+    """
+
+    def __init__(self, stages=None):
+        self.stages = stages if stages is not None else []
+
+    @contextmanager
+    def stage(self, name, **info):
+        """
+        Time the body of a ``with`` block as stage ``name``.
+
+        Yields the stage dict so the block can add information that is only
+        known once the work is done.
+        """
+        entry = {"stage": name, **info}
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] = time.perf_counter() - start
+            self.stages.append(entry)
+
+    def add(self, name, seconds, **info):
+        """
+        Record a stage that was timed elsewhere.
+        """
+        self.stages.append({"stage": name, **info, "seconds": seconds})
+
+    def total_seconds(self):
+        return sum(entry["seconds"] for entry in self.stages)
+
+
+def percentile(values, pct):
+    """
+    Return the ``pct`` percentile of ``values`` (nearest-rank method).
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(records):
+    """
+    Summarize recorded receipts as count, p50, p95, mean and total seconds
+    per stage, plus the same for the whole receipt.
+    """
+    per_stage = {}
+    totals = []
+    for record in records:
+        totals.append(record["total_seconds"])
+        receipt_stages = {}
+        for entry in record["stages"]:
+            # A stage can run more than once per receipt (e.g. region OCR)
+            receipt_stages[entry["stage"]] = receipt_stages.get(entry["stage"], 0.0) + entry["seconds"]
+        for name, seconds in receipt_stages.items():
+            per_stage.setdefault(name, []).append(seconds)
+
+    def stats(values):
+        return {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "mean": sum(values) / len(values),
+            "total": sum(values),
+        }
+
+    return {
+        "receipts": len(records),
+        "receipt": stats(totals) if totals else None,
+        "stages": {name: stats(values) for name, values in per_stage.items()},
+    }
+
+
+def format_seconds(seconds):
+    if seconds < 1:
+        return f"{seconds * 1000:.0f} ms"
+    return f"{seconds:.2f} s"
+
+
+def format_summary(summary, stages=STATUS_STAGES):
+    """
+    Format a run summary as one line of p50/p95 per stage.
+    """
+    parts = [
+        f"{name} {format_seconds(summary['stages'][name]['p50'])}/{format_seconds(summary['stages'][name]['p95'])}"
+        for name in stages if name in summary["stages"]
+    ]
+    if not parts:
+        return ""
+    return "p50/p95: " + " · ".join(parts)
+
+
+class MetricsRecorder:
+    """
+    Append per-receipt stage timings to a JSON-lines file and keep them for a
+    run summary.
+
+    Thread-safe: batch results are recorded from the executor's callback
+    thread.
+    """
+
+    def __init__(self, log_path=METRICS_LOG, summary_path=METRICS_SUMMARY):
+        self.log_path = log_path
+        self.summary_path = summary_path
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        """
+        Record a receipt result (a dict with ``file_path``, ``status`` and
+        ``stages``) and append it to the metrics file.
+        """
+        stages = result.get("stages") or []
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "file": result["file_path"],
+            "status": result["status"],
+            "total_seconds": sum(entry["seconds"] for entry in stages),
+            "stages": stages,
+        }
+        with self._lock:
+            self.records.append(record)
+            if self.log_path:
+                directory = os.path.dirname(self.log_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        return record
+
+    def summary(self):
+        with self._lock:
+            return summarize(self.records)
+
+    def write_summary(self):
+        """
+        Write the run summary to ``summary_path`` and return it.
+        """
+        summary = self.summary()
+        if self.summary_path:
+            directory = os.path.dirname(self.summary_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.summary_path, "w") as f:
+                json.dump(summary, f, indent=4)
+        return summary
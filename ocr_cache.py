@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+# Default location and size limit of the on-disk OCR cache
+CACHE_DIR = os.path.join("data", "ocr_cache")
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Entries stored between full scans of the cache directory. In between, the
+# size is tracked from this process's own writes, so entries written by other
+# worker processes are only counted at the next scan.
+CACHE_RESCAN_PUTS = 100
+# Eviction frees space down to this share of the limit, so a full cache is
+# not scanned again on the very next store
+CACHE_EVICT_TO = 0.9
+
+
+def file_content_hash(path, chunk_size=1024 * 1024):
+    """
+    Return the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(content_hash, params):
+    """
+    Combine a file's content hash with the OCR parameters into a cache key.
+
+    ``params`` must be JSON-serializable (preprocessing settings, DPI,
+    Tesseract version and config, ...). Any change to them yields a new key.
+    """
+    payload = json.dumps({"content": content_hash, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class OCRCache:
+    """
+    Content-addressed on-disk cache of OCR results.
+
+    Each entry is a JSON file holding the raw OCR text and the parsed receipt
+    dict. Entries are written atomically so several worker processes can share
+    the cache. When the cache grows past ``max_bytes`` the least recently used
+    entries (by modification time, refreshed on every hit) are evicted.
+
+    The cache size is kept as a running total, so storing an entry does not
+    scan the directory. It is only scanned on the first store, when the
+    total goes over ``max_bytes`` and every ``rescan_puts`` stores.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, rescan_puts=CACHE_RESCAN_PUTS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.rescan_puts = rescan_puts
+        # The size total is per process, so a forked process needs its own cache
+        self.pid = os.getpid()
+        # Bytes in the cache as of the last scan plus this process's writes
+        # since, or None before the first scan
+        self._size = None
+        self._puts_since_scan = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        Return the cached entry for ``key``, or None on a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        logging.info(f"OCR cache hit: {key}")
+        return entry
+
+    def put(self, key, text, data, **extra):
+        """
+        Store the raw OCR text and parsed data for ``key``.
+        """
+        entry = {"text": text, "data": data}
+        entry.update(extra)
+        path = self._entry_path(key)
+        try:
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = 0
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        logging.info(f"OCR cache store: {key}")
+
+        self._puts_since_scan += 1
+        if self._size is not None:
+            self._size += size - replaced_size
+        if self._size is None or self._size > self.max_bytes or self._puts_since_scan >= self.rescan_puts:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries if the cache is larger than
+        ``max_bytes``, down to ``CACHE_EVICT_TO`` of it.
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        self._puts_since_scan = 0
+        self._size = total
+        if total <= self.max_bytes:
+            return
+
+        target = self.max_bytes * CACHE_EVICT_TO
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self._size = total
+                logging.info(f"OCR cache evicted: {os.path.basename(path)}")
+            except OSError:
+                pass
+
+    def entries(self):
+        """
+        Yield every readable cached entry.
+        """
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    with open(entry.path, "r", encoding="utf-8") as f:
+                        yield json.load(f)
+                except (OSError, ValueError):
+                    continue
+
+    def clear(self):
+        """
+        Delete every cached entry.
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = 0
+        self._puts_since_scan = 0
+        logging.info("OCR cache cleared.")
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.cache_dir) if name.endswith(".json"))
@@ -0,0 +1,147 @@
+"""
+Tesseract profiles for receipts.
+
+The generic English model weighs every word against a large dictionary, but
+a receipt uses a small known vocabulary: district names, unit types, line-item
+labels, a few fixed header and footer words, numbers and amounts. A profile
+adds Tesseract options to every OCR call: a user-words file and a user-patterns
+file generated from those tables, a character whitelist and the dictionary
+passes to skip. The options go into a Tesseract config file, which both OCR
+backends read, so values may contain spaces.
+"""
+import logging
+import os
+
+PROFILE_DIR = os.path.join("data", "ocr_profiles")
+
+# Fixed words printed on every receipt, besides the tables passed to
+# ``receipt_profile``
+RECEIPT_WORDS = (
+    "Scouting", "America", "Pathway", "to", "Adventure", "Council", "Arlington", "Heights", "Center", "for",
+    "Registration", "Subtotal", "Total", "Tax", "Check", "Balance", "Customer", "Signature", "member", "renewal",
+    "youth", "adult", "and", "Thank", "You", "For", "Shopping", "With", "Us", "TX#", "BSA", "B",
+)
+
+# Tesseract user patterns (\d is a digit, \c a letter, \n a letter or digit,
+# * repeats the previous character class)
+RECEIPT_PATTERNS = (
+    r"$\d*.\d\d",  # Price: $85.00
+    r"(\d*.\d\d)",  # Line amount: (1865.00)
+    r"\d*.\d\d",  # Subtotal, Total, Check amount
+    r"\d*.\d\d%",  # Tax rate: 6.25%
+    r"#\d*",  # Check #6031
+    r"\d\d/\d\d/\d\d\d\d",  # Receipt date
+    r"\d\d:\d\d:\d\d",  # Receipt time
+    r"\d\d\d-\d\d\d-\d\d\d\d",  # Phone number
+    r"\c\d\d\d\d",  # Unit code: T0965
+)
+
+# Characters that occur on receipts: letters, digits, spaces and the
+# punctuation of amounts, dates, names and addresses. Without the space every
+# word of a line runs together.
+RECEIPT_WHITELIST = (
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ abcdefghijklmnopqrstuvwxyz0123456789"
+    "$.,:;#()/-%&'!@+"
+)
+
+
+class OCRProfile:
+    """
+    Extra Tesseract options for a kind of receipt.
+
+    ``words`` and ``patterns`` are written to ``<name>.user-words`` and
+    ``<name>.user-patterns`` under ``directory`` when the profile is first
+    used, and all options to the Tesseract config file ``<name>.config``.
+    ``whitelist`` restricts the recognized characters and ``variables``
+    sets any other Tesseract variables (e.g. to disable the built-in
+    dictionaries). A profile without options adds nothing.
+    """
+
+    def __init__(self, name, words=(), patterns=(), whitelist=None, variables=None, directory=PROFILE_DIR):
+        self.name = name
+        self.words = tuple(dict.fromkeys(words))
+        self.patterns = tuple(dict.fromkeys(patterns))
+        self.whitelist = whitelist
+        self.variables = dict(variables or {})
+        self.directory = directory
+        self._config_path = None
+
+    def describe(self):
+        """
+        Return a JSON-serializable description of the profile (for cache keys).
+        """
+        return {
+            "name": self.name,
+            "words": list(self.words),
+            "patterns": list(self.patterns),
+            "whitelist": self.whitelist,
+            "variables": self.variables,
+        }
+
+    def _write(self, suffix, lines):
+        # The path goes into a Tesseract config string, where a space would
+        # split it, so it stays relative to the working directory like data/
+        path = os.path.join(self.directory, f"{self.name}.{suffix}").replace(os.sep, "/")
+        content = "".join(line + "\n" for line in lines)
+        try:
+            with open(path, encoding="utf-8") as f:
+                if f.read() == content:
+                    return path
+        except OSError:
+            pass
+        os.makedirs(self.directory, exist_ok=True)
+        # Written under a temporary name and renamed, as several worker
+        # processes may write the same file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        logging.info(f"Wrote OCR profile file {path}.")
+        return path
+
+    def config_path(self):
+        """
+        Return the path of the profile's Tesseract config file, or None if
+        the profile has no options. The files are written on first use.
+        """
+        if self._config_path is None:
+            variables = dict(self.variables)
+            if self.words:
+                variables["user_words_file"] = self._write("user-words", self.words)
+            if self.patterns:
+                variables["user_patterns_file"] = self._write("user-patterns", self.patterns)
+            if self.whitelist:
+                variables["tessedit_char_whitelist"] = self.whitelist
+            if not variables:
+                return None
+            self._config_path = self._write("config", [f"{name} {value}" for name, value in variables.items()])
+        return self._config_path
+
+    def apply(self, config):
+        """
+        Return the Tesseract ``config`` string with the profile's config
+        file added.
+        """
+        path = self.config_path()
+        return f"{config} {path}" if path else config
+
+
+def receipt_profile(districts, unit_keywords, line_item_labels, programs, name="receipt"):
+    """
+    Return the receipt profile: user words from the district names, unit
+    keywords, line-item labels and programs plus the fixed receipt words,
+    user patterns for amounts, dates and numbers, the receipt character
+    whitelist, and the system and frequent-word dictionaries turned off so
+    only those words (and numbers) get a dictionary bonus.
+    """
+    words = list(RECEIPT_WORDS)
+    for phrase in (*districts, *unit_keywords, *line_item_labels, *programs):
+        words.extend(phrase.replace("-", " ").split())
+        words.extend(phrase.split())
+    return OCRProfile(
+        name,
+        words=words,
+        patterns=RECEIPT_PATTERNS,
+        whitelist=RECEIPT_WHITELIST,
+        variables={"load_system_dawg": "0", "load_freq_dawg": "0"},
+    )
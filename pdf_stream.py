@@ -0,0 +1,126 @@
+"""
+Streaming of multi-receipt PDFs.
+
+A sheet-fed scanner puts a whole stack of receipts into one PDF. Its pages
+are rendered one at a time on a background thread, a few pages ahead of the
+OCR, so rendering overlaps with OCR and memory use does not grow with the
+page count. Receipt boundaries are found in the text of each page.
+"""
+import queue
+import re
+import threading
+
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+# Pages rendered ahead of the OCR. At most this many pages plus the one being
+# rendered and the one being OCR'd are in memory at a time.
+PREFETCH_PAGES = 2
+
+# The shop header starts a receipt and the footer ends it
+RECEIPT_START = re.compile(r"pathway\s+to\s+adventure|scouting\s+america|center\s+for\s+scouting", re.IGNORECASE)
+RECEIPT_END = re.compile(r"thank\s+you\s+for\s+shopping", re.IGNORECASE)
+
+# A page with fewer non-whitespace characters is blank (e.g. the back of a
+# duplex scan)
+MIN_PAGE_CHARS = 20
+
+
+def pdf_page_count(pdf_path):
+    """
+    Return the number of pages of a PDF.
+    """
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def render_pdf_page(pdf_path, page_number, dpi):
+    """
+    Render one page (1-based) of a PDF as a grayscale image.
+    """
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=True)
+    return images[0]
+
+
+def prefetch(items, depth=PREFETCH_PAGES):
+    """
+    Iterate over ``items`` on a background thread, at most ``depth`` items
+    ahead of the consumer.
+
+    Exceptions raised by ``items`` are re-raised in the consumer. Closing the
+    generator (or leaving a ``for`` loop over it early) stops the thread.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((end, e))
+            return
+        put((end, None))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def is_blank_page(text):
+    return len("".join(text.split())) < MIN_PAGE_CHARS
+
+
+class ReceiptSplitter:
+    """
+    Groups consecutive PDF pages into receipts.
+
+    A page showing the shop header starts a new receipt and a page showing
+    the footer ends one; pages with neither continue the open receipt, so a
+    receipt longer than a page stays together. Blank pages are dropped.
+    """
+
+    def __init__(self):
+        self._pages = []
+
+    def add_page(self, page_number, text):
+        """
+        Add the next page. Returns the receipts it completes, each a list of
+        (page number, text) pairs.
+        """
+        completed = []
+        if is_blank_page(text):
+            return completed
+        if self._pages and RECEIPT_START.search(text):
+            completed.append(self._pages)
+            self._pages = []
+        self._pages.append((page_number, text))
+        if RECEIPT_END.search(text):
+            completed.append(self._pages)
+            self._pages = []
+        return completed
+
+    def finish(self):
+        """
+        Return the receipt still open after the last page, if any.
+        """
+        pages, self._pages = self._pages, []
+        return [pages] if pages else []
@@ -0,0 +1,114 @@
+"""
+Self-consistency checks of extracted receipt data.
+
+A receipt prints every line item as "count label x $price (amount)", then a
+Subtotal of the amounts, so most OCR errors in the figures that matter show
+up as arithmetic that does not add up. ``check_receipt`` lists what does not;
+an empty list means the extraction can be trusted without a second look.
+"""
+import re
+
+# An amount as OCR reads it: "1865.00", "1,865.00", "12. 00", "65,00",
+# "12:00" or "2.40.00"
+AMOUNT = r"\d[\d,.]*[.,:]\s?\d{2}(?!\d)"
+LINE_ITEM = re.compile(
+    rf"(?<!\d)(?P<count>\d+)\s*(?P<label>[A-Za-z][A-Za-z ./-]*?)\s*[x×]\s*\$?\s*(?P<price>{AMOUNT})(?P<rest>.*)$"
+)
+SUBTOTAL = re.compile(r"\bsub\s*-?\s*total\b(?P<rest>.*)$", re.IGNORECASE)
+
+# Amounts are in dollars and cents
+AMOUNT_TOLERANCE = 0.005
+
+
+def parse_amount(text):
+    """
+    Parse an amount matched by ``AMOUNT`` into a float. The separator before
+    the last two digits is the decimal point; other separators group digits.
+    """
+    digits = re.sub(r"[^\d]", "", text)
+    return int(digits) / 100
+
+
+def last_amount(text):
+    amounts = re.findall(AMOUNT, text)
+    return parse_amount(amounts[-1]) if amounts else None
+
+
+def find_line_items(text):
+    """
+    Return the line items of a receipt's text as dicts with ``count``,
+    ``label``, ``price``, ``amount`` (None if not found) and the ``line``.
+    """
+    items = []
+    for line in text.splitlines():
+        match = LINE_ITEM.search(line.strip())
+        if match:
+            items.append({
+                "count": int(match.group("count")),
+                "label": " ".join(match.group("label").split()),
+                "price": parse_amount(match.group("price")),
+                "amount": last_amount(match.group("rest")),
+                "line": line.strip(),
+            })
+    return items
+
+
+def find_subtotal(text):
+    for line in text.splitlines():
+        match = SUBTOTAL.search(line)
+        if match:
+            return last_amount(match.group("rest"))
+    return None
+
+
+def check_receipt(text, data, price_field_for_label, require_subtotal=True):
+    """
+    Check the data parsed from a receipt's text against the receipt itself.
+
+    Returns a list of problems, empty if the receipt is consistent: a
+    district and unit were found, every line item's amount is its count
+    times its price, the amounts add up to the Subtotal and the parsed
+    counts of each price field match the line items. ``price_field_for_label``
+    maps a lowercase line-item label to its price field. Without
+    ``require_subtotal`` a text without a Subtotal line (e.g. from layout
+    OCR) passes the subtotal check.
+    """
+    problems = []
+    if not data.get("district_number"):
+        problems.append("district not found")
+    if not data.get("local_unit_number"):
+        problems.append("unit number not found")
+
+    items = find_line_items(text)
+    if not items:
+        problems.append("no line items found")
+        return problems
+
+    counts = {}
+    for item in items:
+        if item["amount"] is None:
+            problems.append(f"no amount on line item: {item['line']}")
+        elif abs(item["count"] * item["price"] - item["amount"]) > AMOUNT_TOLERANCE:
+            problems.append(
+                f"{item['count']} x {item['price']:.2f} is not {item['amount']:.2f}: {item['line']}"
+            )
+        field = price_field_for_label(item["label"].lower())
+        if field is None:
+            problems.append(f"unknown line item: {item['line']}")
+        else:
+            counts[field] = counts.get(field, 0) + item["count"]
+
+    subtotal = find_subtotal(text)
+    if subtotal is None:
+        if require_subtotal:
+            problems.append("subtotal not found")
+    elif all(item["amount"] is not None for item in items):
+        total = sum(item["amount"] for item in items)
+        if abs(total - subtotal) > AMOUNT_TOLERANCE:
+            problems.append(f"line items add up to {total:.2f}, subtotal is {subtotal:.2f}")
+
+    prices = data.get("prices", {})
+    for field in sorted(set(counts) | {field for field, count in prices.items() if count}):
+        if prices.get(field, 0) != counts.get(field, 0):
+            problems.append(f"{field} is {prices.get(field, 0)}, line items say {counts.get(field, 0)}")
+    return problems
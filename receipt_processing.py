@@ -1,171 +1,999 @@
 import pytesseract
 from pytesseract import Output
 from PIL import Image, ImageEnhance, ImageFilter
-from pdf2image import convert_from_path
 import json
 import os
 from datetime import datetime, timedelta
-import re
 import logging
-
-# Set up logging
-logging.basicConfig(
-    filename="data/extract_receipt_debug.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s"
+import shlex
+import sqlite3
+import subprocess
+import threading
+import time
+from functools import lru_cache
+from duplicates import DuplicateDetector, DuplicateReceiptError
+from field_rules import (
+    DISTRICT_MAP, LINE_ITEM_LABELS, PROGRAMS, UNIT_KEYWORDS, FieldMatcher, price_field_for_label
+)
+from ocr_cache import OCRCache, file_content_hash, make_cache_key
+from image_preprocessing import (
+    PreprocessingPipeline, crop_borders, normalize_contrast, rescale_to_line_height, to_grayscale
 )
+from layout_ocr import REGION_CONFIG, ocr_layout_regions
+from logging_setup import setup_logging
+from metrics import ReceiptMetrics, image_info
+from ocr_profiles import OCRProfile, receipt_profile
+from pdf_stream import ReceiptSplitter, is_blank_page, pdf_page_count, prefetch, render_pdf_page
+from receipt_checks import check_receipt
+from record_store import RecordStore, receipt_record
+
+try:
+    import tesserocr
+except ImportError:  # Optional; OCR falls back to the tesseract executable
+    tesserocr = None
 
 # Ensure data folder exists
 os.makedirs("data", exist_ok=True)
 
-def preprocess_image(image):
+# Set up logging (written by a background thread; DEBUG only on request)
+setup_logging()
+
+# OCR settings. These are all part of the OCR cache key, so changing any of
+# them invalidates previously cached results.
+PDF_DPI = 300  # Tesseract is tuned for ~300 DPI input
+PDF_TEXT_LAYER = True  # Use the embedded text of born-digital PDFs when present
+OCR_LANG = "eng"
+OCR_CONFIG = "--psm 4"
+# "tesserocr" keeps a Tesseract engine loaded in-process, "pytesseract" runs
+# the tesseract executable per image, "auto" prefers tesserocr if installed
+OCR_BACKEND = "auto"
+# "page" OCRs the whole page; "layout" locates the line-item and customer
+# blocks from word boxes and OCRs only those
+OCR_MODE = "page"
+# "numpy" selects the resolution-aware NumPy pipeline, "pillow" the original
+# fixed 2x Pillow chain configured by PREPROCESS_PARAMS
+PREPROCESSOR = "numpy"
+PREPROCESSING_PIPELINE = PreprocessingPipeline()
+PREPROCESS_PARAMS = {"scale": 2, "contrast": 3, "sharpen": True}
+# "tiered" first OCRs a receipt with a fast, low-resolution pass and re-OCRs
+# it at full quality only if the result fails the consistency checks (see
+# receipt_checks.py); "full" always OCRs at full quality
+OCR_QUALITY = "tiered"
+# Settings of the fast pass: a lower PDF resolution, no deskewing or
+# binarization, shorter text lines and no layout analysis
+FAST_PDF_DPI = 200
+FAST_PREPROCESSING_PIPELINE = PreprocessingPipeline(
+    steps=(to_grayscale, normalize_contrast, crop_borders, rescale_to_line_height),
+    params={"target_line_height": 28},
+)
+FAST_OCR_CONFIG = "--psm 6"
+
+# A text layer with fewer non-whitespace characters is treated as missing
+# (e.g. a scanned PDF with only an empty or stray text object)
+MIN_TEXT_LAYER_CHARS = 20
+
+# Bump when the field parser changes so cached entries are re-parsed
+PARSER_VERSION = 5
+
+# Save every extracted receipt to the record store (data/receipts.sqlite3)
+RECORD_STORE = True
+
+# Split scanner PDFs with more than one page into receipts (see pdf_stream.py)
+SPLIT_MULTI_PAGE_PDFS = True
+
+# Skip receipts already processed from another file (a re-scan, or a photo and
+# a PDF of the same receipt); needs the record store
+DEDUP = True
+
+# Route sheet price fields and their cells
+PRICE_FIELDS = {
+    "Youth Registration": "C9",
+    "Youth SL Subscription": "C10",
+    "Youth Transfer": "C11",
+    "Adult Registration": "C12",
+    "Multiple/Position Change": "C13",
+    "Adult Transfer": "C14",
+    "Adult SL Subscription": "C15",
+    "Youth Exploring": "C16",
+    "Adult Exploring": "C17",
+    "Program Fee": "C18",
+}
+
+# Receipt fields, compiled once from the rule tables in field_rules.py (the
+# districts, unit and program keywords and line-item labels)
+FIELD_MATCHER = FieldMatcher()
+
+# Tesseract options per kind of receipt (see ocr_profiles.py): "default" is
+# the generic English model as is, "receipt" constrains it to the receipts'
+# vocabulary and characters. Part of the OCR cache key.
+OCR_PROFILES = {
+    "default": OCRProfile("default"),
+    "receipt": receipt_profile(DISTRICT_MAP, UNIT_KEYWORDS, LINE_ITEM_LABELS, PROGRAMS),
+}
+# Profile per receipt source: "pdf" for scanner PDFs, "image" for photos and
+# other image files. "receipt" is opt-in (here, or per run with --ocr-profile):
+# it did not improve accuracy on the benchmark corpus (see
+# benchmarks/bench_ocr_profiles.py), and changing the default would change the
+# OCR output of existing installs.
+SOURCE_PROFILES = {"pdf": "default", "image": "default"}
+
+def receipt_source(receipt_path):
+    """
+    Return the source of a receipt file ("pdf" or "image").
     """
-    Preprocess the image to improve OCR accuracy.
+    return "pdf" if receipt_path.lower().endswith(".pdf") else "image"
+
+def get_ocr_profile(receipt_path, profile=None):
+    """
+    Return the OCR profile named ``profile``, or by default the profile for
+    the source of ``receipt_path``.
     """
+    return OCR_PROFILES[profile or SOURCE_PROFILES[receipt_source(receipt_path)]]
+
+def preprocess_image(image, preprocessor=PREPROCESSOR, pipeline=None):
+    """
+    Preprocess the image to improve OCR accuracy, with ``pipeline`` (by
+    default ``PREPROCESSING_PIPELINE``) unless ``preprocessor`` is "pillow".
+    """
+    if preprocessor == "pillow":
+        return preprocess_image_pillow(image)
+
     logging.info("Preprocessing image for OCR.")
+    image, report = (pipeline or PREPROCESSING_PIPELINE).run(image)
+    logging.info(
+        f"Image preprocessing complete in {report['seconds'] * 1000:.0f} ms "
+        f"({image.width}x{image.height}, estimated {report.get('estimated_dpi')} DPI, "
+        f"skew {report.get('skew_angle', 0):.2f} deg)."
+    )
+    return image
+
+def preprocess_image_pillow(image):
+    """
+    Preprocess the image with the original Pillow chain: grayscale, fixed
+    upscale, contrast boost and sharpening.
+    """
+    logging.info("Preprocessing image for OCR (Pillow).")
     # Convert to grayscale
     image = image.convert("L")
     # Resize the image for better OCR
-    image = image.resize((image.width * 2, image.height * 2), Image.Resampling.LANCZOS)  # Use LANCZOS instead of ANTIALIAS
+    scale = PREPROCESS_PARAMS["scale"]
+    image = image.resize((image.width * scale, image.height * scale), Image.Resampling.LANCZOS)  # Use LANCZOS instead of ANTIALIAS
     # Enhance contrast
     enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(3)
+    image = enhancer.enhance(PREPROCESS_PARAMS["contrast"])
     # Apply sharpening filter
-    image = image.filter(ImageFilter.SHARPEN)
+    if PREPROCESS_PARAMS["sharpen"]:
+        image = image.filter(ImageFilter.SHARPEN)
     logging.info("Image preprocessing complete.")
     return image
 
-def extract_receipt_text_to_json(receipt_path):
+# Columns of Tesseract's TSV output, as returned by image_to_data
+TSV_COLUMNS = (
+    "level", "page_num", "block_num", "par_num", "line_num", "word_num",
+    "left", "top", "width", "height", "conf", "text",
+)
+
+def read_tesseract_config_file(path):
     """
-    Extract text from receipt (PDF or image) using OCR and save it as a JSON file.
+    Read the variables of a Tesseract config file: one "name value" per
+    line, where the value is the rest of the line.
     """
+    variables = {}
     try:
-        logging.info(f"Processing receipt: {receipt_path}")
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                name, _, value = line.partition(" ")
+                variables[name] = value.lstrip()
+    except OSError as e:
+        logging.warning(f"Unable to read Tesseract config file {path}: {e}")
+    return variables
 
-        # Convert PDF to image if necessary
-        if receipt_path.lower().endswith(".pdf"):
-            logging.info("Detected PDF. Converting to image.")
-            try:
-                images = convert_from_path(receipt_path, dpi=400)
-                image = images[0]  # Use the first page
-            except Exception as e:
-                logging.error(f"Error converting PDF to image: {e}")
-                raise RuntimeError("Failed to process receipt: Unable to convert PDF to image.")
+def parse_tesseract_config(config):
+    """
+    Split a tesseract command-line config string (e.g. "--psm 4 -c name=value",
+    optionally followed by config file paths) into its page segmentation
+    mode, engine mode and variables.
+    """
+    psm = oem = None
+    variables = {}
+    tokens = shlex.split(config or "")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ("--psm", "--oem", "-c") and i + 1 < len(tokens):
+            value = tokens[i + 1]
+            if token == "--psm":
+                psm = int(value)
+            elif token == "--oem":
+                oem = int(value)
+            else:
+                name, _, setting = value.partition("=")
+                variables[name] = setting
+            i += 2
+        elif not token.startswith("-"):
+            variables.update(read_tesseract_config_file(token))
+            i += 1
+        else:
+            logging.warning(f"Ignoring unsupported Tesseract option: {token}")
+            i += 1
+    return psm, oem, variables
+
+def tsv_to_dict(tsv):
+    """
+    Convert Tesseract TSV output into the column dict returned by
+    ``pytesseract.image_to_data(..., output_type=Output.DICT)``.
+    """
+    data = {column: [] for column in TSV_COLUMNS}
+    for row in tsv.splitlines():
+        fields = row.split("\t", len(TSV_COLUMNS) - 1)
+        if len(fields) == len(TSV_COLUMNS) - 1:
+            fields.append("")  # Non-word rows have no text column
+        if len(fields) != len(TSV_COLUMNS) or not fields[0].isdigit():
+            continue  # Header or malformed row
+        for column, value in zip(TSV_COLUMNS, fields):
+            if column == "text":
+                data[column].append(value)
+            elif column == "conf":
+                data[column].append(float(value))
+            else:
+                data[column].append(int(value))
+    return data
+
+class PytesseractEngine:
+    """
+    OCR by running the tesseract executable once per image (via pytesseract).
+    """
+    name = "pytesseract"
+
+    def version(self):
+        return str(pytesseract.get_tesseract_version())
+
+    def image_to_string(self, image, lang=OCR_LANG, config=OCR_CONFIG):
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    def image_to_data(self, image, lang=OCR_LANG, config=OCR_CONFIG):
+        return pytesseract.image_to_data(image, lang=lang, config=config, output_type=Output.DICT)
+
+class TesserocrEngine:
+    """
+    OCR in-process through the Tesseract API (tesserocr).
+
+    One engine is initialized per language and set of init options and then
+    reused, so the language model is loaded once per process and images are
+    passed in memory instead of through temp files and a new process.
+    """
+    name = "tesserocr"
+
+    def __init__(self):
+        self._apis = {}
+        # A Tesseract API object must not be used by two threads at once
+        self._lock = threading.Lock()
+
+    def version(self):
+        # "tesseract 5.3.0\n leptonica-1.82.0 ..."
+        return tesserocr.tesseract_version().split()[1]
+
+    def _get_api(self, lang, config):
+        psm, oem, variables = parse_tesseract_config(config)
+        key = (lang, oem, tuple(sorted(variables.items())))
+        api = self._apis.get(key)
+        if api is None:
+            logging.info(f"Loading Tesseract model '{lang}' in-process.")
+            options = {"lang": lang, "variables": variables}
+            if oem is not None:
+                options["oem"] = oem
+            api = tesserocr.PyTessBaseAPI(**options)
+            self._apis[key] = api
+        # Tesseract's own default when no --psm is given
+        api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+        return api
+
+    def load(self, lang=OCR_LANG, config=OCR_CONFIG):
+        """
+        Load the model for ``lang`` and ``config`` now rather than on first use.
+        """
+        with self._lock:
+            self._get_api(lang, config)
+
+    def image_to_string(self, image, lang=OCR_LANG, config=OCR_CONFIG):
+        with self._lock:
+            api = self._get_api(lang, config)
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+    def image_to_data(self, image, lang=OCR_LANG, config=OCR_CONFIG):
+        with self._lock:
+            api = self._get_api(lang, config)
+            api.SetImage(image)
+            tsv = api.GetTSVText(0)
+        return tsv_to_dict(tsv)
+
+@lru_cache(maxsize=None)
+def get_ocr_engine(backend=OCR_BACKEND):
+    """
+    Return this process's OCR engine, created on first use and then reused
+    (each batch worker process gets its own).
+    """
+    if backend in ("auto", "tesserocr"):
+        if tesserocr is None:
+            if backend == "tesserocr":
+                logging.warning("tesserocr is not installed; falling back to pytesseract.")
         else:
-            # Load image directly
-            logging.info("Loading image file.")
-            image = Image.open(receipt_path)
+            engine = TesserocrEngine()
+            try:
+                engine.load()
+                return engine
+            except RuntimeError as e:
+                logging.warning(f"Unable to initialize tesserocr ({e}); falling back to pytesseract.")
+    return PytesseractEngine()
+
+@lru_cache(maxsize=None)
+def get_tesseract_version():
+    """
+    Return the installed Tesseract version as a string (cached per process).
+    """
+    try:
+        return get_ocr_engine().version()
+    except Exception as e:
+        logging.warning(f"Unable to determine Tesseract version: {e}")
+        return "unknown"
+
+def ocr_cache_params(use_text_layer=PDF_TEXT_LAYER, ocr_mode=OCR_MODE, quality=OCR_QUALITY, ocr_profile=None):
+    """
+    Parameters that affect the OCR output and therefore the cache key.
+    """
+    params = {
+        "pdf_text_layer": use_text_layer,
+        "ocr_mode": ocr_mode,
+        "preprocessor": PREPROCESSOR,
+        "preprocess": (
+            PREPROCESS_PARAMS if PREPROCESSOR == "pillow" else PREPROCESSING_PIPELINE.describe()
+        ),
+        "dpi": PDF_DPI,
+        "ocr_backend": get_ocr_engine().name,
+        "tesseract_version": get_tesseract_version(),
+        "lang": OCR_LANG,
+        "config": OCR_CONFIG,
+        "quality": quality,
+        "profile": ocr_profile.describe() if ocr_profile is not None else None,
+    }
+    if quality == "tiered":
+        params["fast_pass"] = {
+            "dpi": FAST_PDF_DPI,
+            "preprocess": FAST_PREPROCESSING_PIPELINE.describe(),
+            "config": FAST_OCR_CONFIG,
+        }
+    return params
+
+def extract_pdf_text_layer(receipt_path, page_number=1):
+    """
+    Return the embedded text of a page of a PDF (the first by default), or
+    None if the page has no usable text layer (e.g. it is a scan).
+    """
+    page = str(page_number)
+    try:
+        # pdftotext ships with poppler, which pdf2image already requires
+        result = subprocess.run(
+            ["pdftotext", "-layout", "-f", page, "-l", page, "-enc", "UTF-8", receipt_path, "-"],
+            capture_output=True,
+            check=True,
+            timeout=60,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.warning(f"Unable to read PDF text layer: {e}")
+        return None
+
+    text = result.stdout.decode("utf-8", errors="replace")
+    if len("".join(text.split())) < MIN_TEXT_LAYER_CHARS:
+        logging.info("PDF has no usable text layer.")
+        return None
+    return text
+
+def read_receipt(receipt_path, use_text_layer=PDF_TEXT_LAYER, ocr_mode=OCR_MODE, metrics=None, check_image=None,
+                 quality=OCR_QUALITY, ocr_profile=None):
+    """
+    Return the text and parsed data of a receipt, taken from the PDF text
+    layer when available and from OCR otherwise.
+
+    Stage timings are added to ``metrics`` (a ``ReceiptMetrics``) if given.
+    ``check_image``, ``quality`` and ``ocr_profile`` are passed on to
+    ``ocr_receipt``.
+    """
+    if metrics is None:
+        metrics = ReceiptMetrics()
+    if use_text_layer and receipt_path.lower().endswith(".pdf"):
+        with metrics.stage("text_layer"):
+            text = extract_pdf_text_layer(receipt_path)
+        if text is not None:
+            logging.info("Using embedded PDF text layer; skipping OCR.")
+            with metrics.stage("parse"):
+                data = parse_receipt_text(text)
+            check_receipt_data(text, data, metrics)
+            return text, data
+    return ocr_receipt(receipt_path, ocr_mode, metrics, check_image, quality, ocr_profile)
+
+def load_receipt_image(receipt_path, dpi=PDF_DPI):
+    """
+    Load a receipt image, rendering the first page of a PDF at ``dpi``.
+    """
+    # Convert PDF to image if necessary
+    if receipt_path.lower().endswith(".pdf"):
+        logging.info("Detected PDF. Converting first page to image.")
+        try:
+            # Only the first page is used, so only render that one, and in
+            # grayscale since preprocessing discards color anyway
+            return render_pdf_page(receipt_path, 1, dpi)
+        except Exception as e:
+            logging.error(f"Error converting PDF to image: {e}")
+            raise RuntimeError("Failed to process receipt: Unable to convert PDF to image.")
+
+    # Load image directly, decoding it now rather than on first use
+    logging.info("Loading image file.")
+    image = Image.open(receipt_path)
+    image.load()
+    return image
+
+def check_receipt_data(text, data, metrics=None, require_subtotal=True):
+    """
+    Run the consistency checks (see ``receipt_checks.check_receipt``) on the
+    data parsed from ``text``. The problems found are stored in
+    ``data["review"]``, empty if the receipt adds up, and returned.
+    """
+    if metrics is None:
+        metrics = ReceiptMetrics()
+    with metrics.stage("check") as stage:
+        problems = check_receipt(text, data, price_field_for_label, require_subtotal)
+        stage["problems"] = len(problems)
+    data["review"] = problems
+    return problems
+
+def ocr_receipt(receipt_path, ocr_mode=OCR_MODE, metrics=None, check_image=None, quality=OCR_QUALITY,
+                ocr_profile=None):
+    """
+    Load a receipt (PDF or image), preprocess it and OCR it.
+
+    Returns the raw OCR text and the parsed receipt data. Stage timings are
+    added to ``metrics`` (a ``ReceiptMetrics``) if given. ``check_image`` is
+    called with the loaded page before any preprocessing or OCR (e.g. to
+    hash it, see ``DuplicateDetector.hash_image``) and may raise to stop
+    there.
+
+    With ``quality="tiered"`` the receipt is first OCR'd with the fast
+    settings, and OCR'd again at full quality only if that result fails the
+    consistency checks. ``data["ocr_pass"]`` is the pass ("fast" or "full")
+    the data comes from and ``data["review"]`` the problems left.
+
+    Page and layout-region OCR use the Tesseract options of ``ocr_profile``
+    (an ``OCRProfile``), by default the profile for the receipt's source.
+    """
+    if metrics is None:
+        metrics = ReceiptMetrics()
+    if ocr_profile is None:
+        ocr_profile = get_ocr_profile(receipt_path)
+    tiered = quality == "tiered"
+
+    with metrics.stage("load") as stage:
+        image = load_receipt_image(receipt_path, FAST_PDF_DPI if tiered else PDF_DPI)
+        stage.update(image_info(image))
+
+    if check_image is not None:
+        check_image(image)
+
+    engine = get_ocr_engine()
 
-        # Preprocess the image
+    if tiered:
+        with metrics.stage("preprocess", ocr_pass="fast") as stage:
+            fast_image = preprocess_image(image, "numpy", FAST_PREPROCESSING_PIPELINE)
+            stage.update(image_info(fast_image))
+        with metrics.stage("ocr", backend=engine.name, mode="page", ocr_pass="fast", profile=ocr_profile.name):
+            text = engine.image_to_string(fast_image, lang=OCR_LANG, config=ocr_profile.apply(FAST_OCR_CONFIG))
+        with metrics.stage("parse"):
+            data = parse_receipt_text(text)
+        problems = check_receipt_data(text, data, metrics)
+        if not problems:
+            data["ocr_pass"] = "fast"
+            return text, data
+        logging.info(f"Fast OCR pass failed the consistency checks ({'; '.join(problems)}); OCR'ing at full quality.")
+        if receipt_path.lower().endswith(".pdf"):
+            with metrics.stage("load", ocr_pass="full") as stage:
+                image = load_receipt_image(receipt_path, PDF_DPI)
+                stage.update(image_info(image))
+
+    # Preprocess the image
+    with metrics.stage("preprocess") as stage:
         image = preprocess_image(image)
+        stage.update(image_info(image))
+
+    text = data = None
+    # Layout OCR reads only the line items and the customer block
+    require_subtotal = ocr_mode != "layout"
+    if ocr_mode == "layout":
+        customer_keywords = ("Customer", "TX#") + UNIT_KEYWORDS + tuple(DISTRICT_MAP)
+        with metrics.stage("ocr", backend=engine.name, mode="layout"):
+            regions = ocr_layout_regions(
+                image, OCR_LANG, customer_keywords, engine, ocr_profile.apply(REGION_CONFIG)
+            )
+        if regions is not None:
+            text = "\n".join(line["text"] for name in ("line_items", "customer") for line in regions[name])
+            with metrics.stage("parse"):
+                data = parse_receipt_layout(regions)
+        else:
+            logging.info("Falling back to full-page OCR.")
+            require_subtotal = True
 
+    if data is None:
         # Perform OCR on the image
-        text = pytesseract.image_to_string(image, lang='eng', config='--psm 4')
-
-        # Debugging: Save raw OCR output for review
-        with open("data/raw_ocr_output.txt", "w") as f:
-            f.write(text)
-        logging.debug("OCR output saved to raw_ocr_output.txt.")
-
-        # Initialize data dictionary
-        data = {
-            "council_number": "456",  # Always the same
-            "effective_date": datetime.now().strftime("%Y-%m-01"),  # First day of the current month
-            "term": "12 months",  # Always 12 months
-        }
+        with metrics.stage("ocr", backend=engine.name, mode="page", profile=ocr_profile.name):
+            text = engine.image_to_string(image, lang=OCR_LANG, config=ocr_profile.apply(OCR_CONFIG))
+        with metrics.stage("parse"):
+            data = parse_receipt_text(text)
+    check_receipt_data(text, data, metrics, require_subtotal)
+    data["ocr_pass"] = "full"
+    return text, data
 
-        # Extract district, unit, program type, and price information
-        district_map = {
-            "Calumet": 1, "Prairie Dunes": 3, "Thunderbird": 4, "Checaugau": 5, 
-            "Iron Horse": 6, "Tri-Star": 7, "Five Creeks": 9, "Tall Grass": 11, "Trailblazer": 12
-        }
+def ocr_page(image, metrics=None, ocr_profile=None):
+    """
+    Preprocess a page image and OCR the whole page (with the options of
+    ``ocr_profile``, by default the PDF profile). Returns the raw text.
+    """
+    if metrics is None:
+        metrics = ReceiptMetrics()
+    if ocr_profile is None:
+        ocr_profile = OCR_PROFILES[SOURCE_PROFILES["pdf"]]
+    with metrics.stage("preprocess") as stage:
+        image = preprocess_image(image)
+        stage.update(image_info(image))
+    engine = get_ocr_engine()
+    with metrics.stage("ocr", backend=engine.name, mode="page", profile=ocr_profile.name):
+        return engine.image_to_string(image, lang=OCR_LANG, config=ocr_profile.apply(OCR_CONFIG))
 
-        price_fields = {
-            "Youth Registration": "C9",
-            "Youth SL Subscription": "C10",
-            "Youth Transfer": "C11",
-            "Adult Registration": "C12",
-            "Multiple/Position Change": "C13",
-            "Adult Transfer": "C14",
-            "Adult SL Subscription": "C15",
-            "Youth Exploring": "C16",
-            "Adult Exploring": "C17",
-            "Program Fee": "C18",
-        }
+def set_term_dates(data):
+    """
+    Set the effective date to the first day of the current month and infer the
+    expiration date from it.
+    """
+    data["effective_date"] = datetime.now().strftime("%Y-%m-01")  # First day of the current month
+    # Infer expiration date as 12 months minus 1 day
+    effective_date = datetime.strptime(data["effective_date"], "%Y-%m-%d")
+    # Add 12 months minus 1 day
+    expiration_date = effective_date + timedelta(days=365) - timedelta(days=1)
+    data["expiration_date"] = expiration_date.strftime("%Y-%m-%d")
+    return data
 
-        # Prices to map
-        prices = {field: 0 for field in price_fields.keys()}
+def parse_receipt_text(text):
+    """
+    Parse raw OCR text into the receipt data dictionary.
+
+    Fields are matched by ``FIELD_MATCHER`` in one scan of the text;
+    ``data["field_sources"]`` records the confidence and source lines of
+    every field found (see ``FieldMatcher.match``).
+    """
+    # Initialize data dictionary
+    data = {
+        "council_number": "456",  # Always the same
+        "effective_date": datetime.now().strftime("%Y-%m-01"),  # First day of the current month
+        "term": "12 months",  # Always 12 months
+    }
 
-        # Process each line for data
-        logging.info("Processing OCR lines for data extraction.")
-        lines = text.splitlines()
-        for line in lines:
+    # Per-line logging only when debug logging was requested
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for line in text.splitlines():
             logging.debug(f"Processing line: {line}")
-            line = line.strip()
-
-            # Extract district
-            for district, number in district_map.items():
-                if district.lower() in line.lower():
-                    data["district_name"] = district
-                    data["district_number"] = number
-                    logging.info(f"Matched district: {district} ({number})")
-
-            # Extract local unit number
-            if "Troop" in line or "Pack" in line or "Crew" in line or "Ship" in line or "Post" in line:
-                match = re.search(r"(\d+)", line)
-                if match:
-                    data["local_unit_number"] = match.group(1)
-                    logging.info(f"Matched local unit number: {data['local_unit_number']}")
-
-            # Extract program type
-            if "Scouts BSA" in line or "Troop" in line:
-                data["program"] = "Scouts BSA"
-            elif "Cub Scouts" in line or "Pack" in line:
-                data["program"] = "Cub Scouts"
-            elif "Venturing" in line or "Crew" in line:
-                data["program"] = "Venturing"
-            elif "Sea Scouts" in line or "Ship" in line:
-                data["program"] = "Sea Scouts"
-            elif "Exploring" in line or "Post" in line:
-                data["program"] = "Exploring"
-
-            # Extract price information
-                       # Extract price information
-            match = re.search(r"(\d+)\s+(Youth BL|Youth Renewal|Adult Renewal|Adult New|Youth Program Fee|Adult Program Fee)", line, re.IGNORECASE)
-            if match:
-                count = int(match.group(1))
-                label = match.group(2).strip().lower()
-                logging.info(f"Matched price line: {label} ({count})")
-
-                if "youth bl" in label:
-                    prices["Youth SL Subscription"] += count
-                elif "youth renewal" in label or "youth new" in label:
-                    prices["Youth Registration"] += count
-                elif "adult renewal" in label or "adult new" in label:
-                    prices["Adult Registration"] += count
-                elif "program fee" in label:
-                    prices["Program Fee"] += count
-
-
-        # Add prices to data
-        data["prices"] = prices
-
-        # Infer expiration date
-        # Infer expiration date as 12 months minus 1 day
-        effective_date = datetime.strptime(data["effective_date"], "%Y-%m-%d")
-        # Add 12 months minus 1 day
-        expiration_date = effective_date + timedelta(days=365) - timedelta(days=1)
-        data["expiration_date"] = expiration_date.strftime("%Y-%m-%d")
-
-
-        # Save data to JSON
-        json_path = "data/receipt_data.json"
-        with open(json_path, "w") as json_file:
-            json.dump(data, json_file, indent=4)
+    values, sources = FIELD_MATCHER.match(text)
+
+    if "district_name" in values:
+        data["district_name"] = values["district_name"]
+        data["district_number"] = DISTRICT_MAP[values["district_name"]]
+        sources["district_number"] = sources["district_name"]
+    for field in ("local_unit_number", "program", "tx_number", "receipt_date", "check_number", "customer"):
+        if field in values:
+            data[field] = values[field]
+    logging.info("Matched fields: " + ", ".join(
+        f"{field} ({source['confidence']:.2f}, line {source['lines'][0]})" for field, source in sources.items()
+    ))
+
+    # Prices to map
+    data["prices"] = {field: values["prices"].get(field, 0) for field in PRICE_FIELDS}
+    data["field_sources"] = sources
+
+    # Infer expiration date
+    set_term_dates(data)
+    return data
+
+def parse_line_item_words(words):
+    """
+    Parse a line item from its words in left-to-right order, e.g.
+    ["21", "Youth", "BL", "x", "$15.00", "(315.00)"].
+
+    Returns (price field, count), or None if the words are not a known item.
+    """
+    if len(words) < 2 or not words[0].isdigit():
+        return None
+    label_words = []
+    for word in words[1:]:
+        if word.lower() in ("x", "×"):
+            break
+        label_words.append(word)
+    field = price_field_for_label(" ".join(label_words).lower())
+    if field is None:
+        return None
+    return field, int(words[0])
+
+def parse_receipt_layout(regions):
+    """
+    Parse receipt data from the regions found by layout OCR.
+
+    Line items are read from word positions: the leftmost word is the count
+    and the words up to the "x" are the label. District, unit and program
+    come from the customer block.
+    """
+    data = parse_receipt_text("\n".join(line["text"] for line in regions["customer"]))
+
+    prices = {field: 0 for field in PRICE_FIELDS.keys()}
+    for line in regions["line_items"]:
+        item = parse_line_item_words([word["text"] for word in line["words"]])
+        if item is not None:
+            field, count = item
+            prices[field] += count
+            logging.info(f"Matched price line: {line['text']} ({count})")
+    data["prices"] = prices
+    return data
+
+_ocr_cache = None
+
+def get_ocr_cache():
+    """
+    Return this process's handle on the shared on-disk OCR cache, so its
+    running size total is kept across receipts. A forked worker process gets
+    its own.
+    """
+    global _ocr_cache
+    if _ocr_cache is None or _ocr_cache.pid != os.getpid():
+        _ocr_cache = OCRCache()
+    return _ocr_cache
+
+_record_store = None
+
+def get_record_store():
+    """
+    Return this process's connection to the record store, reopening it in a
+    forked worker process.
+    """
+    global _record_store
+    if _record_store is None or _record_store.pid != os.getpid():
+        _record_store = RecordStore()
+    return _record_store
+
+_duplicate_detector = None
+
+def get_duplicate_detector():
+    """
+    Return this process's duplicate detector over the record store.
+    """
+    global _duplicate_detector
+    store = get_record_store()
+    if _duplicate_detector is None or _duplicate_detector.store is not store:
+        _duplicate_detector = DuplicateDetector(store)
+    return _duplicate_detector
+
+def record_receipt(record_key, data, text, receipt_path, metrics=None, dedup=DEDUP, image_hash=None,
+                   candidates=()):
+    """
+    Save a parsed receipt to the record store under ``record_key``.
+
+    With ``dedup`` the receipt is first checked against earlier records and
+    ``DuplicateReceiptError`` is raised if it is the same transaction as one
+    of them. ``image_hash`` and the look-alike ``candidates`` come from
+    ``DuplicateDetector.hash_image``; the hash is indexed with the record. The record store is secondary, so database
+    errors are logged rather than raised.
+    """
+    if metrics is None:
+        metrics = ReceiptMetrics()
+    if dedup:
+        with metrics.stage("dedup_record"):
+            try:
+                get_duplicate_detector().check_record(data, receipt_path, record_key, candidates)
+            except sqlite3.Error as e:
+                logging.error(f"Unable to check the receipt against earlier records: {e}")
+
+    with metrics.stage("record_store"):
+        try:
+            get_record_store().add(record_key, data, text, os.path.abspath(receipt_path))
+            if image_hash is not None:
+                get_duplicate_detector().add_image(record_key, image_hash, os.path.abspath(receipt_path))
+        except sqlite3.Error as e:
+            logging.error(f"Unable to save receipt to the record store: {e}")
+
+# Fields compared when stored receipts are re-parsed, besides the prices
+REPARSE_FIELDS = (
+    "district_name", "district_number", "local_unit_number", "program", "tx_number", "receipt_date",
+    "check_number", "customer",
+)
+
+def reparse_receipt(text, stored_data):
+    """
+    Parse a stored receipt's raw OCR text again with the current field rules
+    and re-run the consistency checks. The term dates and OCR pass are kept
+    from ``stored_data``. A text without a Subtotal line (e.g. from layout
+    OCR) is only flagged for it if it was before.
+    """
+    data = parse_receipt_text(text)
+    for field in ("effective_date", "expiration_date", "ocr_pass"):
+        if field in stored_data:
+            data[field] = stored_data[field]
+    check_receipt_data(text, data, require_subtotal="subtotal not found" in stored_data.get("review", ()))
+    return data
+
+def changed_fields(old_data, new_data):
+    """
+    Return ``{field: (old value, new value)}`` for the compared fields, price
+    counts (as "prices.<field>") and review problems that differ.
+    """
+    changes = {}
+    for field in REPARSE_FIELDS:
+        if old_data.get(field) != new_data.get(field):
+            changes[field] = (old_data.get(field), new_data.get(field))
+    old_prices = old_data.get("prices", {})
+    new_prices = new_data.get("prices", {})
+    for field in PRICE_FIELDS:
+        if old_prices.get(field, 0) != new_prices.get(field, 0):
+            changes[f"prices.{field}"] = (old_prices.get(field, 0), new_prices.get(field, 0))
+    if bool(old_data.get("review")) != bool(new_data.get("review")):
+        changes["review"] = (old_data.get("review"), new_data.get("review"))
+    return changes
+
+def reparse_record_store(store=None, apply=False, examples=3, batch_size=1000):
+    """
+    Re-parse the raw OCR text of every receipt in the record store with the
+    current field rules, without touching the images, to see what a rule
+    change does to the receipts already processed.
+
+    Returns a summary: the number of ``receipts`` re-parsed, how many
+    ``changed``, the number of receipts per changed field (``fields``), up to
+    ``examples`` changes per field (file path, old and new value) and the
+    ``seconds`` taken. With ``apply`` the changed records are updated, one
+    transaction per ``batch_size`` records, keeping their processing time.
+    """
+    if store is None:
+        store = get_record_store()
+    summary = {"receipts": 0, "changed": 0, "fields": {}, "examples": {}, "seconds": 0.0}
+    start = time.perf_counter()
+    updates = []
+    for record in store.texts(batch_size):
+        summary["receipts"] += 1
+        data = reparse_receipt(record["raw_text"], record["data"])
+        changes = changed_fields(record["data"], data)
+        if not changes:
+            continue
+        summary["changed"] += 1
+        for field, (old, new) in changes.items():
+            summary["fields"][field] = summary["fields"].get(field, 0) + 1
+            field_examples = summary["examples"].setdefault(field, [])
+            if len(field_examples) < examples:
+                field_examples.append({"file_path": record["file_path"], "old": old, "new": new})
+        if apply:
+            update = receipt_record(record["content_hash"], data, record["raw_text"], record["file_path"])
+            update["processed_at"] = record["processed_at"]
+            updates.append(update)
+            if len(updates) >= batch_size:
+                store.add_many(updates)
+                updates = []
+    if updates:
+        store.add_many(updates)
+    summary["seconds"] = time.perf_counter() - start
+    logging.info(
+        f"Re-parsed {summary['receipts']} stored receipt(s) in {summary['seconds']:.2f} s; "
+        f"{summary['changed']} {'updated' if apply else 'would change'}."
+    )
+    return summary
+
+def read_pdf_pages(receipt_path, use_text_layer=PDF_TEXT_LAYER, cache=None, content_hash=None, ocr_profile=None):
+    """
+    Read the pages of a PDF one at a time.
+
+    Yields a dict per page with its ``page`` number, its ``text`` if known
+    without OCR (from ``cache`` or the text layer) or else the rendered
+    ``image``, the ``cache_key`` of the page and the page's ``metrics``.
+    Only one page is rendered at a time.
+    """
+    for page_number in range(1, pdf_page_count(receipt_path) + 1):
+        metrics = ReceiptMetrics()
+        page = {"page": page_number, "text": None, "image": None, "cache_key": None, "metrics": metrics}
+        if cache is not None:
+            with metrics.stage("cache_lookup", page=page_number) as stage:
+                # Streamed pages are always OCR'd at full quality
+                params = dict(ocr_cache_params(use_text_layer, "page", "full", ocr_profile), page=page_number)
+                page["cache_key"] = make_cache_key(content_hash, params)
+                entry = cache.get(page["cache_key"])
+                stage["hit"] = entry is not None
+            if entry is not None:
+                page["text"] = entry["text"]
+                yield page
+                continue
+
+        if use_text_layer:
+            with metrics.stage("text_layer", page=page_number):
+                page["text"] = extract_pdf_text_layer(receipt_path, page_number)
+            if page["text"] is not None:
+                yield page
+                continue
+
+        with metrics.stage("load", page=page_number) as stage:
+            page["image"] = render_pdf_page(receipt_path, page_number, PDF_DPI)
+            stage.update(image_info(page["image"]))
+        yield page
+
+def extract_receipts_from_pdf(receipt_path, use_cache=True, use_text_layer=PDF_TEXT_LAYER, profile=None):
+    """
+    Split a multi-receipt PDF into receipts and extract each of them.
+
+    Pages are read on a background thread a few pages ahead (see
+    ``pdf_stream.prefetch``), so the next page renders while the current
+    one is OCR'd, and pages are grouped into receipts at the shop header and
+    footer (see ``pdf_stream.ReceiptSplitter``). A receipt is yielded as
+    soon as its last page is read, as a dict with its ``pages``, ``text``,
+    parsed ``data``, a ``record_key`` for the record store (the PDF's
+    content hash and page range) and ``metrics`` covering its pages.
+
+    Pages are OCR'd with the OCR profile named ``profile``, by default the
+    one for PDFs. Page text is cached per page. Only the text of the pages of the receipt
+    being assembled is kept, so memory does not grow with the page count.
+    """
+    logging.info(f"Processing multi-receipt PDF: {receipt_path}")
+    cache = get_ocr_cache() if use_cache else None
+    content_hash = file_content_hash(receipt_path)
+    ocr_profile = get_ocr_profile(receipt_path, profile)
+    splitter = ReceiptSplitter()
+    page_stages = {}
+
+    def assemble(pages):
+        numbers = [number for number, _ in pages]
+        metrics = ReceiptMetrics([entry for number in numbers for entry in page_stages.pop(number)])
+        text = "\n".join(page_text for _, page_text in pages)
+        with metrics.stage("parse"):
+            data = parse_receipt_text(text)
+        if check_receipt_data(text, data, metrics):
+            logging.warning(f"Pages {numbers[0]}-{numbers[-1]} of {receipt_path} flagged for review: "
+                            f"{'; '.join(data['review'])}")
+        logging.info(f"Found receipt on page(s) {numbers[0]}-{numbers[-1]} of {receipt_path}.")
+        return {
+            "pages": numbers,
+            "text": text,
+            "data": data,
+            "record_key": f"{content_hash}:{numbers[0]}-{numbers[-1]}",
+            "metrics": metrics,
+        }
+
+    for page in prefetch(read_pdf_pages(receipt_path, use_text_layer, cache, content_hash, ocr_profile)):
+        metrics = page["metrics"]
+        text = page["text"]
+        if text is None:
+            text = ocr_page(page.pop("image"), metrics, ocr_profile)
+            if cache is not None:
+                with metrics.stage("cache_store"):
+                    cache.put(page["cache_key"], text, None, page=page["page"], content_hash=content_hash)
+        if is_blank_page(text):
+            continue
+        page_stages[page["page"]] = metrics.stages
+        for pages in splitter.add_page(page["page"], text):
+            yield assemble(pages)
+
+    for pages in splitter.finish():
+        yield assemble(pages)
+
+def extract_receipt_text_to_json(receipt_path, use_cache=True, use_text_layer=PDF_TEXT_LAYER, ocr_mode=OCR_MODE,
+                                 metrics=None, store=RECORD_STORE, dedup=DEDUP, quality=OCR_QUALITY, profile=None,
+                                 debug_output=True):
+    """
+    Extract text from receipt (PDF or image) using OCR and save it as a JSON file.
+
+    OCR results are cached on disk by file content and OCR parameters; pass
+    ``use_cache=False`` to bypass the cache and always re-run OCR. For PDFs
+    with an embedded text layer the text is read directly unless
+    ``use_text_layer=False``. ``ocr_mode="layout"`` OCRs only the line-item
+    and customer regions instead of the whole page. Stage timings are added
+    to ``metrics`` (a ``ReceiptMetrics``) if given. With ``store`` the record
+    and raw OCR text are also saved to the record store.
+
+    ``quality="tiered"`` tries a fast OCR pass first (see ``ocr_receipt``).
+    A receipt that fails the consistency checks is flagged for review by
+    the problems listed in ``data["review"]``. ``profile`` names the OCR
+    profile (see ``OCR_PROFILES``); by default it depends on the receipt's
+    source (``SOURCE_PROFILES``).
+
+    With ``dedup`` (and ``store``) a receipt already processed from another
+    file raises ``DuplicateReceiptError`` after parsing, when its TX#, check
+    number and customer line match an earlier record. Its page is hashed
+    before OCR; an earlier receipt that looks the same needs fewer of them
+    to match (see ``DuplicateDetector.check_record``).
+
+    With ``debug_output`` the raw OCR text and the data are also written to
+    data/raw_ocr_output.txt and data/receipt_data.json. Worker processes
+    pass ``debug_output=False``, as they would overwrite each other's files.
+    """
+    if metrics is None:
+        metrics = ReceiptMetrics()
+    try:
+        logging.info(f"Processing receipt: {receipt_path}")
+
+        cache = get_ocr_cache() if use_cache else None
+        content_hash = file_content_hash(receipt_path) if cache is not None or store else None
+        ocr_profile = get_ocr_profile(receipt_path, profile)
+        detector = None
+        if store and dedup:
+            try:
+                detector = get_duplicate_detector()
+            except sqlite3.Error as e:
+                logging.error(f"Unable to open the record store; not checking for duplicates: {e}")
+        image_hash = None
+        candidates = ()
+        cache_key = None
+        entry = None
+        if cache is not None:
+            with metrics.stage("cache_lookup") as stage:
+                cache_key = make_cache_key(
+                    content_hash, ocr_cache_params(use_text_layer, ocr_mode, quality, ocr_profile)
+                )
+                entry = cache.get(cache_key)
+                stage["hit"] = entry is not None
+
+        if entry is not None:
+            text = entry["text"]
+            if entry.get("parser_version") == PARSER_VERSION:
+                # Dates depend on the current month, not on the receipt
+                data = set_term_dates(entry["data"])
+            else:
+                with metrics.stage("parse"):
+                    data = parse_receipt_text(text)
+                check_receipt_data(text, data, metrics, require_subtotal=ocr_mode != "layout")
+                cache.put(cache_key, text, data, parser_version=PARSER_VERSION, content_hash=content_hash)
+        else:
+            def hash_image(image):
+                nonlocal image_hash, candidates
+                with metrics.stage("dedup", candidates=0) as stage:
+                    try:
+                        image_hash, candidates = detector.hash_image(image, receipt_path, content_hash)
+                        stage["candidates"] = len(candidates)
+                    except sqlite3.Error as e:
+                        logging.error(f"Unable to check the image against earlier receipts: {e}")
+
+            text, data = read_receipt(
+                receipt_path, use_text_layer, ocr_mode, metrics, hash_image if detector is not None else None,
+                quality, ocr_profile,
+            )
+            if cache is not None:
+                with metrics.stage("cache_store"):
+                    cache.put(cache_key, text, data, parser_version=PARSER_VERSION, content_hash=content_hash)
+
+        if data.get("review"):
+            logging.warning(f"{receipt_path} flagged for review: {'; '.join(data['review'])}")
+
+        if store:
+            record_receipt(
+                content_hash, data, text, receipt_path, metrics, dedup=detector is not None, image_hash=image_hash,
+                candidates=candidates,
+            )
+
+        if debug_output:
+            with metrics.stage("debug_output"):
+                # Debugging: Save raw OCR output for review
+                with open("data/raw_ocr_output.txt", "w") as f:
+                    f.write(text)
+                logging.debug("OCR output saved to raw_ocr_output.txt.")
+
+                # Save data to JSON
+                json_path = "data/receipt_data.json"
+                with open(json_path, "w") as json_file:
+                    json.dump(data, json_file, indent=4)
         logging.info("Data successfully extracted and saved to JSON.")
 
         return data
 
+    except DuplicateReceiptError:
+        raise
     except Exception as e:
         logging.error(f"Error processing receipt: {e}")
         raise RuntimeError(f"Failed to process receipt: {e}")
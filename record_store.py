@@ -0,0 +1,400 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from route_sheet import PRICE_CELLS
+
+# Default location of the receipt record database
+RECORD_STORE_PATH = os.path.join("data", "receipts.sqlite3")
+
+SCHEMA_VERSION = 2
+
+
+def count_column(field):
+    """
+    Column name of a price field, e.g. "Multiple/Position Change" ->
+    "multiple_position_change".
+    """
+    return re.sub(r"[^a-z0-9]+", "_", field.lower()).strip("_")
+
+
+# Route sheet price field -> column holding its count
+COUNT_COLUMNS = {field: count_column(field) for field in PRICE_CELLS}
+
+RECORD_COLUMNS = (
+    "content_hash", "file_path", "processed_at", "district_name", "district_number",
+    "local_unit_number", "program", "effective_date", "expiration_date", "receipt_date",
+    "tx_number", "check_number", "customer", "customer_key",
+) + tuple(COUNT_COLUMNS.values()) + ("data", "raw_text")
+
+# Dimensions reports can be grouped by; dates are grouped through a SQL expression
+GROUP_BY_EXPRESSIONS = {
+    "district": "district_name",
+    "unit": "local_unit_number",
+    "program": "program",
+    "year": "strftime('%Y', {date})",
+    "quarter": "strftime('%Y', {date}) || '-Q' || ((CAST(strftime('%m', {date}) AS INTEGER) + 2) / 3)",
+    "month": "strftime('%Y-%m', {date})",
+}
+DATE_FIELDS = ("effective_date", "receipt_date")
+
+TABLES = f"""
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    file_path TEXT,
+    processed_at TEXT NOT NULL,
+    district_name TEXT,
+    district_number INTEGER,
+    local_unit_number TEXT,
+    program TEXT,
+    effective_date TEXT,
+    expiration_date TEXT,
+    receipt_date TEXT,
+    tx_number TEXT,
+    check_number TEXT,
+    customer TEXT,
+    customer_key TEXT,
+    {", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in COUNT_COLUMNS.values())},
+    data TEXT NOT NULL,
+    raw_text TEXT
+);
+CREATE TABLE IF NOT EXISTS image_hashes (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    phash BLOB NOT NULL,
+    file_path TEXT,
+    added_at TEXT NOT NULL
+);
+"""
+
+# Columns added after the first schema version: name -> definition
+ADDED_COLUMNS = {
+    "check_number": "TEXT",
+    "customer": "TEXT",
+    "customer_key": "TEXT",
+}
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS receipts_district ON receipts (district_name, effective_date);
+CREATE INDEX IF NOT EXISTS receipts_unit ON receipts (local_unit_number, district_name);
+CREATE INDEX IF NOT EXISTS receipts_program ON receipts (program, effective_date);
+CREATE INDEX IF NOT EXISTS receipts_effective_date ON receipts (effective_date);
+CREATE INDEX IF NOT EXISTS receipts_receipt_date ON receipts (receipt_date);
+CREATE INDEX IF NOT EXISTS receipts_tx_number ON receipts (tx_number);
+CREATE INDEX IF NOT EXISTS receipts_check_number ON receipts (check_number);
+CREATE INDEX IF NOT EXISTS receipts_customer_key ON receipts (customer_key);
+"""
+
+
+def quarter_range(year, quarter):
+    """
+    Return the first and last day (ISO dates) of a calendar quarter.
+    """
+    first_month = 3 * (quarter - 1) + 1
+    start = date(year, first_month, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, first_month + 3, 1)
+    return start.isoformat(), date.fromordinal(end.toordinal() - 1).isoformat()
+
+
+def customer_key(customer):
+    """
+    Reduce a customer line to its letters and digits, lowercased, so OCR
+    noise in punctuation and spacing does not matter when comparing it.
+    """
+    if not customer:
+        return None
+    return re.sub(r"[^a-z0-9]+", "", customer.lower()) or None
+
+
+def receipt_record(content_hash, data, raw_text=None, file_path=None):
+    """
+    Flatten parsed receipt data into a row of the receipts table.
+    """
+    prices = data.get("prices", {})
+    record = {
+        "content_hash": content_hash,
+        "file_path": file_path,
+        "processed_at": datetime.now().isoformat(timespec="seconds"),
+        "district_name": data.get("district_name"),
+        "district_number": data.get("district_number"),
+        "local_unit_number": data.get("local_unit_number"),
+        "program": data.get("program"),
+        "effective_date": data.get("effective_date"),
+        "expiration_date": data.get("expiration_date"),
+        "receipt_date": data.get("receipt_date"),
+        "tx_number": data.get("tx_number"),
+        "check_number": data.get("check_number"),
+        "customer": data.get("customer"),
+        "customer_key": customer_key(data.get("customer")),
+        "data": json.dumps(data),
+        "raw_text": raw_text,
+    }
+    for field, column in COUNT_COLUMNS.items():
+        record[column] = prices.get(field, 0)
+    return record
+
+
+class RecordStore:
+    """
+    SQLite store of every extracted receipt.
+
+    One row per receipt file (keyed by its content hash, so reprocessing a
+    file updates its row) with the identifying fields and every line-item
+    count in its own column, plus the parsed data and the raw OCR text.
+    Indexed by district, unit, program, dates and TX#, so reports never need
+    the images. The image hashes used to skip duplicate receipts are kept
+    alongside (see ``duplicates.py``). The database runs in WAL mode so
+    batch worker processes can write while the GUI reads.
+    """
+
+    def __init__(self, path=RECORD_STORE_PATH):
+        self.path = path
+        # SQLite connections must not be shared across a fork
+        self.pid = os.getpid()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(TABLES)
+            self._add_missing_columns()
+            self._connection.executescript(INDEXES)
+            self._connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _add_missing_columns(self):
+        # Databases created by an older version lack the newer columns
+        existing = {row["name"] for row in self._connection.execute("PRAGMA table_info(receipts)")}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in existing:
+                self._connection.execute(f"ALTER TABLE receipts ADD COLUMN {column} {definition}")
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+
+    def add(self, content_hash, data, raw_text=None, file_path=None):
+        """
+        Insert or update the record of one receipt.
+        """
+        self.add_many([receipt_record(content_hash, data, raw_text, file_path)])
+
+    def add_many(self, records):
+        """
+        Insert or update many records (see ``receipt_record``) in a single
+        transaction; either all of them are stored or none.
+        """
+        columns = ", ".join(RECORD_COLUMNS)
+        placeholders = ", ".join(f":{column}" for column in RECORD_COLUMNS)
+        # A record without a file path (e.g. imported from the OCR cache) keeps the known one
+        updates = ", ".join(
+            f"{column} = COALESCE(excluded.{column}, {column})" if column == "file_path" else
+            f"{column} = excluded.{column}"
+            for column in RECORD_COLUMNS if column != "content_hash"
+        )
+        sql = (
+            f"INSERT INTO receipts ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT(content_hash) DO UPDATE SET {updates}"
+        )
+        with self._lock, self._connection:
+            self._connection.executemany(sql, records)
+
+    def texts(self, batch_size=1000):
+        """
+        Yield every record that has its raw OCR text, oldest first, as a dict
+        with its id, content hash, file path, processing time, parsed data
+        and raw text. Records are read ``batch_size`` at a time, so the store
+        may be updated while iterating.
+        """
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT id, content_hash, file_path, processed_at, data, raw_text FROM receipts "
+                    "WHERE id > ? AND raw_text IS NOT NULL ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                record = dict(row)
+                record["data"] = json.loads(record["data"])
+                yield record
+            last_id = rows[-1]["id"]
+
+    @staticmethod
+    def _where(district=None, unit=None, program=None, start=None, end=None, tx_number=None,
+               date_field="effective_date"):
+        if date_field not in DATE_FIELDS:
+            raise ValueError(f"Unknown date field: {date_field}")
+        conditions = []
+        params = []
+        for column, value in (
+            ("district_name", district), ("local_unit_number", unit), ("program", program), ("tx_number", tx_number)
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(str(value) if column in ("local_unit_number", "tx_number") else value)
+        if start is not None:
+            conditions.append(f"{date_field} >= ?")
+            params.append(str(start))
+        if end is not None:
+            conditions.append(f"{date_field} <= ?")
+            params.append(str(end))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, params
+
+    def query(self, district=None, unit=None, program=None, start=None, end=None, tx_number=None,
+              date_field="effective_date", limit=None, include_text=False):
+        """
+        Return matching receipts as dicts, newest first.
+
+        ``start`` and ``end`` are inclusive ISO dates compared against
+        ``date_field`` ("effective_date" or "receipt_date"). The raw OCR text
+        is only returned with ``include_text=True``.
+        """
+        where, params = self._where(district, unit, program, start, end, tx_number, date_field)
+        columns = [column for column in RECORD_COLUMNS if include_text or column != "raw_text"]
+        sql = f"SELECT id, {', '.join(columns)} FROM receipts{where} ORDER BY {date_field} DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def aggregate(self, group_by=("district",), district=None, unit=None, program=None, start=None, end=None,
+                  date_field="effective_date"):
+        """
+        Sum the line-item counts of matching receipts.
+
+        ``group_by`` names dimensions from ``GROUP_BY_EXPRESSIONS`` (district,
+        unit, program, year, quarter, month). Returns one dict per group with
+        the group values, the number of ``receipts`` and one total per count
+        column, e.g. "how many youth renewals did Tri-Star process this
+        quarter":
+
+            store.aggregate(("district",), district="Tri-Star", start=q_start, end=q_end)
+        """
+        where, params = self._where(district, unit, program, start, end, None, date_field)
+        groups = []
+        for name in group_by:
+            if name not in GROUP_BY_EXPRESSIONS:
+                raise ValueError(f"Unknown group: {name}")
+            groups.append(f"{GROUP_BY_EXPRESSIONS[name].format(date=date_field)} AS {name}")
+        totals = ", ".join(f"SUM({column}) AS {column}" for column in COUNT_COLUMNS.values())
+        select = ", ".join(groups + ["COUNT(*) AS receipts", totals])
+        sql = f"SELECT {select} FROM receipts{where}"
+        if groups:
+            names = ", ".join(group_by)
+            sql += f" GROUP BY {names} ORDER BY {names}"
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [dict(row) for row in rows if row["receipts"]]
+
+    def find_duplicate(self, tx_number=None, check_number=None, customer=None, exclude_hash=None):
+        """
+        Return the earliest other receipt that is the same transaction, or
+        None.
+
+        A receipt matches on both the TX# and the check number, or on the
+        customer line (see ``customer_key``) plus either of them. The receipt
+        with content hash ``exclude_hash`` (the file being checked) is
+        ignored.
+        """
+        numbers = [(column, str(value)) for column, value in (("tx_number", tx_number), ("check_number", check_number))
+                   if value]
+        key = customer_key(customer)
+        conditions = []
+        params = []
+        if len(numbers) == 2:
+            conditions.append("(tx_number = ? AND check_number = ?)")
+            params += [value for _, value in numbers]
+        if key and numbers:
+            conditions.append(f"(customer_key = ? AND ({' OR '.join(f'{column} = ?' for column, _ in numbers)}))")
+            params += [key] + [value for _, value in numbers]
+        if not conditions:
+            return None
+        sql = (
+            f"SELECT id, file_path, tx_number, check_number, customer_key FROM receipts "
+            f"WHERE ({' OR '.join(conditions)}) AND content_hash != ? ORDER BY id LIMIT 1"
+        )
+        with self._lock:
+            row = self._connection.execute(sql, params + [exclude_hash or ""]).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_records(self, content_hashes):
+        """
+        Return the identifying fields of the receipts with the given content
+        hashes, by content hash.
+        """
+        content_hashes = list(content_hashes)
+        if not content_hashes:
+            return {}
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT content_hash, file_path, tx_number, check_number, customer_key FROM receipts "
+                f"WHERE content_hash IN ({', '.join('?' * len(content_hashes))})",
+                content_hashes,
+            ).fetchall()
+        return {row["content_hash"]: dict(row) for row in rows}
+
+    def add_image_hash(self, content_hash, image_hash, file_path=None):
+        """
+        Insert or replace the perceptual image hash of a receipt file.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO image_hashes (content_hash, phash, file_path, added_at) VALUES (?, ?, ?, ?)",
+                (content_hash, image_hash, file_path, datetime.now().isoformat(timespec="seconds")),
+            )
+
+    def image_hashes(self, after_id=0):
+        """
+        Return the image hashes added after row ``after_id``, oldest first.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, content_hash, phash, file_path FROM image_hashes WHERE id > ? ORDER BY id", (after_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def import_ocr_cache(self, cache):
+        """
+        Add every entry of an ``OCRCache`` that records its file's content
+        hash, in one transaction. Entries that are the same transaction as a
+        stored or already imported receipt (see ``find_duplicate``) are
+        skipped. Returns the number of records imported.
+        """
+        records = []
+        seen = set()
+        for entry in cache.entries():
+            if not entry.get("content_hash") or not entry.get("data"):
+                continue
+            record = receipt_record(entry["content_hash"], entry["data"], entry.get("text"))
+            numbers = (record["tx_number"], record["check_number"])
+            if (all(numbers) and numbers in seen) or self.find_duplicate(
+                record["tx_number"], record["check_number"], record["customer"], exclude_hash=record["content_hash"]
+            ):
+                continue
+            seen.add(numbers)
+            records.append(record)
+        self.add_many(records)
+        logging.info(f"Imported {len(records)} record(s) from the OCR cache.")
+        return len(records)
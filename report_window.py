@@ -0,0 +1,133 @@
+from datetime import date
+from tkinter import messagebox, ttk
+
+import customtkinter as ctk
+from receipt_processing import DISTRICT_MAP
+from record_store import COUNT_COLUMNS, RecordStore, quarter_range
+from route_sheet import PROGRAM_TO_UNIT_TYPE
+
+ALL = "All"
+
+# Report groupings offered in the window -> GROUP_BY_EXPRESSIONS names
+GROUPINGS = {
+    "District": ("district",),
+    "District and unit": ("district", "unit"),
+    "Program": ("program",),
+    "Quarter": ("quarter",),
+    "District by quarter": ("district", "quarter"),
+    "Month": ("month",),
+}
+
+# Group column id -> heading
+GROUP_HEADINGS = {
+    "district": "District",
+    "unit": "Unit",
+    "program": "Program",
+    "year": "Year",
+    "quarter": "Quarter",
+    "month": "Month",
+}
+
+
+def period_choices(today=None):
+    """
+    Return the period menu entries (label -> (start, end)): all time, this
+    year and the current and previous four quarters.
+    """
+    today = today or date.today()
+    choices = {"All time": (None, None), str(today.year): (f"{today.year}-01-01", f"{today.year}-12-31")}
+    year, quarter = today.year, (today.month - 1) // 3 + 1
+    for _ in range(5):
+        choices[f"{year}-Q{quarter}"] = quarter_range(year, quarter)
+        year, quarter = (year - 1, 4) if quarter == 1 else (year, quarter - 1)
+    return choices
+
+
+class ReportWindow(ctk.CTkToplevel):
+    """
+    Line-item totals from the record store, filtered by district, program
+    and period and grouped by the chosen dimensions. The figures come from
+    SQL aggregates, so the window opens instantly however many receipts
+    have been processed.
+    """
+
+    def __init__(self, master, store_path=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.title("Receipt Reports")
+        self.geometry("1100x600")
+        self.store = RecordStore(store_path) if store_path else RecordStore()
+        self.periods = period_choices()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        filters = ctk.CTkFrame(self, fg_color="transparent")
+        filters.pack(fill="x", padx=20, pady=(20, 10))
+
+        self.district_var = ctk.StringVar(value=ALL)
+        self.program_var = ctk.StringVar(value=ALL)
+        self.period_var = ctk.StringVar(value=list(self.periods)[2])
+        self.group_var = ctk.StringVar(value="District")
+        for label, variable, values in (
+            ("District:", self.district_var, [ALL] + sorted(DISTRICT_MAP)),
+            ("Program:", self.program_var, [ALL] + list(PROGRAM_TO_UNIT_TYPE)),
+            ("Period:", self.period_var, list(self.periods)),
+            ("Totals by:", self.group_var, list(GROUPINGS)),
+        ):
+            ctk.CTkLabel(filters, text=label, font=ctk.CTkFont(size=14)).pack(side="left", padx=(0, 5))
+            ctk.CTkOptionMenu(
+                filters, values=values, variable=variable, width=150, command=lambda _: self.refresh()
+            ).pack(side="left", padx=(0, 15))
+
+        self.summary_label = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=14), text_color="gray60")
+        self.summary_label.pack(fill="x", padx=20)
+
+        table_frame = ctk.CTkFrame(self, fg_color="transparent")
+        table_frame.pack(fill="both", expand=True, padx=20, pady=(10, 20))
+        self.tree = ttk.Treeview(table_frame, show="headings", style="Results.Treeview")
+        y_scroll = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        x_scroll = ttk.Scrollbar(table_frame, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        y_scroll.grid(row=0, column=1, sticky="ns")
+        x_scroll.grid(row=1, column=0, sticky="ew")
+        table_frame.grid_rowconfigure(0, weight=1)
+        table_frame.grid_columnconfigure(0, weight=1)
+
+        self.refresh()
+
+    def refresh(self):
+        group_by = GROUPINGS[self.group_var.get()]
+        start, end = self.periods[self.period_var.get()]
+        try:
+            rows = self.store.aggregate(
+                group_by=group_by,
+                district=None if self.district_var.get() == ALL else self.district_var.get(),
+                program=None if self.program_var.get() == ALL else self.program_var.get(),
+                start=start,
+                end=end,
+            )
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to read the record store: {str(e)}", parent=self)
+            return
+
+        # Only the line items that occur in the report get a column
+        fields = [field for field, column in COUNT_COLUMNS.items() if any(row[column] for row in rows)]
+        columns = list(group_by) + ["receipts"] + [COUNT_COLUMNS[field] for field in fields]
+        self.tree.delete(*self.tree.get_children())
+        self.tree.configure(columns=columns)
+        for column in group_by:
+            self.tree.heading(column, text=GROUP_HEADINGS[column])
+            self.tree.column(column, width=120, anchor="w", stretch=False)
+        self.tree.heading("receipts", text="Receipts")
+        self.tree.column("receipts", width=80, anchor="e", stretch=False)
+        for field in fields:
+            self.tree.heading(COUNT_COLUMNS[field], text=field)
+            self.tree.column(COUNT_COLUMNS[field], width=max(90, 8 * len(field)), anchor="e", stretch=False)
+        for row in rows:
+            self.tree.insert("", "end", values=["" if row[column] is None else row[column] for column in columns])
+
+        receipts = sum(row["receipts"] for row in rows)
+        self.summary_label.configure(text=f"{receipts} receipt(s) in {len(rows)} group(s)")
+
+    def close(self):
+        self.store.close()
+        self.destroy()
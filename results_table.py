@@ -0,0 +1,189 @@
+import bisect
+import os
+from tkinter import ttk
+
+import customtkinter as ctk
+from batch_processing import result_name, result_status
+from route_sheet import PROGRAM_TO_UNIT_TYPE
+
+# (column id, heading, width, anchor, numeric)
+COLUMNS = (
+    ("file", "File", 200, "w", False),
+    ("status", "Status", 70, "w", False),
+    ("district", "District", 110, "w", False),
+    ("unit", "Unit", 90, "w", False),
+    ("program", "Program", 100, "w", False),
+    ("youth_registration", "Youth Reg", 75, "e", True),
+    ("youth_sl", "Youth SL", 70, "e", True),
+    ("adult_registration", "Adult Reg", 75, "e", True),
+    ("program_fee", "Prog Fee", 70, "e", True),
+    ("seconds", "Time (s)", 70, "e", True),
+    ("output", "Route Sheet", 220, "w", False),
+)
+COLUMN_IDS = tuple(column[0] for column in COLUMNS)
+NUMERIC_COLUMNS = {column[0] for column in COLUMNS if column[4]}
+
+# Price fields shown as columns
+COUNT_COLUMNS = {
+    "youth_registration": "Youth Registration",
+    "youth_sl": "Youth SL Subscription",
+    "adult_registration": "Adult Registration",
+    "program_fee": "Program Fee",
+}
+
+
+def result_row(result):
+    """
+    Return the column values of a receipt result, keyed by column id.
+    """
+    data = result.get("data") or {}
+    prices = data.get("prices", {})
+    unit_number = data.get("local_unit_number")
+    unit_type = PROGRAM_TO_UNIT_TYPE.get(data.get("program"), "")
+    row = {
+        "file": result_name(result),
+        "status": result_status(result),
+        "district": data.get("district_name", ""),
+        "unit": f"{unit_type} {unit_number}".strip() if unit_number else "",
+        "program": data.get("program", ""),
+        "seconds": round(result["seconds"], 2) if result.get("seconds") is not None else "",
+        "output": os.path.basename(result["output_path"]) if result.get("output_path") else "",
+    }
+    for column, field in COUNT_COLUMNS.items():
+        row[column] = prices.get(field, "") if data else ""
+    return row
+
+
+def sort_key(row, column):
+    """
+    Key that sorts numbers numerically and text case-insensitively, with
+    empty cells last.
+    """
+    value = row[column]
+    if value == "" or value is None:
+        return (1, 0, "")
+    if column in NUMERIC_COLUMNS:
+        return (0, value, "")
+    return (0, 0, str(value).lower())
+
+
+class ResultsTable(ctk.CTkFrame):
+    """
+    Sortable table of receipt results, one row per receipt.
+
+    Built on a single ``ttk.Treeview``, which only draws the rows in view, so
+    the widget count stays constant however many receipts a batch has. Rows
+    are inserted in place as results arrive, keeping the current sort order.
+    Clicking a heading sorts by that column (again to reverse).
+    """
+
+    def __init__(self, master, on_select=None, on_open=None, **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.on_select = on_select
+        self.on_open = on_open
+        self.sort_column = None
+        self.sort_descending = False
+        self._results = {}
+        self._rows = {}
+        # Ascending (sort key, sequence) of every row, parallel to the display order
+        self._keys = []
+        self._sequence = 0
+
+        style = ttk.Style(self)
+        style.configure("Results.Treeview", rowheight=24, font=("Segoe UI", 11))
+        style.configure("Results.Treeview.Heading", font=("Segoe UI", 11, "bold"))
+
+        self.tree = ttk.Treeview(
+            self, columns=COLUMN_IDS, show="headings", selectmode="browse", style="Results.Treeview"
+        )
+        for column, heading, width, anchor, _ in COLUMNS:
+            self.tree.heading(column, text=heading, command=lambda column=column: self.sort_by(column))
+            self.tree.column(column, width=width, minwidth=40, anchor=anchor, stretch=column in ("file", "output"))
+        self.tree.tag_configure("error", foreground="#DC2626")
+        self.tree.tag_configure("duplicate", foreground="#D97706")
+        self.tree.tag_configure("review", foreground="#D97706")
+
+        y_scroll = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        x_scroll = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        y_scroll.grid(row=0, column=1, sticky="ns")
+        x_scroll.grid(row=1, column=0, sticky="ew")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Double-1>", self._on_open)
+        self.tree.bind("<Return>", self._on_open)
+
+    def __len__(self):
+        return len(self._results)
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self._results.clear()
+        self._rows.clear()
+        self._keys.clear()
+
+    def add_result(self, result):
+        """
+        Add a receipt result as a row, in sort order if the table is sorted.
+        """
+        row = result_row(result)
+        status = row["status"]
+        iid = str(self._sequence)
+        self._sequence += 1
+        self._results[iid] = result
+        self._rows[iid] = row
+
+        if self.sort_column is None:
+            key = (int(iid),)
+        else:
+            key = (sort_key(row, self.sort_column), int(iid))
+        position = bisect.bisect(self._keys, (key, iid))
+        self._keys.insert(position, (key, iid))
+        index = len(self._keys) - 1 - position if self.sort_descending else position
+
+        self.tree.insert(
+            "", index, iid=iid,
+            values=[row[column] for column in COLUMN_IDS],
+            tags=(status,) if status in ("error", "duplicate", "review") else (),
+        )
+        return iid
+
+    def sort_by(self, column, descending=None):
+        """
+        Sort the rows by ``column``; without ``descending`` the direction
+        toggles when the same column is clicked again.
+        """
+        if descending is None:
+            descending = column == self.sort_column and not self.sort_descending
+        self.sort_column = column
+        self.sort_descending = descending
+
+        # The insertion sequence breaks ties, so equal values keep arrival order
+        self._keys = sorted(
+            ((sort_key(self._rows[iid], column), int(iid)), iid) for iid in self._rows
+        )
+        order = [iid for _, iid in self._keys]
+        if descending:
+            order.reverse()
+        for index, iid in enumerate(order):
+            self.tree.move(iid, "", index)
+
+        for other, heading, *_ in COLUMNS:
+            arrow = (" ▼" if descending else " ▲") if other == column else ""
+            self.tree.heading(other, text=heading + arrow)
+
+    def selected_result(self):
+        selection = self.tree.selection()
+        return self._results.get(selection[0]) if selection else None
+
+    def _on_select(self, event=None):
+        if self.on_select is not None:
+            self.on_select(self.selected_result())
+
+    def _on_open(self, event=None):
+        result = self.selected_result()
+        if result is not None and self.on_open is not None:
+            self.on_open(result)
@@ -1,71 +1,480 @@
 import logging
+import os
+import re
+import zipfile
+from functools import lru_cache
+from xml.sax.saxutils import escape
 from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+from metrics import ReceiptMetrics
 
+# Template and output locations (the assets folder next to this file)
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+TEMPLATE_PATH = os.path.join(ASSETS_DIR, "RouteSheetTemplateV2.xlsx")
+OUTPUT_DIR = ASSETS_DIR
 
-def update_route_sheet_from_json(data):
+# "xml" patches the template's cell XML directly; "openpyxl" loads and saves
+# the template with openpyxl for every route sheet
+ROUTE_SHEET_WRITER = "xml"
+
+# Cells for the header fields
+HEADER_CELLS = ("B4", "C4", "D4", "E4", "G4", "H4", "I4", "J4")
+
+# Map prices to their respective cells
+PRICE_CELLS = {
+    "Unit Charter": "C8",
+    "Youth Registration": "C9",
+    "Youth SL Subscription": "C10",
+    "Youth Transfer": "C11",
+    "Adult Registration": "C12",
+    "Multiple/Position Change": "C13",
+    "Adult Transfer": "C14",
+    "Adult SL Subscription": "C15",
+    "Youth Exploring": "C16",
+    "Adult Exploring": "C17",
+    "Program Fee": "C18",
+}
+
+PROGRAM_TO_UNIT_TYPE = {
+    "Scouts BSA": "Troop",
+    "Cub Scouts": "Pack",
+    "Venturing": "Crew",
+    "Sea Scouts": "Ship",
+    "Exploring": "Post",
+    "District": "Non-Unit",
+    "Council": "Non-Unit"
+}
+
+WORKSHEET_PART = "xl/worksheets/sheet1.xml"
+CALC_CHAIN_PART = "xl/calcChain.xml"
+
+# Name of the totals tab in a batch workbook
+SUMMARY_SHEET_NAME = "Summary"
+
+# Package parts copied from the template into a batch workbook
+SHARED_PARTS = ("_rels/.rels", "xl/styles.xml", "xl/theme/theme1.xml", "xl/sharedStrings.xml", "docProps/core.xml")
+
+SPREADSHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIP_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+WORKSHEET_REL_TYPE = RELATIONSHIP_NS + "/worksheet"
+WORKSHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+
+def format_date(date):
     """
-    Update the route sheet based on extracted JSON data.
+    Convert a YYYY-MM-DD date to MM/DD/YYYY.
     """
-    # Load the route sheet template
-    template_path = r"Z:\johnv\routesheetassistant\assets\RouteSheetTemplateV2.xlsx"
-    workbook = load_workbook(template_path)
-    sheet = workbook.active
+    return "/".join(date.split("-")[1:] + [date.split("-")[0]])
 
-    # Format dates
-    effective_date = data["effective_date"]
-    expiration_date = data["expiration_date"]
 
+def route_sheet_values(data):
+    """
+    Map extracted receipt data to route sheet cell values.
+    """
     # Ensure dates are in MM/DD/YYYY format
-    effective_date_formatted = "/".join(effective_date.split("-")[1:] + [effective_date.split("-")[0]])
-    expiration_date_formatted = "/".join(expiration_date.split("-")[1:] + [expiration_date.split("-")[0]])
+    effective_date_formatted = format_date(data["effective_date"])
+    expiration_date_formatted = format_date(data["expiration_date"])
 
     # Map extracted fields to cells
-    sheet["B4"] = data["program"]
-    sheet["C4"] = data["council_number"]
-    sheet["D4"] = data["district_number"]
-    sheet["G4"] = data["local_unit_number"]
-    sheet["H4"] = effective_date_formatted
-    sheet["I4"] = data["term"]
-    sheet["J4"] = expiration_date_formatted
+    values = {
+        "B4": data["program"],
+        "C4": data["council_number"],
+        "D4": data["district_number"],
+        "G4": data["local_unit_number"],
+        "H4": effective_date_formatted,
+        "I4": data["term"],
+        "J4": expiration_date_formatted,
+    }
 
     # Write the program type (Troop, Pack, etc.) into E4
-    logging.info("Updating E4 with the unit type based on program.")
-    program_to_unit_type = {
-        "Scouts BSA": "Troop",
-        "Cub Scouts": "Pack",
-        "Venturing": "Crew",
-        "Sea Scouts": "Ship",
-        "Exploring": "Post",
-        "District": "Non-Unit",
-        "Council": "Non-Unit"
-    }
-    unit_type = program_to_unit_type.get(data["program"], "Unknown")
-    sheet["E4"] = unit_type
-
-    # Map prices to their respective cells
-    logging.info("Mapping prices to the correct cells.")
-    for field, cell in {
-        "Unit Charter": "C8",
-        "Youth Registration": "C9",
-        "Youth SL Subscription": "C10",
-        "Youth Transfer": "C11",
-        "Adult Registration": "C12",
-        "Multiple/Position Change": "C13",
-        "Adult Transfer": "C14",
-        "Adult SL Subscription": "C15",
-        "Youth Exploring": "C16",
-        "Adult Exploring": "C17",
-        "Program Fee": "C18",
-    }.items():
+    values["E4"] = PROGRAM_TO_UNIT_TYPE.get(data["program"], "Unknown")
+
+    for field, cell in PRICE_CELLS.items():
         # Only update the price cells explicitly defined
         if field in data["prices"]:
-            sheet[cell] = data["prices"].get(field, 0)
+            values[cell] = data["prices"].get(field, 0)
+    return values
 
-    # Save the updated route sheet with a new name
+
+def route_sheet_output_path(data, output_dir=OUTPUT_DIR, name_suffix=None):
+    """
+    Return the file path of the route sheet for the given receipt data,
+    with ``name_suffix`` (if given) added to the file name.
+    """
     district_name = data.get("district_name", "Unknown").replace(" ", "_")
     local_unit_number = data.get("local_unit_number", "Unknown")
-    current_date = effective_date_formatted.replace("/", "-")
-    output_path = rf"Z:\johnv\routesheetassistant\assets\Route_Sheet_{district_name}_{local_unit_number}_{current_date}.xlsx"
+    current_date = format_date(data["effective_date"]).replace("/", "-")
+    name = f"Route_Sheet_{district_name}_{local_unit_number}_{current_date}"
+    if name_suffix:
+        name += f"_{name_suffix}"
+    return os.path.join(output_dir, f"{name}.xlsx")
+
+
+def cell_xml(ref, style, value):
+    """
+    Return the XML of a worksheet cell holding ``value``.
+    """
+    style_attr = f' s="{style}"' if style is not None else ""
+    if value is None:
+        return f'<c r="{ref}"{style_attr}/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+    text = escape(str(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+
+class RouteSheetTemplate:
+    """
+    The route sheet template, loaded once and patched at the XML level.
+
+    Every package part is kept in memory. The worksheet XML is split around
+    the cells the route sheet fills in, so producing a route sheet only
+    formats those cells and writes the package back out; styles, print
+    settings and every other part are copied unchanged.
+    """
+
+    def __init__(self, template_path=TEMPLATE_PATH, cells=None):
+        if cells is None:
+            cells = HEADER_CELLS + tuple(PRICE_CELLS.values())
+
+        with zipfile.ZipFile(template_path) as package:
+            self.parts = [(info, package.read(info.filename)) for info in package.infolist()]
+
+        parts = {info.filename: data for info, data in self.parts}
+        sheet_xml = parts[WORKSHEET_PART].decode("utf-8")
+
+        # Locate each target cell, remembering its style and whether it holds
+        # a formula that filling in a value will replace
+        spans = []
+        self.styles = {}
+        self.original_cells = {}
+        replaced_formulas = False
+        for ref in cells:
+            match = re.search(rf'<c r="{ref}"(?P<attrs>[^>]*?)(?:/>|>.*?</c>)', sheet_xml, re.DOTALL)
+            if match is None:
+                raise ValueError(f"Cell {ref} not found in route sheet template.")
+            style = re.search(r'\bs="(\d+)"', match.group("attrs"))
+            self.styles[ref] = style.group(1) if style else None
+            self.original_cells[ref] = match.group(0)
+            replaced_formulas = replaced_formulas or "<f" in match.group(0)
+            spans.append((match.start(), match.end(), ref))
+        spans.sort()
+
+        # Static XML between the target cells
+        self.cell_order = [ref for _, _, ref in spans]
+        self.chunks = []
+        position = 0
+        for start, end, _ in spans:
+            self.chunks.append(sheet_xml[position:start])
+            position = end
+        self.chunks.append(sheet_xml[position:])
+
+        if replaced_formulas:
+            self._drop_calc_chain()
+
+    def _drop_calc_chain(self):
+        """
+        Remove the calculation chain and make Excel recalculate on open, as
+        openpyxl does, since overwritten formula cells would leave it stale.
+        """
+        patched = []
+        for info, data in self.parts:
+            if info.filename == CALC_CHAIN_PART:
+                continue
+            if info.filename == "[Content_Types].xml":
+                data = re.sub(rb'<Override PartName="/xl/calcChain.xml"[^>]*/>', b"", data)
+            elif info.filename == "xl/_rels/workbook.xml.rels":
+                data = re.sub(rb'<Relationship [^>]*Target="calcChain.xml"[^>]*/>', b"", data)
+            elif info.filename == "xl/workbook.xml":
+                data = re.sub(rb"<calcPr\b", b'<calcPr fullCalcOnLoad="1"', data, count=1)
+            patched.append((info, data))
+        self.parts = patched
+
+    def render_sheet(self, values, chunks=None):
+        """
+        Return the worksheet XML with the target cells set from ``values``.
+
+        Target cells missing from ``values`` keep their template content.
+        ``chunks`` replaces the static XML around the cells (see
+        ``BatchWorkbookWriter``).
+        """
+        chunks = chunks or self.chunks
+        pieces = [chunks[0]]
+        for ref, chunk in zip(self.cell_order, chunks[1:]):
+            if ref in values:
+                pieces.append(cell_xml(ref, self.styles[ref], values[ref]))
+            else:
+                pieces.append(self.original_cells[ref])
+            pieces.append(chunk)
+        return "".join(pieces).encode("utf-8")
+
+    def write(self, values, output_path):
+        """
+        Write a route sheet with the given cell values to ``output_path``.
+        """
+        sheet_xml = self.render_sheet(values)
+        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as package:
+            for info, data in self.parts:
+                package.writestr(info, sheet_xml if info.filename == WORKSHEET_PART else data)
+        return output_path
+
+
+@lru_cache(maxsize=None)
+def get_route_sheet_template(template_path=TEMPLATE_PATH):
+    """
+    Return the route sheet template, loading it once per process.
+    """
+    logging.info(f"Loading route sheet template {template_path}.")
+    return RouteSheetTemplate(template_path)
+
+
+def sheet_name_for(data):
+    """
+    Return a worksheet name for a receipt, e.g. "Tri-Star 965 01-01-2025".
+    """
+    district_name = data.get("district_name", "Unknown")
+    local_unit_number = data.get("local_unit_number", "Unknown")
+    current_date = format_date(data["effective_date"]).replace("/", "-")
+    name = f"{district_name} {local_unit_number} {current_date}"
+    # Excel forbids these characters and limits names to 31 characters
+    return re.sub(r"[\[\]:*?/\\]", "-", name)[:31]
+
+
+def row_xml(row_number, values):
+    """
+    Return the XML of a worksheet row holding ``values`` from column A.
+    """
+    cells = "".join(
+        cell_xml(f"{get_column_letter(column)}{row_number}", None, value)
+        for column, value in enumerate(values, start=1)
+    )
+    return f'<row r="{row_number}">{cells}</row>'
+
+
+class BatchWorkbookWriter:
+    """
+    Write a batch of route sheets into a single workbook.
+
+    Each route sheet becomes a tab cloned from the template and is compressed
+    into the package as soon as it is added, so memory use does not grow with
+    the batch; only the per-unit totals for the summary tab are kept. The
+    summary tab and the workbook parts are written by ``close()``, so the
+    whole batch is saved in one pass.
+    """
+
+    def __init__(self, output_path, template_path=TEMPLATE_PATH):
+        self.output_path = output_path
+        self.template = get_route_sheet_template(template_path)
+        self.sheet_names = []
+        self.totals = {}
+        self.price_fields = []
+        self._used_names = {SUMMARY_SHEET_NAME.lower()}
+
+        # Only the summary tab is selected, and cloned tabs do not carry the
+        # template's printer settings part
+        self.chunks = list(self.template.chunks)
+        self.chunks[0] = self.chunks[0].replace(' tabSelected="1"', "")
+        self.chunks[-1] = re.sub(r'(<pageSetup\b[^>]*?) r:id="[^"]*"', r"\1", self.chunks[-1])
+
+        self._package = zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _unique_sheet_name(self, data):
+        base = sheet_name_for(data)
+        name = base
+        counter = 2
+        # Sheet names are case-insensitive in Excel
+        while name.lower() in self._used_names:
+            suffix = f" ({counter})"
+            name = base[:31 - len(suffix)] + suffix
+            counter += 1
+        self._used_names.add(name.lower())
+        return name
+
+    def add(self, data):
+        """
+        Add a route sheet tab for one receipt and return its sheet name.
+        """
+        name = self._unique_sheet_name(data)
+        self.sheet_names.append(name)
+        # sheet1.xml is reserved for the summary tab
+        part = f"xl/worksheets/sheet{len(self.sheet_names) + 1}.xml"
+        self._package.writestr(part, self.template.render_sheet(route_sheet_values(data), self.chunks))
+
+        key = (
+            data.get("district_name", "Unknown"),
+            data.get("district_number", ""),
+            data.get("local_unit_number", "Unknown"),
+            data.get("program", ""),
+        )
+        totals = self.totals.setdefault(key, {"receipts": 0, "prices": {}})
+        totals["receipts"] += 1
+        for field, count in data.get("prices", {}).items():
+            if field not in self.price_fields:
+                self.price_fields.append(field)
+            totals["prices"][field] = totals["prices"].get(field, 0) + count
+        return name
+
+    def _summary_xml(self):
+        header = ["District", "District No.", "Unit", "Program", "Receipts"] + self.price_fields
+        rows = [header]
+        district_totals = {}
+        for key in sorted(self.totals, key=lambda key: tuple(str(part) for part in key)):
+            totals = self.totals[key]
+            rows.append(
+                list(key) + [totals["receipts"]] + [totals["prices"].get(field, 0) for field in self.price_fields]
+            )
+            district = district_totals.setdefault(key[:2], {"receipts": 0, "prices": {}})
+            district["receipts"] += totals["receipts"]
+            for field, count in totals["prices"].items():
+                district["prices"][field] = district["prices"].get(field, 0) + count
+
+        rows.append([])
+        grand_total = [0] * (1 + len(self.price_fields))
+        for (district_name, district_number), totals in district_totals.items():
+            counts = [totals["receipts"]] + [totals["prices"].get(field, 0) for field in self.price_fields]
+            rows.append([district_name, district_number, "All", ""] + counts)
+            grand_total = [a + b for a, b in zip(grand_total, counts)]
+        rows.append(["Total", "", "", ""] + grand_total)
+
+        sheet_rows = "".join(row_xml(number, row) for number, row in enumerate(rows, start=1) if row)
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<worksheet xmlns="{SPREADSHEET_NS}" xmlns:r="{RELATIONSHIP_NS}">'
+            '<sheetViews><sheetView tabSelected="1" workbookViewId="0"/></sheetViews>'
+            '<sheetFormatPr defaultRowHeight="15"/>'
+            '<cols><col min="1" max="1" width="18" customWidth="1"/>'
+            f'<col min="2" max="{len(header)}" width="14" customWidth="1"/></cols>'
+            f"<sheetData>{sheet_rows}</sheetData>"
+            '<pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" header="0.3" footer="0.3"/>'
+            "</worksheet>"
+        ).encode("utf-8")
+
+    def close(self):
+        """
+        Write the summary tab and workbook parts and finish the package.
+        """
+        if self._package is None:
+            return
+        parts = {info.filename: data for info, data in self.template.parts}
+        names = [SUMMARY_SHEET_NAME] + self.sheet_names
+
+        self._package.writestr("xl/worksheets/sheet1.xml", self._summary_xml())
+        for part in SHARED_PARTS:
+            self._package.writestr(part, parts[part])
+
+        sheets = "".join(
+            f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{index}" r:id="rId{index}"/>'
+            for index, name in enumerate(names, start=1)
+        )
+        workbook_xml = re.sub(
+            rb"<sheets>.*?</sheets>", f"<sheets>{sheets}</sheets>".encode("utf-8"),
+            parts["xl/workbook.xml"], flags=re.DOTALL
+        )
+        self._package.writestr("xl/workbook.xml", workbook_xml)
+
+        relationships = [
+            f'<Relationship Id="rId{index}" Type="{WORKSHEET_REL_TYPE}" Target="worksheets/sheet{index}.xml"/>'
+            for index in range(1, len(names) + 1)
+        ]
+        for offset, (rel_type, target) in enumerate((
+            ("styles", "styles.xml"), ("theme", "theme/theme1.xml"), ("sharedStrings", "sharedStrings.xml")
+        ), start=len(names) + 1):
+            relationships.append(
+                f'<Relationship Id="rId{offset}" Type="{RELATIONSHIP_NS}/{rel_type}" Target="{target}"/>'
+            )
+        self._package.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(relationships) + "</Relationships>"
+        )
+
+        # Keep the template's content types, minus its worksheet, printer
+        # settings and app properties overrides, plus one per tab
+        content_types = parts["[Content_Types].xml"].decode("utf-8")
+        content_types = re.sub(r'<Override PartName="/xl/worksheets/[^>]*/>', "", content_types)
+        content_types = re.sub(r'<Override PartName="/docProps/app.xml"[^>]*/>', "", content_types)
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{index}.xml" ContentType="{WORKSHEET_CONTENT_TYPE}"/>'
+            for index in range(1, len(names) + 1)
+        )
+        self._package.writestr("[Content_Types].xml", content_types.replace("</Types>", overrides + "</Types>"))
+
+        # The root relationships point at docProps/app.xml; keep a minimal one
+        self._package.writestr(
+            "docProps/app.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+            "<Application>Microsoft Excel</Application></Properties>"
+        )
+
+        self._package.close()
+        self._package = None
+        logging.info(f"Batch workbook with {len(self.sheet_names)} route sheet(s) saved to {self.output_path}.")
+
+
+def write_batch_workbook(receipts, output_path, template_path=TEMPLATE_PATH):
+    """
+    Write route sheets for every receipt into a single workbook.
+    """
+    with BatchWorkbookWriter(output_path, template_path) as workbook:
+        for data in receipts:
+            workbook.add(data)
+    return output_path
+
+
+def write_route_sheet_openpyxl(values, output_path, template_path=TEMPLATE_PATH):
+    """
+    Write a route sheet by loading and saving the template with openpyxl.
+    """
+    workbook = load_workbook(template_path)
+    sheet = workbook.active
+    for cell, value in values.items():
+        sheet[cell] = value
     workbook.save(output_path)
+    return output_path
+
+
+def update_route_sheet_from_json(data, output_dir=OUTPUT_DIR, template_path=TEMPLATE_PATH, writer=ROUTE_SHEET_WRITER, workbook=None,
+                                 metrics=None, name_suffix=None):
+    """
+    Update the route sheet based on extracted JSON data.
+
+    If ``workbook`` (a ``BatchWorkbookWriter``) is given, the route sheet is
+    added to it as a new tab instead of being saved as its own file, and the
+    workbook's path is returned. Stage timings are added to ``metrics`` (a
+    ``ReceiptMetrics``) if given. ``name_suffix`` is added to the file name
+    (see ``route_sheet_output_path``).
+    """
+    if metrics is None:
+        metrics = ReceiptMetrics()
+
+    if workbook is not None:
+        with metrics.stage("save", writer="workbook"):
+            sheet_name = workbook.add(data)
+        logging.info(f"Route sheet added to {workbook.output_path} as '{sheet_name}'.")
+        return workbook.output_path
+
+    logging.info("Mapping receipt data to route sheet cells.")
+    values = route_sheet_values(data)
+
+    # Save the updated route sheet with a new name
+    output_path = route_sheet_output_path(data, output_dir, name_suffix)
+    if writer == "openpyxl":
+        # openpyxl reloads the template on every write, so it is timed as part of the save
+        with metrics.stage("save", writer=writer):
+            write_route_sheet_openpyxl(values, output_path, template_path)
+    else:
+        with metrics.stage("template_load"):
+            template = get_route_sheet_template(template_path)
+        with metrics.stage("save", writer=writer):
+            template.write(values, output_path)
     logging.info(f"Route sheet successfully updated and saved to {output_path}.")
     return output_path
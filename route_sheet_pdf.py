@@ -0,0 +1,679 @@
+"""
+Route sheets rendered straight to PDF and printed as a single job.
+
+Printing through Excel opens, sets up and prints every workbook in turn:
+Windows only, tens of seconds per batch and one spool job per route sheet.
+Here the template's print area (A1:K44) is laid out once from the workbook
+(column widths, row heights, merged cells, borders, fills, fonts and the
+static text) and fitted to one page, as the Excel page setup does. Each route
+sheet then only draws its filled-in cells and the formulas that depend on
+them over that page, and is streamed into one multi-page PDF that goes to the
+platform's print spooler as a single job.
+"""
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter, range_boundaries
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+from route_sheet import HEADER_CELLS, PRICE_CELLS, TEMPLATE_PATH, route_sheet_values
+
+# Part of the template printed on each page, fitted to one page
+PRINT_AREA = "A1:K44"
+# Resolution of the rendered pages; they are 1-bit, like a laser printout
+PDF_DPI = 200
+# US Letter, in inches
+PAGE_SIZE = (8.5, 11)
+
+# Font files tried in order for regular and bold text (the template's Aptos
+# Narrow is rarely installed outside Office); Pillow's built-in font is the
+# last resort
+FONT_FILES = {
+    False: ("arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf", "DejaVuSans.ttf"),
+    True: ("arialbd.ttf", "Arial Bold.ttf", "LiberationSans-Bold.ttf", "DejaVuSans-Bold.ttf"),
+}
+
+# Border line widths in points
+BORDER_WIDTHS = {"hair": 0.5, "thin": 0.75, "medium": 1.5, "thick": 2.25, "double": 2.25}
+DEFAULT_BORDER_WIDTH = 0.75
+
+# Space between a cell's edge and its text, in points
+CELL_PADDING = 2.0
+LINE_SPACING = 1.2
+
+# Drawn as a box, since few fonts have the ballot box character
+CHECKBOX = "☐"
+
+FORMULA_TOKEN = re.compile(
+    r"\s*(?:(?P<number>\d+(?:\.\d*)?)"
+    r"|(?P<range>\$?[A-Z]{1,3}\$?\d+:\$?[A-Z]{1,3}\$?\d+)"
+    r"|(?P<function>[A-Z]+)\("
+    r"|(?P<cell>\$?[A-Z]{1,3}\$?\d+)"
+    r"|(?P<op>[-+*/(),]))"
+)
+
+
+class FormulaError(Exception):
+    """
+    A formula that cannot be evaluated; the message is the Excel error shown
+    in its cell, e.g. "#VALUE!".
+    """
+
+
+class FormulaEvaluator:
+    """
+    Evaluate the template's formulas over a sheet's cell values.
+
+    Supports what route sheets use: numbers, cell references, + - * /,
+    parentheses and SUM over ranges and values. Empty cells count as 0 and
+    a number added to a date moves it by that many days.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self._results = {}
+
+    def value(self, ref):
+        """
+        Return the value of cell ``ref``, evaluating it if it is a formula.
+        """
+        if ref not in self._results:
+            value = self.values.get(ref)
+            if isinstance(value, str) and value.startswith("="):
+                # Guards against circular references
+                self._results[ref] = FormulaError("#REF!")
+                try:
+                    value = self._evaluate(value[1:])
+                except FormulaError as e:
+                    value = e
+            self._results[ref] = value
+        result = self._results[ref]
+        if isinstance(result, FormulaError):
+            raise result
+        return result
+
+    def display_value(self, ref):
+        """
+        Return the value of cell ``ref``, or its Excel error text.
+        """
+        try:
+            return self.value(ref)
+        except FormulaError as e:
+            return str(e)
+
+    def _evaluate(self, formula):
+        self._tokens = []
+        position = 0
+        formula = formula.upper()
+        while position < len(formula):
+            match = FORMULA_TOKEN.match(formula, position)
+            if match is None:
+                if formula[position:].strip():
+                    raise FormulaError("#NAME?")
+                break
+            self._tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        self._position = 0
+        result = self._expression()
+        if self._position != len(self._tokens):
+            raise FormulaError("#NAME?")
+        return result
+
+    def _peek(self):
+        return self._tokens[self._position] if self._position < len(self._tokens) else (None, None)
+
+    def _take(self, op=None):
+        token = self._peek()
+        if token[0] is None or (op is not None and token != ("op", op)):
+            raise FormulaError("#NAME?")
+        self._position += 1
+        return token
+
+    def _expression(self):
+        result = self._term()
+        while self._peek() in (("op", "+"), ("op", "-")):
+            op = self._take()[1]
+            result = add(result, self._term(), -1 if op == "-" else 1)
+        return result
+
+    def _term(self):
+        result = self._factor()
+        while self._peek() in (("op", "*"), ("op", "/")):
+            op = self._take()[1]
+            right = number(self._factor())
+            if op == "*":
+                result = number(result) * right
+            elif right == 0:
+                raise FormulaError("#DIV/0!")
+            else:
+                result = number(result) / right
+        return result
+
+    def _factor(self):
+        kind, text = self._take()
+        if kind == "number":
+            return float(text) if "." in text else int(text)
+        if kind == "cell":
+            return self.value(text.replace("$", ""))
+        if (kind, text) == ("op", "-"):
+            return -number(self._factor())
+        if (kind, text) == ("op", "("):
+            result = self._expression()
+            self._take(")")
+            return result
+        if kind == "function":
+            if text != "SUM":
+                raise FormulaError("#NAME?")
+            total = 0
+            while True:
+                if self._peek()[0] == "range":
+                    total += sum(number(self.value(ref)) for ref in range_cells(self._take()[1].replace("$", "")))
+                else:
+                    total += number(self._expression())
+                if self._peek() == ("op", ")"):
+                    self._take()
+                    return total
+                self._take(",")
+        raise FormulaError("#NAME?")
+
+
+def number(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise FormulaError("#VALUE!")
+    return value
+
+
+def add(left, right, sign=1):
+    if isinstance(left, datetime) and not isinstance(right, datetime):
+        return left + timedelta(days=sign * number(right))
+    if isinstance(right, datetime) and sign == 1:
+        return right + timedelta(days=number(left))
+    return number(left) + sign * number(right)
+
+
+def range_cells(cell_range):
+    """
+    Return the references of every cell in a range such as "E8:E18".
+    """
+    min_col, min_row, max_col, max_row = range_boundaries(cell_range)
+    return [
+        f"{get_column_letter(column)}{row}"
+        for row in range(min_row, max_row + 1) for column in range(min_col, max_col + 1)
+    ]
+
+
+def format_number(value, decimals):
+    return f"{abs(value):,.{decimals}f}"
+
+
+def format_cell(value, number_format):
+    """
+    Format a cell value for display. Returns ``(currency, text)``: the
+    currency symbol an accounting format aligns to the cell's left edge (or
+    None) and the text.
+    """
+    if value is None:
+        return None, ""
+    if isinstance(value, datetime):
+        if "yy" in number_format.lower():
+            return None, value.strftime("%m-%d-%y" if "yyyy" not in number_format.lower() else "%m-%d-%Y")
+        return None, value.strftime("%m/%d/%Y")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None, str(value)
+    decimals = 2 if "0.00" in number_format else 0
+    if "$" in number_format:
+        if number_format.startswith("_("):
+            # Accounting: "$" at the left edge, zero as a dash
+            if value == 0:
+                return "$", "-  "
+            text = format_number(value, decimals)
+            return "$", f"({text})" if value < 0 else f"{text} "
+        text = "$" + format_number(value, decimals)
+        return None, f"({text})" if value < 0 else text
+    if "#,##0" in number_format:
+        return None, ("-" if value < 0 else "") + format_number(value, decimals)
+    if isinstance(value, float):
+        return None, f"{value:.10g}"
+    return None, str(value)
+
+
+@lru_cache(maxsize=None)
+def load_font(size, bold=False):
+    """
+    Return a font of ``size`` pixels from the first of ``FONT_FILES`` found.
+    """
+    for name in FONT_FILES[bool(bold)]:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def fill_gray(fill):
+    """
+    Return the gray level (0-255) of a solid cell fill, or None.
+    """
+    if fill is None or fill.fill_type != "solid":
+        return None
+    color = fill.fgColor.rgb if fill.fgColor is not None and fill.fgColor.type == "rgb" else None
+    if not isinstance(color, str) or len(color) < 6:
+        return None
+    red, green, blue = (int(color[-6:][i:i + 2], 16) for i in (0, 2, 4))
+    gray = round(0.299 * red + 0.587 * green + 0.114 * blue)
+    return gray if gray < 255 else None
+
+
+def column_width_points(sheet, column):
+    """
+    Width of a column in points. Excel measures widths in characters of the
+    default font (7 pixels wide plus 5 pixels of padding at 96 DPI).
+    """
+    dimension = sheet.column_dimensions.get(get_column_letter(column))
+    width = dimension.width if dimension is not None and dimension.width else sheet.sheet_format.defaultColWidth
+    if not width:
+        width = (sheet.sheet_format.baseColWidth or 8) + 0.71
+    return (int(width * 7) + 5) * 0.75
+
+
+def row_height_points(sheet, row):
+    dimension = sheet.row_dimensions.get(row)
+    if dimension is not None and dimension.height:
+        return dimension.height
+    return sheet.sheet_format.defaultRowHeight or 15
+
+
+class RouteSheetRenderer:
+    """
+    The route sheet template's print area, laid out once as a page image.
+
+    Fills, borders and every cell that does not change between route sheets
+    are drawn into the base page when the template is loaded. Rendering a
+    route sheet copies the base page and draws only the cells filled in from
+    the receipt data and the formula cells.
+    """
+
+    def __init__(self, template_path=TEMPLATE_PATH, print_area=PRINT_AREA, dpi=PDF_DPI, page_size=PAGE_SIZE):
+        sheet = load_workbook(template_path).active
+        min_col, min_row, max_col, max_row = range_boundaries(print_area)
+        self.dpi = dpi
+        self.page_size = page_size
+        self.size = (round(page_size[0] * dpi), round(page_size[1] * dpi))
+
+        # Fit the print area to one page inside the template's margins, never enlarging it
+        widths = [column_width_points(sheet, column) for column in range(min_col, max_col + 1)]
+        heights = [row_height_points(sheet, row) for row in range(min_row, max_row + 1)]
+        margins = sheet.page_margins
+        printable_width = (page_size[0] - margins.left - margins.right) * 72
+        printable_height = (page_size[1] - margins.top - margins.bottom) * 72
+        scale = min(1.0, printable_width / sum(widths), printable_height / sum(heights))
+        # Pixels per point of the sheet
+        self.scale = scale * dpi / 72
+        self.columns = {min_col: margins.left * dpi}
+        for column, width in zip(range(min_col, max_col + 1), widths):
+            self.columns[column + 1] = self.columns[column] + width * self.scale
+        self.rows = {min_row: margins.top * dpi}
+        for row, height in zip(range(min_row, max_row + 1), heights):
+            self.rows[row + 1] = self.rows[row] + height * self.scale
+
+        # Merged ranges within the print area, by their top-left cell
+        merged = {}
+        covered = {}
+        for cell_range in sheet.merged_cells.ranges:
+            bounds = (cell_range.min_col, cell_range.min_row, cell_range.max_col, cell_range.max_row)
+            if bounds[0] < min_col or bounds[1] < min_row or bounds[2] > max_col or bounds[3] > max_row:
+                continue
+            merged[(bounds[0], bounds[1])] = bounds
+            for row in range(bounds[1], bounds[3] + 1):
+                for column in range(bounds[0], bounds[2] + 1):
+                    covered[(column, row)] = bounds
+
+        self.values = {}
+        self.cells = {}
+        fills = []
+        borders = []
+        for row in range(min_row, max_row + 1):
+            for column in range(min_col, max_col + 1):
+                cell = sheet.cell(row=row, column=column)
+                bounds = covered.get((column, row), (column, row, column, row))
+                borders.extend(self._border_lines(cell.border, column, row, bounds))
+                if (column, row) in covered and (column, row) not in merged:
+                    continue
+                ref = cell.coordinate
+                gray = fill_gray(cell.fill)
+                if gray is not None:
+                    fills.append((self._box(bounds), gray))
+                if cell.value is not None:
+                    self.values[ref] = cell.value
+                self.cells[ref] = {
+                    "box": self._box(bounds),
+                    "size": cell.font.sz or 11,
+                    "bold": bool(cell.font.b),
+                    "horizontal": cell.alignment.horizontal,
+                    "vertical": cell.alignment.vertical or "bottom",
+                    "wrap": bool(cell.alignment.wrap_text),
+                    "number_format": cell.number_format or "General",
+                }
+
+        # Cells drawn per route sheet: those filled in from the receipt and the formulas
+        filled = set(HEADER_CELLS) | set(PRICE_CELLS.values())
+        self.dynamic_cells = [
+            ref for ref in self.cells
+            if ref in filled or (isinstance(self.values.get(ref), str) and self.values[ref].startswith("="))
+        ]
+
+        # Fills are dithered, like a monochrome printer does; lines and text stay sharp
+        base = Image.new("L", self.size, 255)
+        draw = ImageDraw.Draw(base)
+        for box, gray in fills:
+            draw.rectangle(box, fill=gray)
+        base = base.convert("1")
+        draw = ImageDraw.Draw(base)
+        for box in borders:
+            draw.rectangle(box, fill=0)
+        for ref, value in self.values.items():
+            if ref not in self.dynamic_cells:
+                self._draw_cell(draw, ref, value)
+        self.base = base
+
+        # Rows of the page the per-sheet cells fall in
+        boxes = [self.cells[ref]["box"] for ref in self.dynamic_cells]
+        self.band = (
+            (int(min(box[1] for box in boxes)), int(max(box[3] for box in boxes)) + 1) if boxes else (0, 0)
+        )
+
+    def _box(self, bounds):
+        min_col, min_row, max_col, max_row = bounds
+        return (self.columns[min_col], self.rows[min_row], self.columns[max_col + 1], self.rows[max_row + 1])
+
+    def _border_lines(self, border, column, row, bounds):
+        """
+        Return the rectangles of a cell's border lines. Sides inside a merged
+        range are not drawn, as in Excel.
+        """
+        left, top, right, bottom = self._box((column, row, column, row))
+        lines = []
+        for side, on_edge in (
+            ("left", column == bounds[0]), ("right", column == bounds[2]),
+            ("top", row == bounds[1]), ("bottom", row == bounds[3]),
+        ):
+            style = getattr(border, side).style if border is not None else None
+            if not style or not on_edge:
+                continue
+            half = max(1.0, BORDER_WIDTHS.get(style, DEFAULT_BORDER_WIDTH) * self.scale) / 2
+            if side == "left":
+                lines.append((left - half, top - half, left + half, bottom + half))
+            elif side == "right":
+                lines.append((right - half, top - half, right + half, bottom + half))
+            elif side == "top":
+                lines.append((left - half, top - half, right + half, top + half))
+            else:
+                lines.append((left - half, bottom - half, right + half, bottom + half))
+        return lines
+
+    def _draw_cell(self, draw, ref, value, offset=0):
+        cell = self.cells[ref]
+        left, top, right, bottom = cell["box"]
+        top -= offset
+        bottom -= offset
+        padding = CELL_PADDING * self.scale
+        size = max(1, round(cell["size"] * self.scale))
+        font = load_font(size, cell["bold"])
+        currency, text = format_cell(value, cell["number_format"])
+        if not text:
+            return
+        horizontal = cell["horizontal"]
+        if horizontal in ("center", "centerContinuous", "distributed", "justify"):
+            anchor, x = "m", (left + right) / 2
+        elif horizontal == "right" or (horizontal is None and (currency or isinstance(value, (int, float)))):
+            anchor, x = "r", right - padding
+        else:
+            anchor, x = "l", left + padding
+
+        if text == CHECKBOX:
+            side = size * 0.7
+            center_y = self._line_centers(cell, top, bottom, size, 1)[0]
+            box_left = {"l": x, "m": x - side / 2, "r": x - side}[anchor]
+            draw.rectangle(
+                (box_left, center_y - side / 2, box_left + side, center_y + side / 2),
+                outline=0, width=max(1, round(0.75 * self.scale)),
+            )
+            return
+
+        width = right - left - 2 * padding
+        if cell["wrap"]:
+            lines = wrap_text(text, font, width)
+            # Shrink until the lines fit the cell's height and width
+            while size > 1 and (
+                len(lines) * size * LINE_SPACING > bottom - top
+                or max(font.getlength(line) for line in lines) > width
+            ):
+                size -= 1
+                font = load_font(size, cell["bold"])
+                lines = wrap_text(text, font, width)
+        else:
+            lines = [text]
+            # Fonts other than the template's are wider; shrink rather than overflow
+            text_width = draw.textlength(text, font=font) + (draw.textlength(currency + " ", font=font) if currency else 0)
+            if text_width > width > 0:
+                size = max(1, int(size * width / text_width))
+                font = load_font(size, cell["bold"])
+        centers = self._line_centers(cell, top, bottom, size, len(lines))
+        for line, center_y in zip(lines, centers):
+            draw.text((x, center_y), line, font=font, fill=0, anchor=anchor + "m")
+        if currency:
+            draw.text((left + padding, centers[0]), currency, font=font, fill=0, anchor="lm")
+
+    def _line_centers(self, cell, top, bottom, size, count):
+        padding = CELL_PADDING * self.scale
+        line_height = size * LINE_SPACING
+        block = line_height * count
+        if cell["vertical"] == "top":
+            start = top + padding
+        elif cell["vertical"] == "center":
+            start = (top + bottom - block) / 2
+        else:
+            start = bottom - padding - block
+        return [start + line_height * (index + 0.5) for index in range(count)]
+
+    def render_band(self, data):
+        """
+        Return an image (mode "1") of the rows in ``band`` holding only the
+        cells that change per route sheet, in black on white, for one
+        receipt.
+        """
+        values = dict(self.values)
+        values.update(route_sheet_values(data))
+        formulas = FormulaEvaluator(values)
+        top, bottom = self.band
+        band = Image.new("1", (self.size[0], bottom - top), 1)
+        draw = ImageDraw.Draw(band)
+        for ref in self.dynamic_cells:
+            self._draw_cell(draw, ref, formulas.display_value(ref), offset=top)
+        return band
+
+    def render(self, data):
+        """
+        Return the whole page image (mode "1") of the route sheet for one
+        receipt.
+        """
+        page = self.base.copy()
+        top, bottom = self.band
+        # A pixel is black if it is black on the base page or on the band
+        region = page.crop((0, top, self.size[0], bottom))
+        page.paste(ImageChops.logical_and(region, self.render_band(data)), (0, top))
+        return page
+
+
+def wrap_text(text, font, width):
+    """
+    Break ``text`` into lines that fit ``width`` pixels, at spaces.
+    """
+    lines = []
+    for paragraph in str(text).split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if line and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+@lru_cache(maxsize=None)
+def get_route_sheet_renderer(template_path=TEMPLATE_PATH):
+    """
+    Return the route sheet renderer, laying out the template once per process.
+    """
+    logging.info(f"Laying out route sheet template {template_path} for PDF output.")
+    return RouteSheetRenderer(template_path)
+
+
+class RouteSheetPdfWriter:
+    """
+    Write route sheets into one multi-page PDF, one page per receipt.
+
+    The parts of the route sheet that never change are written once, as one
+    image every page shows; each page adds only a stencil mask of its
+    filled-in cells (see ``RouteSheetRenderer.render_band``). Pages are
+    compressed and written as soon as they are added, so memory use does not
+    grow with the batch; the page tree and cross-reference table are
+    written by ``close()``. Images are 1-bit and Flate-compressed, which
+    every printer and PDF viewer handles.
+    """
+
+    def __init__(self, output_path, template_path=TEMPLATE_PATH):
+        self.output_path = output_path
+        self.renderer = get_route_sheet_renderer(template_path)
+        self.page_count = 0
+        # Objects 1 and 2 (catalog and page tree) are written last
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 3
+        self._base_id = None
+        self._file = open(output_path, "wb")
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _object(self, content, object_id=None, stream=None):
+        if object_id is None:
+            object_id = self._next_id
+            self._next_id += 1
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode("ascii") + content)
+        if stream is not None:
+            self._file.write(b"\nstream\n" + stream + b"\nendstream")
+        self._file.write(b"\nendobj\n")
+        return object_id
+
+    def _image(self, image, mask=False):
+        """
+        Write a 1-bit image; a mask paints its black pixels only.
+        """
+        width, height = image.size
+        pixels = zlib.compress(image.tobytes(), 6)
+        kind = "/ImageMask true" if mask else "/ColorSpace /DeviceGray"
+        return self._object(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} {kind} "
+            f"/BitsPerComponent 1 /Filter /FlateDecode /Length {len(pixels)} >>".encode("ascii"),
+            stream=pixels,
+        )
+
+    def add(self, data):
+        """
+        Add the route sheet page of one receipt.
+        """
+        renderer = self.renderer
+        if self._base_id is None:
+            self._base_id = self._image(renderer.base)
+        band_id = self._image(renderer.render_band(data), mask=True)
+
+        # Page coordinates are in points from the bottom-left corner
+        points = 72 / renderer.dpi
+        page_width, page_height = (round(pixels * points, 2) for pixels in renderer.size)
+        top, bottom = renderer.band
+        band_height = round((bottom - top) * points, 2)
+        band_y = round((renderer.size[1] - bottom) * points, 2)
+        contents = (
+            f"q {page_width} 0 0 {page_height} 0 0 cm /Base Do Q "
+            f"q {page_width} 0 0 {band_height} 0 {band_y} cm /Band Do Q"
+        ).encode("ascii")
+        contents_id = self._object(f"<< /Length {len(contents)} >>".encode("ascii"), stream=contents)
+        self._page_ids.append(self._object(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width} {page_height}] "
+            f"/Resources << /XObject << /Base {self._base_id} 0 R /Band {band_id} 0 R >> >> "
+            f"/Contents {contents_id} 0 R >>".encode("ascii")
+        ))
+        self.page_count += 1
+
+    def close(self):
+        """
+        Write the page tree and cross-reference table and close the file.
+        """
+        if self._file is None:
+            return
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._object(f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("ascii"), 2)
+        self._object(b"<< /Type /Catalog /Pages 2 0 R >>", 1)
+        xref_offset = self._file.tell()
+        entries = ["0000000000 65535 f \n"] + [f"{self._offsets[i]:010d} 00000 n \n" for i in range(1, self._next_id)]
+        self._file.write(f"xref\n0 {self._next_id}\n{''.join(entries)}".encode("ascii"))
+        self._file.write(
+            f"trailer\n<< /Size {self._next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii")
+        )
+        self._file.close()
+        self._file = None
+        logging.info(f"PDF with {self.page_count} route sheet(s) saved to {self.output_path}.")
+
+
+def write_route_sheet_pdf(receipts, output_path, template_path=TEMPLATE_PATH):
+    """
+    Write the route sheets of every receipt into a single PDF.
+    """
+    with RouteSheetPdfWriter(output_path, template_path) as pdf:
+        for data in receipts:
+            pdf.add(data)
+    return output_path
+
+
+def print_pdf(path, printer=None):
+    """
+    Send a PDF to the print spooler as one job: ``lp`` (CUPS) or ``lpr`` on
+    Linux and macOS, the default PDF application's print command on Windows.
+    ``printer`` names the printer (the default printer otherwise; on
+    Windows the default printer is always used).
+    """
+    if sys.platform == "win32":
+        if printer:
+            logging.warning(f"Printing to the default printer; printer '{printer}' cannot be chosen on Windows.")
+        os.startfile(os.path.abspath(path), "print")
+        return
+    if shutil.which("lp"):
+        command = ["lp"] + (["-d", printer] if printer else []) + ["-t", os.path.basename(path), path]
+    elif shutil.which("lpr"):
+        command = ["lpr"] + (["-P", printer] if printer else []) + ["-T", os.path.basename(path), path]
+    else:
+        raise RuntimeError("No print spooler found (lp or lpr).")
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"{command[0]} failed: {e.stderr.strip() or e.returncode}") from e
+    logging.info(f"Sent {path} to the printer.")
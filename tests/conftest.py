@@ -0,0 +1,20 @@
+"""
+Shared test setup.
+
+Importing receipt_processing sets up logging to data/extract_receipt_debug.log.
+Logging is set up here first, to a temporary file, so a test run leaves the
+repository's log alone (``setup_logging`` only runs once per process).
+"""
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+
+sys.path.insert(0, REPO_DIR)
+
+from logging_setup import setup_logging
+
+LOG_DIR = tempfile.TemporaryDirectory()
+setup_logging(os.path.join(LOG_DIR.name, "test.log"))
@@ -0,0 +1,109 @@
+"""
+Duplicate detection on synthetic receipts (see benchmarks/synthetic_receipts.py).
+
+Run from the repository root:
+
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+from duplicates import DuplicateDetector, DuplicateReceiptError
+from receipt_processing import parse_receipt_text
+from record_store import RecordStore
+from synthetic_receipts import receipt_lines, render_receipt
+
+
+def template_receipt(youth, tx_number, check_number):
+    """
+    Return the lines of a Troop 965 receipt for ``youth`` renewals. Every
+    receipt has the same charter, date and cashier, so receipts differ only
+    in their counts, amounts, TX# and check number.
+    """
+    truth = {
+        "district_name": "Tri-Star",
+        "local_unit_number": "965",
+        "unit_type": "Troop",
+        "line_items": [("Youth Renewal", youth)],
+    }
+    lines = []
+    for text, amount in receipt_lines(truth, random.Random(1)):
+        if text.startswith("TX#"):
+            text = f"TX# {tx_number}"
+        elif text.startswith("Check #"):
+            text = f"Check #{check_number}"
+        lines.append((text, amount))
+    return lines
+
+
+def scan(lines, dpi=200, **distortion):
+    return render_receipt(lines, dpi, np_rng=np.random.default_rng(0), **distortion)
+
+
+def receipt_text(lines):
+    return "\n".join(f"{text} {amount}" if amount else text for text, amount in lines)
+
+
+@pytest.fixture
+def detector(tmp_path):
+    store = RecordStore(str(tmp_path / "receipts.sqlite3"))
+    yield DuplicateDetector(store)
+    store.close()
+
+
+def process(detector, content_hash, file_path, lines, image):
+    """
+    Check and store a receipt the way ``extract_receipt_text_to_json`` does,
+    with the receipt's own text standing in for OCR. Returns the look-alike
+    candidates found before OCR.
+    """
+    image_hash, candidates = detector.hash_image(image, file_path, content_hash)
+    data = parse_receipt_text(receipt_text(lines))
+    detector.check_record(data, file_path, content_hash, candidates)
+    detector.store.add(content_hash, data, receipt_text(lines), file_path)
+    detector.add_image(content_hash, image_hash, file_path)
+    return candidates
+
+
+def test_same_template_with_different_counts_is_not_duplicate(detector):
+    first = template_receipt(1, 10178, 6031)
+    second = template_receipt(2, 10242, 6077)
+    process(detector, "first", "first.png", first, scan(first))
+
+    # The pages look alike, closer even than two scans of one receipt...
+    candidates = process(detector, "second", "second.png", second, scan(second))
+    assert [candidate[0] for candidate in candidates] == ["first"]
+    # ...but both receipts are kept
+    assert len(detector.store) == 2
+
+
+def test_rescan_is_duplicate(detector):
+    lines = template_receipt(1, 10178, 6031)
+    process(detector, "scan", "scan.png", lines, scan(lines))
+
+    with pytest.raises(DuplicateReceiptError) as error:
+        process(detector, "rescan", "rescan.png", lines, scan(lines, 300, skew=1.5, noise=8.0, blur=0.5))
+    assert error.value.duplicate_of == "scan.png"
+    assert len(detector.store) == 1
+
+
+def test_rescan_matching_only_by_tx_number_is_duplicate(detector):
+    lines = template_receipt(1, 10178, 6031)
+    process(detector, "scan", "scan.png", lines, scan(lines))
+
+    # OCR of the re-scan missed the check number and the customer line: one
+    # identifier is enough for a receipt that looks the same
+    read = [(text, amount) for text, amount in lines if not text.startswith(("Check #", "Customer:"))]
+    with pytest.raises(DuplicateReceiptError) as error:
+        process(detector, "rescan", "rescan.png", read, scan(lines, 300, skew=1.5, noise=8.0, blur=0.5))
+    assert "same image and TX#" in error.value.reason